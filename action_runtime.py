@@ -0,0 +1,929 @@
+"""action_runtime.py - execute-time plumbing shared by manage_log.py and manage_context.py.
+
+Each script builds one ActionRuntime with its own file paths, deadline actions
+and message language. The runtime also holds the per-call state: the running
+action, its deadline and the active profile. It covers:
+
+- per-action deadlines enforced through the SQLite progress handler
+- the slow-query log and the timed / profiling connection classes
+- --profile phase timing, SQL tracing and cProfile rows
+- per-action latency histograms (action_metrics) behind metrics.summary
+- file logging through a queue listener with gzip-compressed rotation
+- the execute output formats (json / pretty / compact / ndjson)
+"""
+from __future__ import annotations
+
+import atexit
+import contextlib
+import copy
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import logging.handlers
+import math
+import os
+import queue
+import random
+import shutil
+import sqlite3
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+PROCESS_START = time.perf_counter()
+
+PROFILE_SQL_MAX_LEN = 500        # longest SQL text kept in _profile
+PROFILE_MAX_STATEMENTS = 500     # statements past this are only counted and timed
+PROFILE_DEFAULT_CPROFILE_TOP = 20
+METRICS_BUCKET_SECONDS = 3600
+METRICS_LATENCY_STEPS = 4          # histogram buckets per doubling (~19% wide)
+METRICS_MIN_LATENCY_BUCKET = -16   # everything under 2^(-16/4) = 0.0625ms shares one bucket
+METRICS_RETENTION_DAYS = 90
+METRICS_PRUNE_PROBABILITY = 0.01
+METRICS_SUMMARY_DEFAULT_HOURS = 24
+DEADLINE_PROGRESS_OPS = 1000  # VM instructions between progress handler calls
+SLOW_QUERY_LOG_MAX_BYTES = 1_000_000
+SLOW_QUERY_LOG_BACKUPS = 3
+SLOW_QUERY_SQL_MAX_LEN = 2000
+COMPACT_SEPARATORS = (',', ':')
+
+MESSAGES: Dict[str, Dict[str, str]] = {
+    'en': {
+        'deadline_ms_invalid': 'deadline_ms must be an integer',
+        'deadline_exceeded': '{action} exceeded its {deadline_ms}ms deadline and was interrupted',
+        'action_failed_log': 'Action {action} failed',
+        'action_failed': '{error}',
+        'slow_query_log_failed': 'Failed to write slow query log: {error}',
+        'metrics_failed': 'Failed to record metrics for {action}: {error}',
+        'format_invalid': 'format must be one of: {formats}',
+        'metrics_time_invalid': '{name} must be YYYY-MM-DD or an ISO timestamp',
+        'metrics_by_invalid': "by must be 'hour' or 'day'",
+    },
+    'ja': {
+        'deadline_ms_invalid': 'deadline_ms は整数で指定してください。',
+        'deadline_exceeded': "アクション '{action}' が制限時間 {deadline_ms}ms を超えたため中断しました。",
+        'action_failed_log': 'ハンドル実行中に予期せぬエラー: {error}',
+        'action_failed': '処理中にエラーが発生しました: {error}',
+        'slow_query_log_failed': 'slow query ログの書き込みに失敗しました: {error}',
+        'metrics_failed': 'メトリクスの記録に失敗しました: {error}',
+        'format_invalid': 'formatは {formats} のいずれかを指定してください。',
+        'metrics_time_invalid': '{name} は YYYY-MM-DD または ISO 形式の日時で指定してください。',
+        'metrics_by_invalid': "by は 'hour' または 'day' で指定してください。",
+    },
+}
+
+
+class ActionRuntime:
+    """Settings and per-call state for one script.
+
+    Output formats are listed with the default first. Settings read from the
+    environment (log rotation, deadline, slow-query threshold, metrics file)
+    stay in the scripts, which pass the values in.
+    """
+
+    def __init__(self, logger: logging.Logger, *, log_path: str, log_max_bytes: int, log_backups: int,
+                 log_rotation: str, log_format: str, metrics_db_path: str, deadline_default_ms: int,
+                 deadline_actions: Iterable[str], slow_query_ms: float, slow_query_log_path: str,
+                 output_formats: Tuple[str, ...], tz: Optional[datetime.tzinfo], lang: str = 'en') -> None:
+        self.logger = logger
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self.log_backups = log_backups
+        self.log_rotation = log_rotation
+        self.log_format = log_format
+        self.metrics_db_path = metrics_db_path
+        self.deadline_default_ms = deadline_default_ms
+        self.deadline_actions = frozenset(deadline_actions)
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_log_path = slow_query_log_path
+        self.output_formats = output_formats
+        self.tz = tz or datetime.timezone.utc
+        self.messages = MESSAGES[lang]
+
+        self.current_action: Optional[str] = None
+        self.current_params_hash: Optional[str] = None
+        self.deadline: Optional[float] = None  # time.perf_counter() based
+        self.deadline_ms: Optional[int] = None
+        self.deadline_hit = False
+        self.active_profile: Optional[ActionProfile] = None
+        self._slow_query_logger: Optional[logging.Logger] = None
+        self._log_listener: Optional[logging.handlers.QueueListener] = None
+        atexit.register(self.stop_logging)
+
+    def message(self, key: str, **values: Any) -> str:
+        return self.messages[key].format(**values)
+
+    # -- connections ---------------------------------------------------------
+
+    def connect(self, path: str, **kwargs: Any) -> sqlite3.Connection:
+        """Open a connection that logs slow statements, is traced while profiling and honours the deadline."""
+        if self.active_profile is not None:
+            factory: Any = ProfilingConnection
+        elif self.slow_query_ms > 0:
+            factory = TimedConnection
+        else:
+            factory = sqlite3.Connection
+        conn = sqlite3.connect(path, factory=factory, **kwargs)
+        if isinstance(conn, TimedConnection):
+            conn.runtime = self
+        if self.active_profile is not None:
+            conn.set_trace_callback(self.active_profile.trace)
+        if self.deadline is not None:
+            conn.set_progress_handler(self.deadline_progress, DEADLINE_PROGRESS_OPS)
+        return conn
+
+    # -- deadlines -----------------------------------------------------------
+
+    def resolve_deadline_ms(self, action: str, value: Any = None) -> Optional[int]:
+        """Payload "deadline_ms" wins (<= 0 disables); otherwise read actions get the default."""
+        if value is not None:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(self.message('deadline_ms_invalid'))
+            return value if value > 0 else None
+        if action in self.deadline_actions and self.deadline_default_ms > 0:
+            return self.deadline_default_ms
+        return None
+
+    def begin_action_context(self, action: str, params: Any, deadline_ms: Optional[int] = None) -> None:
+        """Arm the deadline for connections opened from now on and tag slow-query records."""
+        self.current_action = action
+        self.current_params_hash = params_hash(params)
+        self.deadline_ms = deadline_ms
+        self.deadline = time.perf_counter() + deadline_ms / 1000 if deadline_ms else None
+        self.deadline_hit = False
+
+    def deadline_progress(self) -> int:
+        """Progress handler: a non-zero return makes SQLite interrupt the running statement."""
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.deadline_hit = True
+            return 1
+        return 0
+
+    def deadline_error(self, action: str, started: float) -> Dict[str, Any]:
+        return {
+            'status': 'error',
+            'error': 'timeout',
+            'message': self.message('deadline_exceeded', action=action, deadline_ms=self.deadline_ms),
+            'action': action,
+            'deadline_ms': self.deadline_ms,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    # -- slow-query log ------------------------------------------------------
+
+    def get_slow_query_logger(self) -> logging.Logger:
+        """Rotating JSON-lines logger for slow statements; the file is opened on first use."""
+        if self._slow_query_logger is None:
+            slow_logger = logging.getLogger(self.logger.name + '.slow_query')
+            slow_logger.setLevel(logging.INFO)
+            slow_logger.propagate = False
+            slow_logger.handlers.clear()
+            handler = logging.handlers.RotatingFileHandler(
+                self.slow_query_log_path, maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+                backupCount=SLOW_QUERY_LOG_BACKUPS, encoding='utf-8',
+            )
+            handler.namer = gzip_log_name
+            handler.rotator = gzip_rotate_log
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            slow_logger.addHandler(handler)
+            self._slow_query_logger = slow_logger
+        return self._slow_query_logger
+
+    def log_slow_query(self, conn: sqlite3.Connection, sql: str, parameters: Any, elapsed_ms: float,
+                       interrupted: bool = False) -> None:
+        """Write a slow (or interrupted) statement with its EXPLAIN QUERY PLAN as one JSON line."""
+        plan: List[str] = []
+        if parameters is not None:
+            # Run EXPLAIN on a plain cursor with the deadline lifted so it works after an interrupt
+            conn.set_progress_handler(None, 0)
+            try:
+                rows = sqlite3.Cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+                plan = [row[3] for row in rows]
+            except sqlite3.Error:
+                pass
+            finally:
+                if self.deadline is not None:
+                    conn.set_progress_handler(self.deadline_progress, DEADLINE_PROGRESS_OPS)
+        record = {
+            'ts': datetime.datetime.now(self.tz).isoformat(timespec='milliseconds'),
+            'action': self.current_action,
+            'params_hash': self.current_params_hash,
+            'ms': round(elapsed_ms, 3),
+            'interrupted': interrupted,
+            'sql': ' '.join(sql.split())[:SLOW_QUERY_SQL_MAX_LEN],
+            'plan': plan,
+        }
+        try:
+            self.get_slow_query_logger().info(json.dumps(record, ensure_ascii=False))
+        except OSError as exc:
+            self.logger.warning(self.message('slow_query_log_failed', error=exc))
+
+    # -- profiling -----------------------------------------------------------
+
+    def activate_profile(self, profile: Optional[ActionProfile]) -> None:
+        """Trace SQL on connections opened from now on (None turns it off)."""
+        self.active_profile = profile
+
+    # -- metrics -------------------------------------------------------------
+
+    def get_metrics_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.metrics_db_path, timeout=1.0)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS action_metrics (
+                action TEXT NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                latency_bucket INTEGER NOT NULL,
+                calls INTEGER NOT NULL,
+                errors INTEGER NOT NULL,
+                total_ms REAL NOT NULL,
+                max_ms REAL NOT NULL,
+                result_bytes INTEGER NOT NULL,
+                result_rows INTEGER NOT NULL,
+                PRIMARY KEY (action, bucket_start, latency_bucket)
+            ) WITHOUT ROWID
+            """
+        )
+        return conn
+
+    def record_action_metrics(self, action: str, duration_ms: float, result_bytes: int, result_rows: int,
+                              error: bool) -> None:
+        """Add one execute call to the (action, hour, latency bucket) histogram.
+
+        Failures are logged and swallowed so metrics can never break an action.
+        """
+        if not self.metrics_db_path:
+            return
+        now = int(time.time())
+        try:
+            with contextlib.closing(self.get_metrics_connection()) as conn, conn:
+                conn.execute(
+                    """
+                    INSERT INTO action_metrics (
+                        action, bucket_start, latency_bucket, calls, errors, total_ms, max_ms, result_bytes, result_rows
+                    ) VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+                    ON CONFLICT(action, bucket_start, latency_bucket) DO UPDATE SET
+                        calls = calls + 1,
+                        errors = errors + excluded.errors,
+                        total_ms = total_ms + excluded.total_ms,
+                        max_ms = MAX(max_ms, excluded.max_ms),
+                        result_bytes = result_bytes + excluded.result_bytes,
+                        result_rows = result_rows + excluded.result_rows
+                    """,
+                    (action, now - now % METRICS_BUCKET_SECONDS, latency_bucket(duration_ms), 1 if error else 0,
+                     duration_ms, duration_ms, result_bytes, result_rows),
+                )
+                if random.random() < METRICS_PRUNE_PROBABILITY:
+                    conn.execute(
+                        "DELETE FROM action_metrics WHERE bucket_start < ?",
+                        (now - METRICS_RETENTION_DAYS * 86400,),
+                    )
+        except sqlite3.Error as exc:
+            self.logger.warning(self.message('metrics_failed', action=action, error=exc))
+
+    def parse_metrics_time(self, value: Any, name: str) -> int:
+        """'YYYY-MM-DD' or an ISO timestamp (no offset means the script's time zone) as epoch seconds."""
+        try:
+            moment = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(self.message('metrics_time_invalid', name=name))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=self.tz)
+        return int(moment.timestamp())
+
+    def metrics_summary(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-action call counts, error rate and latency percentiles over a time window.
+
+        Params: ``hours`` (default 24) or ``from``/``to``, optional ``action`` and
+        ``by`` ('hour' | 'day') for a trend series. Percentiles are bucket upper
+        bounds, so they read up to ~19% high.
+        """
+        now = int(time.time())
+        end = self.parse_metrics_time(params['to'], 'to') if params.get('to') else now + 1
+        if params.get('from'):
+            start = self.parse_metrics_time(params['from'], 'from')
+        else:
+            start = end - int(float(params.get('hours') or METRICS_SUMMARY_DEFAULT_HOURS) * 3600)
+        by = params.get('by')
+        if by not in (None, 'hour', 'day'):
+            raise ValueError(self.message('metrics_by_invalid'))
+
+        where = 'bucket_start >= ? AND bucket_start < ?'
+        args: List[Any] = [start - start % METRICS_BUCKET_SECONDS, end]
+        if params.get('action'):
+            where += ' AND action = ?'
+            args.append(params['action'])
+        rows: List[Tuple[Any, ...]] = []
+        if self.metrics_db_path and os.path.exists(self.metrics_db_path):
+            with contextlib.closing(self.get_metrics_connection()) as conn:
+                rows = conn.execute(
+                    f"""
+                    SELECT action, bucket_start, latency_bucket, calls, errors, total_ms, max_ms,
+                           result_bytes, result_rows
+                    FROM action_metrics WHERE {where}
+                    """,
+                    args,
+                ).fetchall()
+
+        per_action: Dict[str, List[Tuple[Any, ...]]] = {}
+        per_period: Dict[str, Dict[str, List[Tuple[Any, ...]]]] = {}
+        for action, bucket_start, *hist in rows:
+            per_action.setdefault(action, []).append(tuple(hist))
+            if by:
+                moment = datetime.datetime.fromtimestamp(bucket_start, self.tz)
+                period = moment.date().isoformat() if by == 'day' else moment.isoformat(timespec='minutes')
+                per_period.setdefault(action, {}).setdefault(period, []).append(tuple(hist))
+
+        actions = []
+        for action, hist_rows in per_action.items():
+            item: Dict[str, Any] = {'action': action, **summarize_histogram(hist_rows)}
+            if by:
+                item['series'] = [
+                    {'period': period, **summarize_histogram(period_rows)}
+                    for period, period_rows in sorted(per_period[action].items())
+                ]
+            actions.append(item)
+        actions.sort(key=lambda item: (-item['calls'], item['action']))
+        return {
+            'from': datetime.datetime.fromtimestamp(start, self.tz).isoformat(timespec='seconds'),
+            'to': datetime.datetime.fromtimestamp(end, self.tz).isoformat(timespec='seconds'),
+            'total_calls': sum(item['calls'] for item in actions),
+            'actions': actions,
+        }
+
+    # -- logging -------------------------------------------------------------
+
+    def setup_logging(self, api_mode: bool = False) -> None:
+        """Route file logging through a QueueHandler so callers never block on file I/O.
+
+        A QueueListener thread writes to the size- (or daily-) rotated log file
+        and gzips the rotated files. Outside API mode messages also go to stderr.
+        """
+        self.logger.setLevel(logging.INFO)
+        if self.logger.hasHandlers():
+            self.logger.handlers.clear()
+        if self._log_listener is not None:
+            self._log_listener.stop()
+            self._log_listener = None
+
+        log_queue: 'queue.SimpleQueue[logging.LogRecord]' = queue.SimpleQueue()
+        self.logger.addHandler(LogQueueHandler(log_queue, self))
+        self._log_listener = logging.handlers.QueueListener(log_queue, self.build_log_file_handler())
+        self._log_listener.start()
+
+        if not api_mode:
+            stream_handler = logging.StreamHandler(sys.stderr)
+            stream_handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(stream_handler)
+
+    def stop_logging(self) -> None:
+        """Drain queued records and close the log file (runs automatically at exit)."""
+        if self._log_listener is not None:
+            self._log_listener.stop()
+            for handler in self._log_listener.handlers:
+                handler.close()
+            self._log_listener = None
+
+    def build_log_file_handler(self) -> logging.Handler:
+        handler: logging.handlers.BaseRotatingHandler
+        if self.log_rotation == 'daily':
+            handler = logging.handlers.TimedRotatingFileHandler(
+                self.log_path, when='midnight', backupCount=self.log_backups, encoding='utf-8', delay=True,
+            )
+        else:
+            handler = logging.handlers.RotatingFileHandler(
+                self.log_path, maxBytes=self.log_max_bytes, backupCount=self.log_backups,
+                encoding='utf-8', delay=True,
+            )
+        handler.namer = gzip_log_name
+        handler.rotator = gzip_rotate_log
+        if self.log_format == 'json':
+            handler.setFormatter(JsonLogFormatter(self.tz))
+        else:
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        return handler
+
+    # -- execute -------------------------------------------------------------
+
+    def parse_output_format(self, value: Any) -> str:
+        """Validate the envelope's "format"; unset means the first (default) format."""
+        if value is None or value == '':
+            return self.output_formats[0]
+        output_format = str(value).lower()
+        if output_format not in self.output_formats:
+            raise ValueError(self.message('format_invalid', formats=' / '.join(self.output_formats)))
+        return output_format
+
+    def action_call(self, profile: Optional[ActionProfile] = None) -> ActionCall:
+        return ActionCall(self, profile)
+
+
+class ActionCall:
+    """Bookkeeping for one execute call.
+
+    begin() arms the deadline and marks the call for metrics; close() (run it in
+    a finally block) records it. A call counts as failed until write() sees a
+    non-error result, so a handler that leaves through SystemExit is still
+    recorded as an error. Profiled calls are not recorded, so tracing overhead
+    never lands in the histograms.
+    """
+
+    def __init__(self, runtime: ActionRuntime, profile: Optional[ActionProfile] = None) -> None:
+        self.runtime = runtime
+        self.profile = profile
+        self.action: Optional[str] = None
+        self.record = False
+        self.started = time.perf_counter()
+        self.output_bytes = 0
+        self.result_rows = 0
+        self.failed = True
+
+    def begin(self, action: str, params: Any, deadline_ms: Any = None) -> None:
+        self.action = action
+        self.record = self.profile is None
+        self.runtime.begin_action_context(action, params, self.runtime.resolve_deadline_ms(action, deadline_ms))
+        self.started = time.perf_counter()
+
+    def run(self, handler: Callable[..., Any], *args: Any) -> Any:
+        result = self.profile.run_handler(handler, *args) if self.profile else handler(*args)
+        if self.runtime.deadline_hit:
+            # A handler that swallowed the interrupt must not return partial data as success
+            raise sqlite3.OperationalError('interrupted')
+        return result
+
+    def write(self, result: Any, output_format: str) -> None:
+        """Write the result to stdout, with _profile attached when profiling."""
+        if self.profile:
+            with self.profile.phase('serialization'):
+                for _ in iter_output_lines(result, output_format):
+                    pass
+            result = attach_profile(result, self.profile)
+        self.output_bytes = write_output(result, output_format) if result is not None else 0
+        self.result_rows = count_result_rows(result)
+        self.failed = isinstance(result, dict) and result.get('status') == 'error'
+
+    def write_error(self, exc: BaseException, output_format: str) -> None:
+        """Log the failure and write it as an error object (a timeout when the deadline fired)."""
+        runtime = self.runtime
+        if runtime.deadline_hit:
+            runtime.logger.warning(runtime.message('deadline_exceeded', action=self.action,
+                                                   deadline_ms=runtime.deadline_ms))
+            error = runtime.deadline_error(self.action or '', self.started)
+        else:
+            runtime.logger.error(runtime.message('action_failed_log', action=self.action, error=exc), exc_info=True)
+            error = {'status': 'error', 'message': runtime.message('action_failed', error=exc)}
+        if self.profile:
+            error = attach_profile(error, self.profile)
+        self.failed = True
+        self.output_bytes = write_output(error, 'compact' if output_format == 'ndjson' else output_format)
+
+    def close(self) -> None:
+        if self.record and self.action:
+            self.runtime.record_action_metrics(self.action, (time.perf_counter() - self.started) * 1000,
+                                               self.output_bytes, self.result_rows, self.failed)
+
+
+def params_hash(params: Any) -> str:
+    """Short hash of the canonical params JSON (groups slow-query records of the same call)."""
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+# ---------------------------------------------------------------------------
+# Connections
+# ---------------------------------------------------------------------------
+
+class TimedCursor(sqlite3.Cursor):
+    """Times each statement (execute + fetch) and logs it once it crosses the slow-query threshold."""
+
+    _sql: Optional[str] = None
+    _parameters: Any = None
+    _elapsed_ms = 0.0
+    _slow_logged = False
+
+    def _timed(self, method: Callable[..., Any], *args: Any) -> Any:
+        runtime = self.connection.runtime
+        start = time.perf_counter()
+        interrupted = False
+        try:
+            return method(*args)
+        except sqlite3.OperationalError:
+            interrupted = runtime.deadline_hit
+            raise
+        finally:
+            self._elapsed_ms += (time.perf_counter() - start) * 1000
+            if (interrupted or (runtime.slow_query_ms > 0 and self._elapsed_ms >= runtime.slow_query_ms)) \
+                    and self._sql and not self._slow_logged:
+                self._slow_logged = True
+                runtime.log_slow_query(self.connection, self._sql, self._parameters, self._elapsed_ms, interrupted)
+
+    def execute(self, sql: str, parameters: Any = ()) -> Any:
+        self._sql, self._parameters, self._elapsed_ms, self._slow_logged = sql, parameters, 0.0, False
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any) -> Any:
+        # No single parameter set to EXPLAIN with, so executemany is logged without a plan
+        self._sql, self._parameters, self._elapsed_ms, self._slow_logged = sql, None, 0.0, False
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self) -> Any:
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size: Optional[int] = None) -> Any:
+        return self._timed(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self) -> Any:
+        return self._timed(super().fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors are timed; ActionRuntime.connect() sets ``runtime``."""
+
+    runtime: ActionRuntime
+
+    def cursor(self, factory: Any = TimedCursor) -> Any:
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters: Any = ()) -> Any:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any) -> Any:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ProfilingCursor(TimedCursor):
+    """Cursor used only while profiling; attributes elapsed time and fetched rows to traced SQL."""
+
+    _profile_entry: Optional[Dict[str, Any]] = None
+
+    def _run(self, method: Callable[..., Any], *args: Any) -> Any:
+        profile = self.connection.runtime.active_profile
+        mark = len(profile.statements) if profile else 0
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if profile is not None:
+                self._profile_entry = profile.claim(mark, (time.perf_counter() - start) * 1000, self.rowcount)
+
+    def execute(self, sql: str, parameters: Any = ()) -> Any:
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any) -> Any:
+        return self._run(super().executemany, sql, seq_of_parameters)
+
+    def _fetch(self, method: Callable[..., Any], *args: Any) -> Any:
+        start = time.perf_counter()
+        rows = method(*args)
+        entry = self._profile_entry
+        if entry is not None:
+            entry['ms'] += (time.perf_counter() - start) * 1000
+            if isinstance(rows, list):
+                entry['rows'] += len(rows)
+            elif rows is not None:
+                entry['rows'] += 1
+        return rows
+
+    def fetchone(self) -> Any:
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size: Optional[int] = None) -> Any:
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self) -> Any:
+        return self._fetch(super().fetchall)
+
+    def __next__(self) -> Any:
+        row = self._fetch(super().fetchone)
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class ProfilingConnection(TimedConnection):
+    def cursor(self, factory: Any = ProfilingCursor) -> Any:
+        return super().cursor(factory)
+
+
+# ---------------------------------------------------------------------------
+# Profiling (--profile / "profile": true)
+# ---------------------------------------------------------------------------
+
+class ActionProfile:
+    """Per-phase wall time, traced SQL and optional cProfile rows for one execute call.
+
+    Statements are captured with set_trace_callback, so trigger bodies and
+    executescript() show up too; statements run through a cursor also carry
+    their duration (execute + fetch) and row count.
+    """
+
+    def __init__(self, cprofile_top: int = 0) -> None:
+        self.phases: Dict[str, float] = {}
+        self.statements: List[Dict[str, Any]] = []
+        self.statement_count = 0
+        self.dropped_ms = 0.0
+        self.current_phase = 'startup'
+        self.cprofile_top = cprofile_top
+        self.cprofile_rows: Optional[List[Dict[str, Any]]] = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        previous, self.current_phase = self.current_phase, name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current_phase = previous
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def mark_startup(self) -> None:
+        """Record the time from process start to now as the startup phase."""
+        self.phases['startup'] = (time.perf_counter() - PROCESS_START) * 1000
+
+    def trace(self, sql: str) -> None:
+        self.statement_count += 1
+        if len(self.statements) < PROFILE_MAX_STATEMENTS:
+            self.statements.append({
+                'phase': self.current_phase,
+                'sql': ' '.join(sql.split())[:PROFILE_SQL_MAX_LEN],
+                'ms': None,
+                'rows': None,
+            })
+
+    def claim(self, mark: int, elapsed_ms: float, rowcount: int) -> Optional[Dict[str, Any]]:
+        """Return the trace entry for the statement a cursor just ran (skipping implicit BEGIN)."""
+        entry = next((e for e in self.statements[mark:] if e['sql'] != 'BEGIN'), None)
+        if entry is None:
+            self.dropped_ms += elapsed_ms
+            return None
+        entry['ms'] = elapsed_ms
+        entry['rows'] = rowcount if rowcount >= 0 else 0
+        return entry
+
+    def run_handler(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run the handler as the 'handler' phase, under cProfile when cprofile_top > 0."""
+        with self.phase('handler'):
+            if self.cprofile_top <= 0:
+                return func(*args)
+            import cProfile
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(func, *args)
+            finally:
+                self.cprofile_rows = cprofile_top_rows(profiler, self.cprofile_top)
+
+    def to_dict(self) -> Dict[str, Any]:
+        timed = [e['ms'] for e in self.statements if e['ms'] is not None]
+        result: Dict[str, Any] = {
+            'phases_ms': {name: round(ms, 3) for name, ms in self.phases.items()},
+            'total_ms': round((time.perf_counter() - PROCESS_START) * 1000, 3),
+            'sql': {
+                'count': self.statement_count,
+                'timed_ms': round(sum(timed) + self.dropped_ms, 3),
+                'truncated': self.statement_count > len(self.statements),
+                'statements': [
+                    {**e, 'ms': round(e['ms'], 3) if e['ms'] is not None else None} for e in self.statements
+                ],
+            },
+        }
+        if self.cprofile_rows is not None:
+            result['cprofile'] = self.cprofile_rows
+        return result
+
+
+def cprofile_top_rows(profiler: Any, top: int) -> List[Dict[str, Any]]:
+    import pstats
+    stats = pstats.Stats(profiler)
+    stats.sort_stats('cumulative')
+    rows = []
+    for func in stats.fcn_list[:top]:  # type: ignore[attr-defined]
+        primitive_calls, calls, tottime, cumtime, _ = stats.stats[func]  # type: ignore[attr-defined]
+        filename, line, name = func
+        rows.append({
+            'function': f"{os.path.basename(filename)}:{line}({name})" if line else name,
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3),
+        })
+    return rows
+
+
+def parse_profile_option(value: Any) -> Optional[int]:
+    """Map the envelope's "profile" value to a cProfile top-N (0 = no cProfile, None = off).
+
+    Accepts ``true`` or ``{"cprofile_top": N}``.
+    """
+    if value is True:
+        return 0
+    if isinstance(value, dict):
+        top = value.get('cprofile_top', 0)
+        if top is True:
+            top = PROFILE_DEFAULT_CPROFILE_TOP
+        try:
+            return max(0, int(top or 0))
+        except (TypeError, ValueError):
+            return 0
+    return None
+
+
+def pop_profile_flags(argv: List[str]) -> Optional[int]:
+    """Strip --profile / --profile-top=N from argv and return the cProfile top-N, or None."""
+    top: Optional[int] = None
+    for arg in list(argv[1:]):
+        if arg == '--profile':
+            top = top or 0
+        elif arg.startswith('--profile-top='):
+            value = arg.split('=', 1)[1]
+            top = int(value) if value.isdigit() else PROFILE_DEFAULT_CPROFILE_TOP
+        else:
+            continue
+        argv.remove(arg)
+    return top
+
+
+def envelope_profile_top(json_string: str) -> Optional[int]:
+    """Peek at the execute payload so DDL can be traced when it asks for "profile"."""
+    if '"profile"' not in json_string:
+        return None
+    try:
+        data = json.loads(json_string)
+    except json.JSONDecodeError:
+        return None
+    return parse_profile_option(data.get('profile')) if isinstance(data, dict) else None
+
+
+def attach_profile(result: Any, profile: ActionProfile) -> Dict[str, Any]:
+    """Add _profile to the result; non-dict results are wrapped as {"result": ...}."""
+    if not isinstance(result, dict):
+        result = {'result': result}
+    result['_profile'] = profile.to_dict()
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Metrics histograms
+# ---------------------------------------------------------------------------
+
+def latency_bucket(duration_ms: float) -> int:
+    """Log-scale histogram bucket; bucket b covers durations up to 2^(b / METRICS_LATENCY_STEPS) ms."""
+    if duration_ms <= 0:
+        return METRICS_MIN_LATENCY_BUCKET
+    return max(METRICS_MIN_LATENCY_BUCKET, math.ceil(math.log2(duration_ms) * METRICS_LATENCY_STEPS))
+
+
+def latency_bucket_upper_ms(bucket: int) -> float:
+    return 2 ** (bucket / METRICS_LATENCY_STEPS)
+
+
+def count_result_rows(result: Any) -> int:
+    """Rough item count: a list's length, or the summed length of a dict's top-level lists."""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        return sum(len(value) for value in result.values() if isinstance(value, list))
+    return 0
+
+
+def histogram_percentile(buckets: List[Tuple[int, int]], total: int, pct: float, max_ms: float) -> float:
+    """Upper bound of the bucket holding the pct-th percentile of [(latency_bucket, calls)] (ascending)."""
+    target = max(1, math.ceil(total * pct / 100))
+    seen = 0
+    for bucket, calls in buckets:
+        seen += calls
+        if seen >= target:
+            return round(min(latency_bucket_upper_ms(bucket), max_ms), 3)
+    return round(max_ms, 3)
+
+
+def summarize_histogram(rows: List[Tuple[Any, ...]]) -> Dict[str, Any]:
+    """Merge (latency_bucket, calls, errors, total_ms, max_ms, result_bytes, result_rows) rows."""
+    calls = sum(r[1] for r in rows)
+    errors = sum(r[2] for r in rows)
+    max_ms = max(r[4] for r in rows)
+    buckets = sorted((r[0], r[1]) for r in rows)
+    return {
+        'calls': calls,
+        'errors': errors,
+        'error_rate': round(errors / calls, 4) if calls else 0,
+        'avg_ms': round(sum(r[3] for r in rows) / calls, 3) if calls else None,
+        'p50_ms': histogram_percentile(buckets, calls, 50, max_ms),
+        'p95_ms': histogram_percentile(buckets, calls, 95, max_ms),
+        'p99_ms': histogram_percentile(buckets, calls, 99, max_ms),
+        'max_ms': round(max_ms, 3),
+        'avg_result_bytes': round(sum(r[5] for r in rows) / calls) if calls else None,
+        'avg_result_rows': round(sum(r[6] for r in rows) / calls, 1) if calls else None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Logging
+# ---------------------------------------------------------------------------
+
+def gzip_log_name(name: str) -> str:
+    return name + '.gz'
+
+
+def gzip_rotate_log(source: str, dest: str) -> None:
+    """Compress a rotated log; a no-op when another process already rotated it."""
+    if not os.path.exists(source):
+        return
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Render message and traceback on the calling thread before queueing.
+
+    Unlike the stock prepare(), the traceback stays in exc_text instead of being
+    folded into the message, and the running action is attached as record.action.
+    """
+
+    def __init__(self, log_queue: Any, runtime: ActionRuntime) -> None:
+        super().__init__(log_queue)
+        self.runtime = runtime
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.action = self.runtime.current_action  # type: ignore[attr-defined]
+        return record
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line: ts / level / action / message / exc."""
+
+    def __init__(self, tz: datetime.tzinfo) -> None:
+        super().__init__()
+        self.tz = tz
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': datetime.datetime.fromtimestamp(record.created, self.tz).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        action = getattr(record, 'action', None)
+        if action:
+            entry['action'] = action
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# ---------------------------------------------------------------------------
+# Output formats
+# ---------------------------------------------------------------------------
+
+def iter_output_lines(result: Any, output_format: str) -> Iterable[str]:
+    """Encode a result as output lines.
+
+    ``pretty`` is indented JSON and ``json`` one line with default separators.
+    ``ndjson`` writes list results one element per line; a dict holding exactly
+    one list is written element by element followed by a ``{"_meta": {...}}``
+    line with the remaining keys. Anything else is a single compact line.
+    """
+    if output_format == 'pretty':
+        yield json.dumps(result, indent=2, ensure_ascii=False)
+        return
+    if output_format == 'json':
+        yield json.dumps(result, ensure_ascii=False)
+        return
+    if output_format == 'ndjson':
+        items, meta = result, None
+        if isinstance(result, dict):
+            list_keys = [key for key, value in result.items() if isinstance(value, list)]
+            if len(list_keys) == 1:
+                items = result[list_keys[0]]
+                meta = {key: value for key, value in result.items() if key != list_keys[0]}
+                meta['list_key'] = list_keys[0]
+        if isinstance(items, list):
+            for item in items:
+                yield json.dumps(item, ensure_ascii=False, separators=COMPACT_SEPARATORS)
+            if meta is not None:
+                yield json.dumps({'_meta': meta}, ensure_ascii=False, separators=COMPACT_SEPARATORS)
+            return
+    yield json.dumps(result, ensure_ascii=False, separators=COMPACT_SEPARATORS)
+
+
+def write_output(result: Any, output_format: str) -> int:
+    """Write a result to stdout line by line and return the number of bytes written."""
+    size = 0
+    for line in iter_output_lines(result, output_format):
+        line += '\n'
+        sys.stdout.write(line)
+        size += len(line.encode('utf-8'))
+    return size
@@ -0,0 +1,7 @@
+"""manage_log.py / manage_context.py のベンチマーク。
+
+合成データを作業ディレクトリに生成し、各アクションをプロセス内呼び出しと
+CLI (`execute`) 経由の両方で計測して結果を JSON に保存する。
+
+    python3 -m bench.manage_log_bench --size 100k
+"""
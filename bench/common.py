@@ -0,0 +1,372 @@
+"""ベンチマーク共通処理（作業ディレクトリ、計測、結果の保存と比較）。"""
+
+import contextlib
+import gc
+import importlib.util
+import json
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, 'bench', 'results')
+# manage_*.py が import する共通モジュール（スクリプトと一緒に作業ディレクトリへコピーする）
+SHARED_MODULES = ('action_runtime.py',)
+
+SIZES = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+
+def parse_size(value):
+    """'1k' / '100k' / '1M' または整数文字列を行数に変換する"""
+    key = str(value).strip().lower()
+    if key in SIZES:
+        return SIZES[key]
+    if key.endswith('k') and key[:-1].isdigit():
+        return int(key[:-1]) * 1_000
+    if key.endswith('m') and key[:-1].isdigit():
+        return int(key[:-1]) * 1_000_000
+    if key.isdigit():
+        return int(key)
+    raise ValueError(f"サイズの形式が不正です: {value}")
+
+
+def prepare_workdir(script_name, workdir=None):
+    """スクリプトを作業ディレクトリへコピーする。
+
+    manage_*.py は DB やバックアップをスクリプトと同じディレクトリに作るため、
+    コピーを使えばリポジトリの実データに触れずに済む。
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='flexistudy-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    for name in (script_name,) + SHARED_MODULES:
+        shutil.copy2(os.path.join(REPO_DIR, name), os.path.join(workdir, name))
+    return workdir
+
+
+def load_module(workdir, script_name):
+    """作業ディレクトリのスクリプトをモジュールとして読み込む（import 時の DB 初期化もそちらで行われる）"""
+    module_name = 'bench_' + os.path.splitext(script_name)[0]
+    if workdir not in sys.path:
+        sys.path.insert(0, workdir)  # SHARED_MODULES もコピーから読む
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(workdir, script_name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(samples_ms, peak_bytes=None, errors=0):
+    values = sorted(samples_ms)
+    summary = {
+        'runs': len(values),
+        'errors': errors,
+        'min_ms': round(values[0], 3) if values else None,
+        'p50_ms': round(percentile(values, 50), 3) if values else None,
+        'p95_ms': round(percentile(values, 95), 3) if values else None,
+        'p99_ms': round(percentile(values, 99), 3) if values else None,
+        'max_ms': round(values[-1], 3) if values else None,
+    }
+    if peak_bytes is not None:
+        summary['peak_memory_kb'] = round(peak_bytes / 1024, 1)
+    return summary
+
+
+def measure_in_process(func, params, trace=False):
+    """1 回呼び出して (経過ms, tracemalloc ピークバイト or None, 例外の有無) を返す。
+
+    tracemalloc は実行を数倍遅くするので、trace=True の結果はメモリ計測専用にする。
+    """
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    failed = False
+    try:
+        func(params)
+    except Exception:
+        failed = True
+    elapsed = (time.perf_counter() - start) * 1000
+    peak = None
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak, failed
+
+
+def time_in_process(func, params, repeat, warmup=True):
+    """関数を repeat 回呼び出してレイテンシを計測し、別の 1 回でピークメモリを測る。
+
+    warmup=True なら最初の 1 回（インデックス構築などを含む）を cold_ms として別に記録する。
+    """
+    cold = None
+    if warmup:
+        cold, _, _ = measure_in_process(func, params)
+    samples = []
+    errors = 0
+    for _ in range(repeat):
+        elapsed, _, failed = measure_in_process(func, params)
+        samples.append(elapsed)
+        errors += failed
+    _, peak, _ = measure_in_process(func, params, trace=True)
+    summary = summarize(samples, peak, errors)
+    if cold is not None:
+        summary['cold_ms'] = round(cold, 3)
+    return summary
+
+
+# 子プロセス自身に exec 後のピーク RSS を報告させるラッパー。
+# 親から wait4 で受け取る ru_maxrss は exec をまたいで引き継がれ、fork 元（ベンチ本体）の
+# メモリ量まで含んでしまう。Linux では /proc/self/status の VmHWM が exec 後の最大値になる。
+RSS_WRAPPER = r'''
+import atexit, os, runpy, sys
+
+def _report_rss():
+    rss_kb = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    rss_kb = int(line.split()[1])
+                    break
+    except OSError:
+        try:
+            import resource
+        except ImportError:  # Windows
+            return
+        rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':  # macOS はバイト
+            rss_kb //= 1024
+    path = os.environ.get('BENCH_RSS_FILE')
+    if path and rss_kb is not None:
+        with open(path, 'w') as f:
+            f.write(str(rss_kb))
+
+atexit.register(_report_rss)
+sys.argv = sys.argv[1:]
+sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name='__main__')
+'''
+
+
+def cli_command(workdir, script_name, action, params):
+    payload = json.dumps({'action': action, 'params': params}, ensure_ascii=False)
+    return [sys.executable, '-c', RSS_WRAPPER, os.path.join(workdir, script_name),
+            '--api-mode', 'execute', payload]
+
+
+def measure_cli(workdir, command):
+    """子プロセスを 1 回起動して (経過ms, 失敗したか, 最大RSS KB) を返す
+
+    RSS は RSS_WRAPPER が子プロセス内で読んだ値で、報告がなければ None。
+    """
+    fd, rss_path = tempfile.mkstemp(prefix='bench_rss_')
+    os.close(fd)
+    env = dict(os.environ, BENCH_RSS_FILE=rss_path)
+    try:
+        start = time.perf_counter()
+        proc = subprocess.run(command, cwd=workdir, env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        elapsed = (time.perf_counter() - start) * 1000
+        with open(rss_path) as f:
+            text = f.read().strip()
+        rss_kb = int(text) if text else None
+    finally:
+        os.remove(rss_path)
+    failed = proc.returncode != 0 or b'"status": "error"' in proc.stdout[:200]
+    return elapsed, failed, rss_kb
+
+
+def time_cli(workdir, script_name, action, params, repeat):
+    """`python3 <script> --api-mode execute` を repeat 回起動して計測する。
+
+    メモリは子プロセスの最大 RSS で、インタプリタ起動分を含む。
+    """
+    command = cli_command(workdir, script_name, action, params)
+    samples = []
+    errors = 0
+    peak_kb = None
+    for _ in range(repeat):
+        elapsed, failed, rss_kb = measure_cli(workdir, command)
+        samples.append(elapsed)
+        errors += failed
+        if rss_kb is not None:
+            peak_kb = max(peak_kb or 0, rss_kb)
+    summary = summarize(samples, errors=errors)
+    summary['peak_rss_kb'] = peak_kb
+    return summary
+
+
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+INDEX_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS \w+)? USING (?:COVERING )?INDEX')
+LIMIT_RE = re.compile(r'\bLIMIT (\d+)(?: OFFSET (\d+))?\s*;?\s*$', re.IGNORECASE)
+UNBOUNDED_WALK_RE = re.compile(r'\b(?:WHERE|GROUP BY|DISTINCT|COUNT|SUM|MIN|MAX|AVG|TOTAL|GROUP_CONCAT)\b',
+                               re.IGNORECASE)
+SKIPPED_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA', 'SAVEPOINT', 'RELEASE', '--')
+
+
+@contextlib.contextmanager
+def capture_statements(module):
+    """module.get_connection を差し替え、実行された SQL を記録する"""
+    statements = []
+    original = module.get_connection
+
+    def traced_connection():
+        conn = original()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    module.get_connection = traced_connection
+    try:
+        yield statements
+    finally:
+        module.get_connection = original
+
+
+def bounded_walk_rows(text, details):
+    """rowid 順に先頭から LIMIT 行だけ読む走査なら、読む行数の上限を返す（そうでなければ None）
+
+    プランが "SCAN <table>" 1 行だけ（一時 B-tree での並べ替えなし）で、WHERE・集計がなく
+    末尾に LIMIT があるものが対象。例: SELECT * FROM t ORDER BY id DESC LIMIT 100
+    """
+    if len(details) != 1 or not FULL_SCAN_RE.match(details[0]) or UNBOUNDED_WALK_RE.search(text):
+        return None
+    m = LIMIT_RE.search(text)
+    if not m:
+        return None
+    return int(m.group(1)) + int(m.group(2) or 0)
+
+
+def explain_statements(db_path, statements):
+    """記録した SQL ごとに EXPLAIN QUERY PLAN を取り、全表走査を検出する。
+
+    LIMIT 付きの rowid 順の走査は全表走査とせず、bounded_scans に読む行数の上限と共に入れる。
+
+    返却: [{sql, plan: [detail...], full_scans: [table...], bounded_scans: [{table, limit}],
+            index_scans: [table...]}]
+    """
+    seen = set()
+    plans = []
+    conn = sqlite3.connect(db_path)
+    try:
+        for sql in statements:
+            text = ' '.join(sql.split())
+            if not text or text.upper().startswith(SKIPPED_STATEMENTS) or text in seen:
+                continue
+            if text.upper().startswith('INSERT') and 'SELECT' not in text.upper():
+                continue
+            seen.add(text)
+            try:
+                rows = conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+            except sqlite3.Error as exc:
+                plans.append({'sql': text, 'error': str(exc)})
+                continue
+            details = [row[3] for row in rows]
+            full_scans = [m.group(1) for m in (FULL_SCAN_RE.match(d) for d in details) if m]
+            index_scans = [m.group(1) for m in (INDEX_SCAN_RE.match(d) for d in details) if m]
+            bounded_scans = []
+            limit = bounded_walk_rows(text, details)
+            if limit is not None:
+                bounded_scans = [{'table': full_scans[0], 'limit': limit}]
+                full_scans = []
+            plans.append({
+                'sql': text,
+                'plan': details,
+                'full_scans': full_scans,
+                'bounded_scans': bounded_scans,
+                'index_scans': index_scans,
+            })
+    finally:
+        conn.close()
+    return plans
+
+
+def git_revision():
+    try:
+        out = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'git_revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def save_results(name, results, output=None):
+    """結果を JSON に保存してパスを返す。output 未指定時は bench/results/ に保存する"""
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        revision = results.get('environment', {}).get('git_revision') or 'worktree'
+        output = os.path.join(RESULTS_DIR, f"{name}-{results['size_label']}-{revision}-{int(time.time())}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return output
+
+
+def compare_results(baseline_path, results, metric='p50_ms'):
+    """以前の結果ファイルと比較し、アクション・モードごとの変化率を返す"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    rows = []
+    for action, modes in results['actions'].items():
+        for mode, current in modes.items():
+            before = baseline.get('actions', {}).get(action, {}).get(mode)
+            if not isinstance(current, dict) or not isinstance(before, dict):
+                continue
+            old, new = before.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            rows.append({
+                'action': action,
+                'mode': mode,
+                'before': old,
+                'after': new,
+                'change_pct': round((new - old) / old * 100, 1),
+            })
+    return rows
+
+
+def print_table(results, compare_rows=None):
+    print(f"# {results['name']} size={results['size_label']} ({results['environment'].get('git_revision')})")
+    for action, modes in results['actions'].items():
+        for mode, summary in modes.items():
+            if not isinstance(summary, dict) or 'p50_ms' not in summary:
+                continue
+            memory = summary.get('peak_memory_kb') or summary.get('peak_rss_kb')
+            print(
+                f"{action:32s} {mode:10s} p50={summary['p50_ms']:>10} p95={summary['p95_ms']:>10} "
+                f"p99={summary['p99_ms']:>10} mem_kb={memory} errors={summary['errors']}"
+            )
+    for row in compare_rows or []:
+        print(f"{row['action']:32s} {row['mode']:10s} {row['before']} -> {row['after']} ms ({row['change_pct']:+.1f}%)")
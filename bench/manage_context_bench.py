@@ -0,0 +1,202 @@
+"""manage_context.py の通知判定・リマインダー系アクションを合成データ上で計測する。
+
+    python3 -m bench.manage_context_bench --size 100k
+    python3 -m bench.manage_context_bench --size 1M --fail-on-full-scan
+
+各アクションのレイテンシ（プロセス内 / CLI）に加えて、実行された SQL を
+set_trace_callback で記録し、EXPLAIN QUERY PLAN の結果を保存する。
+プランに全表走査（"SCAN <table>"）を含むアクションは、対象テーブルが
+--min-scan-rows 行以上なら full_scan_actions として報告する。
+rowid 順に LIMIT 行だけ読む走査と、件数に上限のあるテーブル（CAPPED_TABLES）の
+走査は、データ量に比例しないので報告しない（結果 JSON には残す）。
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import sys
+
+from bench import common
+from bench import notify_state_data
+
+SCRIPT_NAME = 'manage_context.py'
+
+# 件数に上限があるテーブル -> 上限を持つモジュール定数（リングバッファ）
+CAPPED_TABLES = {
+    'context_events': 'CONTEXT_EVENTS_CAPACITY',
+}
+
+
+def read_actions(today, cursor_hint):
+    """計測するアクション: (ラベル, action, params)"""
+    return [
+        ('notify.log_today_stats', 'notify.log_today_stats', {'user_id': 'local'}),
+        ('notify.log_list', 'notify.log_list', {'user_id': 'local', 'limit': 20}),
+        ('notify.log_list decision', 'notify.log_list', {'user_id': 'local', 'limit': 20, 'decision': 'send'}),
+        ('notify.log_list search', 'notify.log_list', {'user_id': 'local', 'limit': 20, 'search': '復習'}),
+        ('notify.log_list search short', 'notify.log_list', {'user_id': 'local', 'limit': 20, 'search': '英'}),
+        ('notify.log_list deep offset', 'notify.log_list', {'user_id': 'local', 'limit': 20, 'offset': 5000}),
+        ('notify.log_list cursor', 'notify.log_list',
+         {'user_id': 'local', 'limit': 20, 'cursor': cursor_hint, 'total': 'none'}),
+        ('context.state_get', 'context.state_get', {}),
+        ('context.snapshot', 'context.snapshot', {}),
+        ('context.mode_list', 'context.mode_list', {}),
+        ('context.pending_list', 'context.pending_list', {'status': 'open', 'limit': 50}),
+        ('context.events_recent', 'context.events_recent', {'limit': 100}),
+        ('context.events_stats', 'context.events_stats', {'from': today}),
+        ('ai.reminder_due', 'ai.reminder_due', {'user_id': 'local'}),
+        ('ai.reminder_next', 'ai.reminder_next', {'user_id': 'local'}),
+        ('ai.reminder_list', 'ai.reminder_list', {'user_id': 'local', 'status': 'scheduled'}),
+    ]
+
+
+def make_invoker(module, action):
+    handler = module.ACTION_HANDLERS[action]
+
+    def invoke(params):
+        result = handler(params)
+        json.dumps(result, ensure_ascii=False)
+        return result
+
+    return invoke
+
+
+def collect_plans(module, action, params):
+    """アクションを 1 回実行して SQL とクエリプランを集める"""
+    with common.capture_statements(module) as statements:
+        try:
+            module.ACTION_HANDLERS[action](params)
+        except Exception as exc:  # プランは取れた分だけ返す
+            statements.append(f'-- error: {exc}')
+    plans = common.explain_statements(module.DB_PATH, statements)
+    full_scans = sorted({table for plan in plans for table in plan.get('full_scans', [])})
+    return plans, full_scans
+
+
+def table_capacity(module, table):
+    name = CAPPED_TABLES.get(table)
+    return getattr(module, name, None) if name else None
+
+
+def table_row_counts(db_path, tables):
+    counts = {}
+    with sqlite3.connect(db_path) as conn:
+        for table in tables:
+            try:
+                counts[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            except sqlite3.Error:
+                counts[table] = None
+    return counts
+
+
+def run(args):
+    rows = common.parse_size(args.size)
+    workdir = common.prepare_workdir(SCRIPT_NAME, args.workdir)
+    module = common.load_module(workdir, SCRIPT_NAME)
+    module.setup_logging(api_mode=True)
+
+    generated = None
+    if not os.path.exists(module.DB_PATH) or not _has_rows(module.DB_PATH):
+        print(f"[bench] {rows} 行の合成データを生成中: {workdir}", file=sys.stderr)
+        generated = notify_state_data.generate(module, rows, seed=args.seed)
+    module.create_tables()
+
+    tz = module.TZ or datetime.timezone.utc
+    today = datetime.datetime.now(tz).date().isoformat()
+    with sqlite3.connect(module.DB_PATH) as conn:
+        middle = conn.execute(
+            "SELECT created_at_epoch, id FROM notify_log_entries ORDER BY id LIMIT 1 OFFSET ?",
+            (rows // 2,),
+        ).fetchone()
+    cursor_hint = f"{middle[0]}|{middle[1]}" if middle else None
+
+    results = {
+        'name': 'manage_context',
+        'size_label': args.size,
+        'rows': rows,
+        'seed': args.seed,
+        'workdir': workdir,
+        'generated': generated,
+        'db_size_bytes': os.path.getsize(module.DB_PATH),
+        'environment': common.environment_info(),
+        'actions': {},
+        'full_scan_actions': [],
+    }
+
+    only = set(args.only.split(',')) if args.only else None
+    for label, action, params in read_actions(today, cursor_hint):
+        if only and action not in only and label not in only:
+            continue
+        if action not in module.ACTION_HANDLERS:
+            continue
+        print(f"[bench] {label}", file=sys.stderr)
+        plans, full_scans = collect_plans(module, action, params)
+        scan_rows = table_row_counts(module.DB_PATH, full_scans)
+        # 数行の設定テーブル（context_modes など）と上限付きのテーブルの走査は問題にしない
+        capacities = {t: table_capacity(module, t) for t in full_scans}
+        flagged = [t for t in full_scans
+                   if (scan_rows.get(t) or 0) >= args.min_scan_rows and capacities[t] is None]
+        bounded = [scan for plan in plans for scan in plan.get('bounded_scans', [])]
+        entry = {
+            'action': action,
+            'params': params,
+            'in_process': common.time_in_process(make_invoker(module, action), params, args.repeat),
+            'query_plans': plans,
+            'full_scans': [{'table': t, 'rows': scan_rows.get(t), 'capacity': capacities[t]}
+                           for t in full_scans],
+            'bounded_scans': bounded,
+        }
+        if args.cli_repeat:
+            entry['cli'] = common.time_cli(workdir, SCRIPT_NAME, action, params, args.cli_repeat)
+        results['actions'][label] = entry
+        if flagged:
+            results['full_scan_actions'].append({
+                'action': label,
+                'tables': [f"{t} ({scan_rows[t]} rows)" for t in flagged],
+            })
+    return results
+
+
+def _has_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        try:
+            return conn.execute("SELECT COUNT(*) FROM notify_log_entries").fetchone()[0] > 0
+        except sqlite3.Error:
+            return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='manage_context.py benchmark')
+    parser.add_argument('--size', default='1k', help='notify_log_entries の行数 (1k / 100k / 1M / 整数)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', help='作業ディレクトリ（既存の DB があれば再利用）')
+    parser.add_argument('--repeat', type=int, default=20, help='プロセス内計測の回数')
+    parser.add_argument('--cli-repeat', type=int, default=5, help='CLI 計測の回数 (0 で省略)')
+    parser.add_argument('--only', help='計測するアクション（カンマ区切り）')
+    parser.add_argument('--output', help='結果 JSON の保存先')
+    parser.add_argument('--compare', help='比較する以前の結果 JSON')
+    parser.add_argument('--min-scan-rows', type=int, default=1000,
+                        help='この行数未満のテーブルの全表走査は報告しない')
+    parser.add_argument('--fail-on-full-scan', action='store_true',
+                        help='全表走査を含むアクションがあれば終了コード 1 を返す')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    path = common.save_results('manage_context', results, args.output)
+    compare_rows = common.compare_results(args.compare, results) if args.compare else None
+    if compare_rows is not None:
+        results['comparison'] = compare_rows
+        common.save_results('manage_context', results, path)
+    common.print_table(results, compare_rows)
+    for item in results['full_scan_actions']:
+        print(f"FULL SCAN  {item['action']:32s} {', '.join(item['tables'])}")
+    print(f"[bench] 結果: {path}", file=sys.stderr)
+    if args.fail_on_full_scan and results['full_scan_actions']:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
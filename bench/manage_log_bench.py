@@ -0,0 +1,172 @@
+"""manage_log.py の各アクションを合成データ上で計測する。
+
+    python3 -m bench.manage_log_bench --size 1k
+    python3 -m bench.manage_log_bench --size 100k --cli-repeat 5 --compare bench/results/<前回>.json
+
+作業ディレクトリ（既定は一時ディレクトリ、--workdir で再利用可）に manage_log.py を
+コピーしてデータを生成し、読み取り系アクションを repeat 回、書き込み系
+（log.break / log.resume）を交互に write-repeat 回実行する。
+"""
+
+import argparse
+import datetime
+import inspect
+import json
+import os
+import sqlite3
+import sys
+
+from bench import common
+from bench import study_log_data
+
+SCRIPT_NAME = 'manage_log.py'
+
+
+def read_actions(anchor, mid_date):
+    """計測する読み取り系アクション: (ラベル, action, params)"""
+    return [
+        ('data.dashboard', 'data.dashboard', {}),
+        ('log.get today', 'log.get', {'date': anchor}),
+        ('log.get past', 'log.get', {'date': mid_date}),
+        ('data.search q', 'data.search', {'q': '復習'}),
+        ('data.search tags', 'data.search', {'tags': ['演習', '数学'], 'type': 'all'}),
+        ('data.search range', 'data.search', {'q': '演習', 'from': mid_date, 'to': anchor}),
+        ('data.tags', 'data.tags', {}),
+        ('data.unique_subjects', 'data.unique_subjects', {}),
+        ('data.study_time_by_subject', 'data.study_time_by_subject', {}),
+        ('data.weekly_study_time', 'data.weekly_study_time', {}),
+        ('data.this_week_study_time', 'data.this_week_study_time', {}),
+        ('session.active', 'session.active', {}),
+        ('data.events_since', 'data.events_since', {'since': 0, 'limit': 100}),
+        ('data.search_suggest', 'data.search_suggest', {'prefix': '微分'}),
+        ('data.similar', 'data.similar', {'kind': 'entry', 'id': 1}),
+    ]
+
+
+WRITE_ACTIONS = [
+    ('log.break', {'break_content': 'ベンチマーク休憩'}),
+    ('log.resume', {}),
+]
+
+
+def make_invoker(module, action):
+    """execute と同じ呼び出し方（引数なしハンドラにも対応）で実行し、JSON 直列化まで含める"""
+    handler = module.ACTION_HANDLERS[action]
+    takes_params = bool(inspect.signature(handler).parameters)
+
+    def invoke(params):
+        result = handler(params) if takes_params or params else handler()
+        if result is not None:
+            json.dumps(result, indent=2, ensure_ascii=False)
+        return result
+
+    return invoke
+
+
+def run(args):
+    rows = common.parse_size(args.size)
+    workdir = common.prepare_workdir(SCRIPT_NAME, args.workdir)
+    module = common.load_module(workdir, SCRIPT_NAME)
+    module.setup_logging(api_mode=True)
+
+    anchor = datetime.date.fromisoformat(args.anchor_date) if args.anchor_date else datetime.date.today()
+    generated = None
+    with sqlite3.connect(module.DB_PATH) as conn:
+        existing = conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name = 'study_logs'"
+        ).fetchone()[0] and conn.execute("SELECT COUNT(*) FROM study_logs").fetchone()[0]
+    if not existing:
+        print(f"[bench] {rows} 行の合成データを生成中: {workdir}", file=sys.stderr)
+        generated = study_log_data.generate(module, rows, seed=args.seed, anchor_date=anchor,
+                                            with_events=args.with_events)
+    days = max(1, -(-rows // study_log_data.ROWS_PER_DAY))
+    mid_date = (anchor - datetime.timedelta(days=days // 2)).isoformat()
+
+    results = {
+        'name': 'manage_log',
+        'size_label': args.size,
+        'rows': rows,
+        'seed': args.seed,
+        'workdir': workdir,
+        'generated': generated,
+        'db_size_bytes': os.path.getsize(module.DB_PATH),
+        'environment': common.environment_info(),
+        'actions': {},
+    }
+
+    only = set(args.only.split(',')) if args.only else None
+    for label, action, params in read_actions(anchor.isoformat(), mid_date):
+        if only and action not in only and label not in only:
+            continue
+        print(f"[bench] {label}", file=sys.stderr)
+        entry = {'action': action, 'params': params}
+        entry['in_process'] = common.time_in_process(make_invoker(module, action), params, args.repeat)
+        if args.cli_repeat:
+            entry['cli'] = common.time_cli(workdir, SCRIPT_NAME, action, params, args.cli_repeat)
+        results['actions'][label] = entry
+
+    if args.write_repeat:
+        samples = {action: {'in_process': [], 'cli': []} for action, _ in WRITE_ACTIONS}
+        peaks = {action: 0 for action, _ in WRITE_ACTIONS}
+        errors = {action: 0 for action, _ in WRITE_ACTIONS}
+        cli_errors = {action: 0 for action, _ in WRITE_ACTIONS}
+        cli_rss = {action: 0 for action, _ in WRITE_ACTIONS}
+        for i in range(args.write_repeat + 1):
+            # break → resume の順に交互実行すれば状態が元に戻る。最後の 1 周はメモリ計測用
+            trace = i == args.write_repeat
+            for action, params in WRITE_ACTIONS:
+                elapsed, peak, failed = common.measure_in_process(make_invoker(module, action), params, trace)
+                if trace:
+                    peaks[action] = peak
+                    continue
+                samples[action]['in_process'].append(elapsed)
+                errors[action] += failed
+            if args.cli_repeat and not trace:
+                for action, params in WRITE_ACTIONS:
+                    command = common.cli_command(workdir, SCRIPT_NAME, action, params)
+                    elapsed, failed, rss_kb = common.measure_cli(workdir, command)
+                    samples[action]['cli'].append(elapsed)
+                    cli_errors[action] += failed
+                    cli_rss[action] = max(cli_rss[action], rss_kb or 0)
+        for action, params in WRITE_ACTIONS:
+            if only and action not in only:
+                continue
+            entry = {'action': action, 'params': params,
+                     'in_process': common.summarize(samples[action]['in_process'], peaks[action], errors[action])}
+            if samples[action]['cli']:
+                entry['cli'] = common.summarize(samples[action]['cli'], errors=cli_errors[action])
+                entry['cli']['peak_rss_kb'] = cli_rss[action] or None
+            results['actions'][action] = entry
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='manage_log.py benchmark')
+    parser.add_argument('--size', default='1k', help='study_logs の行数 (1k / 100k / 1M / 整数)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anchor-date', help='データの最終日 (YYYY-MM-DD, 既定は今日)')
+    parser.add_argument('--workdir', help='作業ディレクトリ（既存の DB があれば再利用）')
+    parser.add_argument('--repeat', type=int, default=20, help='プロセス内計測の回数')
+    parser.add_argument('--cli-repeat', type=int, default=5, help='CLI 計測の回数 (0 で省略)')
+    parser.add_argument('--write-repeat', type=int, default=3,
+                        help='log.break / log.resume の回数（毎回 DB バックアップが走る。0 で省略）')
+    parser.add_argument('--with-events', action='store_true', help='生成時に events トリガーを有効にする')
+    parser.add_argument('--only', help='計測するアクション（カンマ区切り）')
+    parser.add_argument('--output', help='結果 JSON の保存先')
+    parser.add_argument('--compare', help='比較する以前の結果 JSON')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    path = common.save_results('manage_log', results, args.output)
+    compare_rows = common.compare_results(args.compare, results) if args.compare else None
+    if compare_rows is not None:
+        results['comparison'] = compare_rows
+        common.save_results('manage_log', results, path)
+    common.print_table(results, compare_rows)
+    print(f"[bench] 結果: {path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
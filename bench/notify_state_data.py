@@ -0,0 +1,172 @@
+"""notify_state.db 用の決定的な合成データ生成。
+
+notify_log_entries を基準行数とし、ai_reminders / context_pending / context_events を
+その比率で作る。created_at には旧形式（'YYYY-MM-DD HH:MM:SS'）と ISO 形式
+（+09:00 / Z）を混ぜ、test / manual_send フラグも一定割合で立てる。
+トリガー（送信カウンタ・FTS・バージョン）は有効なまま投入するので、
+派生テーブルも実運用と同じ状態になる。
+"""
+
+import datetime
+import json
+import random
+import sqlite3
+
+DECISIONS = ['send', 'send', 'send', 'skip', 'skip', 'defer', 'error']
+SOURCES = ['reminder', 'ai_autonomous', 'manual', 'schedule', 'server']
+TITLES = ['学習リマインド', '休憩の時間です', '目標の確認', '今日の振り返り', '模試まであと少し', '英単語の復習']
+BODIES = [
+    '数学の演習を始めましょう。', '30分集中したら休憩しましょう。', '今日の目標を確認してください。',
+    '英単語を10個覚えましょう。', '昨日の復習から始めると効果的です。', '明日の予定を立てましょう。',
+]
+REASONS = ['quiet_hours', 'daily_limit', 'mode_blocked', 'duplicate', 'ok', None]
+MODES = [
+    ('default', 'デフォルト'),
+    ('study', '集中学習'),
+    ('school', '授業中'),
+    ('sleep', '睡眠'),
+]
+EVENT_TYPES = ['mode_switch', 'decision', 'pending_enter', 'pending_resolve', 'reminder_fired']
+REMINDER_STATUSES = ['scheduled'] * 3 + ['fired', 'dispatched', 'cancelled', 'queued']
+
+REMINDER_RATIO = 10
+PENDING_RATIO = 20
+EVENTS_RATIO = 2
+
+
+def _timestamp(rng, moment):
+    """同じ時刻を旧形式 / +09:00 / Z のいずれかで表す"""
+    style = rng.random()
+    if style < 0.3:
+        return moment.strftime('%Y-%m-%d %H:%M:%S')
+    if style < 0.8:
+        return moment.isoformat(timespec='seconds')
+    return moment.astimezone(datetime.timezone.utc).isoformat(timespec='seconds').replace('+00:00', 'Z')
+
+
+def generate(module, rows, seed=42, anchor=None, user_ids=('local',)):
+    """module（作業ディレクトリに読み込んだ manage_context）の DB に合成データを書き込む"""
+    rng = random.Random(seed)
+    tz = module.TZ or datetime.timezone.utc
+    anchor = anchor or datetime.datetime.now(tz).replace(microsecond=0)
+    module.create_tables()
+
+    conn = sqlite3.connect(module.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    counts = {}
+    try:
+        conn.execute('PRAGMA synchronous = OFF')
+        now = module.now_ts()
+        for mode_id, name in MODES:
+            conn.execute(
+                """
+                INSERT OR IGNORE INTO context_modes (
+                    mode_id, display_name, description, ai_notes, knowledge_refs, presentation, created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (mode_id, name, f'{name}のモード', None, json.dumps(['docs/notifications.md']),
+                 json.dumps({'color': 'blue'}), now, now),
+            )
+
+        # 通知ログ: 平均 1 件 / 10 分で過去に遡る
+        entries = []
+        span = datetime.timedelta(minutes=10)
+        for i in range(rows):
+            moment = anchor - span * (rows - i) + datetime.timedelta(seconds=rng.randint(0, 599))
+            created_at = _timestamp(rng, moment)
+            epoch = module.timestamp_to_epoch(created_at)
+            decision = rng.choice(DECISIONS)
+            payload = {'notification': {'title': rng.choice(TITLES), 'body': rng.choice(BODIES)}}
+            entries.append((
+                rng.choice(user_ids), decision, rng.choice(REASONS), rng.choice(SOURCES),
+                rng.choice(MODES)[0], json.dumps(payload, ensure_ascii=False),
+                json.dumps({'origin': 'bench'}), created_at, created_at, None,
+                1 if rng.random() < 0.05 else 0, 1 if rng.random() < 0.05 else 0,
+                epoch, module.epoch_to_local_day(epoch),
+            ))
+        conn.executemany(
+            """
+            INSERT INTO notify_log_entries (
+                user_id, decision, reason, source, mode_id, payload_json, context_json,
+                triggered_at, created_at, resend_of, test, manual_send, created_at_epoch, created_day
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            entries,
+        )
+        counts['notify_log_entries'] = len(entries)
+
+        # リマインダー: 過去と未来に散らばる
+        reminders = []
+        for i in range(max(1, rows // REMINDER_RATIO)):
+            fire = anchor + datetime.timedelta(minutes=rng.randint(-60 * 24 * 90, 60 * 24 * 14))
+            fire_at = _timestamp(rng, fire)
+            status = rng.choice(REMINDER_STATUSES)
+            if status == 'scheduled' and fire < anchor and rng.random() < 0.9:
+                status = 'fired'
+            reminders.append((
+                f'bench-reminder-{i}', rng.choice(user_ids), fire_at, status,
+                json.dumps({'mode_id': rng.choice(MODES)[0]}), rng.choice(TITLES), 'bench',
+                now, now, None, module.timestamp_to_epoch(fire_at),
+            ))
+        conn.executemany(
+            """
+            INSERT INTO ai_reminders (
+                id, user_id, fire_at, status, context_json, purpose, created_by,
+                created_at, updated_at, meta_json, fire_at_epoch
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            reminders,
+        )
+        counts['ai_reminders'] = len(reminders)
+
+        # 保留: 大半は解決済み、一部は期限切れ前後の open
+        pending = []
+        for i in range(max(1, rows // PENDING_RATIO)):
+            entered = anchor - datetime.timedelta(minutes=rng.randint(0, 60 * 24 * 60))
+            expires = entered + datetime.timedelta(hours=rng.randint(1, 72)) if rng.random() < 0.7 else None
+            status = 'open' if rng.random() < 0.1 else rng.choice(['resolved', 'cancelled', 'expired'])
+            entered_at = _timestamp(rng, entered)
+            expires_at = _timestamp(rng, expires) if expires else None
+            pending.append((
+                f'bench-pending-{i}', rng.choice(MODES)[0], rng.choice(SOURCES),
+                json.dumps({'title': rng.choice(TITLES)}, ensure_ascii=False), entered_at, expires_at, status,
+                None if status == 'open' else now, None if status == 'open' else status,
+                module.timestamp_to_epoch(entered_at), module.pending_expiry_epoch(expires_at),
+            ))
+        conn.executemany(
+            """
+            INSERT INTO context_pending (
+                id, mode_id, source, payload_json, entered_at, expires_at, status,
+                resolved_at, resolution, entered_at_epoch, expires_at_epoch
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            pending,
+        )
+        counts['context_pending'] = len(pending)
+
+        events = []
+        for i in range(max(1, rows // EVENTS_RATIO)):
+            moment = anchor - datetime.timedelta(minutes=20) * (rows // EVENTS_RATIO - i)
+            created_at = _timestamp(rng, moment)
+            events.append((
+                rng.choice(EVENT_TYPES), rng.choice(MODES)[0] if rng.random() < 0.8 else None,
+                json.dumps({'i': i}), rng.choice(SOURCES), created_at,
+                module.epoch_to_local_day(module.timestamp_to_epoch(created_at)),
+            ))
+        conn.executemany(
+            """
+            INSERT INTO context_events (event_type, mode_id, payload_json, source, created_at, created_day)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            events,
+        )
+        # リングバッファの定常状態（古いものはロールアップ済み）にそろえる
+        newest = conn.execute("SELECT MAX(id) FROM context_events").fetchone()[0]
+        counts['context_events_rolled_up'] = module.trim_context_events(conn, newest, force=True)
+        counts['context_events'] = len(events)
+        conn.commit()
+        conn.execute('PRAGMA synchronous = FULL')
+    finally:
+        conn.close()
+    counts['anchor'] = anchor.isoformat()
+    return counts
@@ -0,0 +1,163 @@
+"""study_log.db 用の決定的な合成データ生成。
+
+同じ seed・行数・基準日からは常に同じ DB ができる。1 日あたり約 20 行の
+START / BREAK / RESUME 列と、日ごとの目標（JSON タグ付き）・日次サマリーを作る。
+基準日（既定は今日）には終了していないセッションを 1 つ残すので、
+log.break / log.resume もそのまま計測できる。
+"""
+
+import datetime
+import json
+import random
+import sqlite3
+
+SUBJECTS = ['数学', '英語', '物理', '化学', '国語', '日本史', '生物', '情報']
+CONTENTS = {
+    '数学': ['微分積分の演習', '確率の基本問題', 'ベクトルの復習', '数列の漸化式', '二次関数のグラフ'],
+    '英語': ['英単語ターゲット', '長文読解', '文法問題集', 'リスニング練習', '英作文の添削'],
+    '物理': ['力学の演習', '電磁気の復習', '波動の基礎', '熱力学の問題'],
+    '化学': ['有機化学の暗記', 'モル計算', '化学平衡', '無機化学のまとめ'],
+    '国語': ['現代文の読解', '古文単語', '漢文の句法', '小論文の構成'],
+    '日本史': ['鎌倉時代の流れ', '近代史の年号', '文化史のまとめ'],
+    '生物': ['遺伝の計算', '細胞の構造', '生態系の復習'],
+    '情報': ['アルゴリズムの基礎', 'Python の練習', 'データベース入門'],
+}
+HASHTAGS = ['復習', '演習', '暗記', '模試対策', '苦手克服', '過去問', '基礎', '応用', '集中', '朝活']
+BREAK_CONTENTS = ['休憩', '昼食', 'おやつ', '散歩', '仮眠', None]
+MEMOS = ['解き直しが必要', '公式を確認した', 'ケアレスミスが多い', '時間配分を意識', '理解が深まった']
+IMPRESSIONS = ['集中できた', '少し眠かった', '難しかったが楽しい', '思ったより進んだ', 'もう少し頑張りたい']
+GOAL_TASKS = ['問題集 {n} ページ', '単語 {n} 個', '過去問 {n} 題', '復習ノート {n} 枚', '講義動画 {n} 本']
+
+ROWS_PER_DAY = 20
+GOALS_PER_DAY = 3
+
+
+def _text(rng, base, tag_count):
+    tags = ' '.join('#' + t for t in rng.sample(HASHTAGS, tag_count))
+    return f"{base} {tags}".strip()
+
+
+def _fmt(dt):
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def iter_day_rows(rng, day, is_anchor_day):
+    """1 日分の study_logs 行 (event_type, subject, content, start, end, duration, summary, memo, impression)"""
+    cursor = datetime.datetime.combine(day, datetime.time(8, 0)) + datetime.timedelta(minutes=rng.randint(0, 90))
+    rows = []
+    while len(rows) < ROWS_PER_DAY:
+        subject = rng.choice(SUBJECTS)
+        content = _text(rng, rng.choice(CONTENTS[subject]), rng.randint(0, 2))
+        segments = rng.randint(1, 4)
+        for seg in range(segments):
+            minutes = rng.randint(10, 60)
+            end = cursor + datetime.timedelta(minutes=minutes)
+            rows.append((
+                'START' if seg == 0 else 'RESUME', subject, content, _fmt(cursor), _fmt(end), minutes,
+                _text(rng, f"{subject}のまとめ", 1) if seg == 0 and rng.random() < 0.5 else None,
+                rng.choice(MEMOS) if rng.random() < 0.3 else None,
+                _text(rng, rng.choice(IMPRESSIONS), 1) if rng.random() < 0.2 else None,
+            ))
+            cursor = end
+            if seg < segments - 1:
+                pause = rng.randint(5, 20)
+                end = cursor + datetime.timedelta(minutes=pause)
+                rows.append(('BREAK', None, rng.choice(BREAK_CONTENTS), _fmt(cursor), _fmt(end), pause,
+                             None, None, None))
+                cursor = end
+        cursor += datetime.timedelta(minutes=rng.randint(5, 30))
+    rows = rows[:ROWS_PER_DAY]
+    if is_anchor_day:
+        # 最後の行を進行中にする
+        last = list(rows[-1])
+        if last[0] == 'BREAK':
+            rows.pop()
+            last = list(rows[-1])
+        last[4] = None
+        last[5] = None
+        rows[-1] = tuple(last)
+    return rows
+
+
+def iter_day_goals(rng, day, index):
+    goals = []
+    for g in range(GOALS_PER_DAY):
+        subject = rng.choice(SUBJECTS)
+        total = rng.choice([None, 10, 20, 30, 50])
+        created = _fmt(datetime.datetime.combine(day, datetime.time(7, 0)))
+        goals.append((
+            f"bench-goal-{index}-{g}",
+            day.isoformat(),
+            f"{subject}: " + rng.choice(GOAL_TASKS).format(n=rng.randint(5, 50)),
+            1 if rng.random() < 0.6 else 0,
+            subject,
+            total,
+            rng.randint(0, total) if total else None,
+            json.dumps(rng.sample(HASHTAGS, rng.randint(0, 3)) + [subject], ensure_ascii=False),
+            _text(rng, rng.choice(MEMOS), rng.randint(0, 1)) if rng.random() < 0.4 else None,
+            created,
+            created,
+        ))
+    return goals
+
+
+def generate(module, rows, seed=42, anchor_date=None, with_events=False):
+    """module（作業ディレクトリに読み込んだ manage_log）の DB に合成データを書き込む。
+
+    既定では生成中はイベントトリガーを外して投入し、最後に作り直す
+    （events テーブルに投入分の履歴は残さない）。with_events=True なら
+    トリガー経由で events も書かれる。
+    """
+    rng = random.Random(seed)
+    anchor = anchor_date or datetime.date.today()
+    days = max(1, -(-rows // ROWS_PER_DAY))
+    module.create_tables()
+    module.ensure_study_log_columns()
+
+    counts = {'study_logs': 0, 'goals': 0, 'daily_summaries': 0, 'days': days}
+    conn = sqlite3.connect(module.DB_PATH)
+    try:
+        if not with_events:
+            for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_%'").fetchall():
+                conn.execute(f"DROP TRIGGER {name}")
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = OFF')
+        remaining = rows
+        for offset in range(days - 1, -1, -1):
+            day = anchor - datetime.timedelta(days=offset)
+            day_rows = iter_day_rows(rng, day, offset == 0)[:remaining]
+            remaining -= len(day_rows)
+            conn.executemany(
+                """
+                INSERT INTO study_logs (event_type, subject, content, start_time, end_time,
+                                        duration_minutes, summary, memo, impression)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                day_rows,
+            )
+            goals = iter_day_goals(rng, day, days - offset)
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO goals (id, date, task, completed, subject, total_problems,
+                                              completed_problems, tags, details, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                goals,
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO daily_summaries (date, summary) VALUES (?, ?)",
+                (day.isoformat(), _text(rng, f"{rng.choice(SUBJECTS)}を中心に{rng.randint(2, 9)}時間学習", 2)),
+            )
+            counts['study_logs'] += len(day_rows)
+            counts['goals'] += len(goals)
+            counts['daily_summaries'] += 1
+            if offset % 500 == 0:
+                conn.commit()
+        conn.commit()
+        conn.execute('PRAGMA synchronous = FULL')
+    finally:
+        conn.close()
+    if not with_events:
+        module.ensure_event_triggers()
+    counts['anchor_date'] = anchor.isoformat()
+    return counts
@@ -21,16 +21,23 @@ import logging
 import os
 import sqlite3
 import sys
+import threading
+import time
 import uuid
+import contextlib
 from dataclasses import dataclass
 from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
+import action_runtime
+from action_runtime import (
+    ActionProfile, envelope_profile_top, params_hash, parse_profile_option, pop_profile_flags,
+)
+
 try:
     from zoneinfo import ZoneInfo
 except ImportError:  # pragma: no cover (Python <3.9 not expected, but fallback)
     ZoneInfo = None  # type: ignore
 
-
 # ---------------------------------------------------------------------------
 # Constants & basic helpers
 # ---------------------------------------------------------------------------
@@ -38,7 +45,34 @@ except ImportError:  # pragma: no cover (Python <3.9 not expected, but fallback)
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(SCRIPT_DIR, 'notify_state.db')
 LOG_PATH = os.path.join(SCRIPT_DIR, 'manage_context.log')
+# manage_context.log rotation; rotated files are gzip-compressed and LOG_FILE_BACKUPS are kept
+LOG_FILE_MAX_BYTES = int(os.environ.get('MANAGE_CONTEXT_LOGFILE_MAX_BYTES', str(5 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.environ.get('MANAGE_CONTEXT_LOGFILE_BACKUPS', '5'))
+LOG_FILE_ROTATION = os.environ.get('MANAGE_CONTEXT_LOGFILE_ROTATION', 'size')  # 'size' | 'daily'
+LOG_FILE_FORMAT = os.environ.get('MANAGE_CONTEXT_LOGFILE_FORMAT', 'text')      # 'text' | 'json'
 TZ = ZoneInfo("Asia/Tokyo") if ZoneInfo else None
+REMINDER_WAIT_POLL_INTERVAL = 0.25  # seconds between PRAGMA data_version checks
+REMINDER_WAIT_MAX_MS = 300000
+REMINDER_DEFAULT_LEASE_MS = 120000
+REMINDER_EPOCH_MAX = 2 ** 62  # "no upper bound" for fire_at_epoch range queries
+# Action metrics live in their own file so the hot notify_state.db never takes
+# an extra write per read; set MANAGE_CONTEXT_METRICS_DB='' to disable.
+METRICS_DB_PATH = os.environ.get('MANAGE_CONTEXT_METRICS_DB', os.path.join(SCRIPT_DIR, 'manage_context_metrics.db'))
+# Per-action deadline enforced through the SQLite progress handler (0 disables).
+DEADLINE_DEFAULT_MS = int(os.environ.get('MANAGE_CONTEXT_DEADLINE_MS', '5000'))
+# Only read actions get the default deadline; long-polls (ai.reminder_wait) and
+# writes run unbounded unless the payload passes "deadline_ms".
+DEADLINE_ACTIONS = {
+    'context.mode_list', 'context.mode_get', 'context.state_get', 'context.snapshot',
+    'context.pending_list', 'context.events_recent', 'context.events_stats',
+    'notify.log_get', 'notify.log_list', 'notify.log_today_stats',
+    'ai.reminder_get', 'ai.reminder_list', 'ai.reminder_due', 'ai.reminder_next',
+    'ai.reminder_occurrences', 'metrics.summary',
+}
+SLOW_QUERY_MS = float(os.environ.get('MANAGE_CONTEXT_SLOW_QUERY_MS', '200'))  # 0 disables
+SLOW_QUERY_LOG_PATH = os.path.join(SCRIPT_DIR, 'manage_context_slow.log')
+OUTPUT_FORMATS = ('json', 'compact', 'ndjson')  # envelope "format"; json is the historical one-line output
+STORE_CACHED_STATEMENTS = 256  # prepared statements kept by a ContextStore connection (sqlite3 default: 128)
 
 
 def now_ts() -> str:
@@ -73,9 +107,17 @@ def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
+# Set while a ContextStore method runs so get_connection() reuses its connection
+_store_local = threading.local()
+
+
 def get_connection() -> sqlite3.Connection:
+    store = getattr(_store_local, 'store', None)
+    if store is not None:
+        # Calls made through a ContextStore share its single connection
+        return store.checkout()
     ensure_dir(os.path.dirname(DB_PATH))
-    conn = sqlite3.connect(DB_PATH)
+    conn = runtime.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     conn.execute('PRAGMA foreign_keys = ON')
     return conn
@@ -94,26 +136,48 @@ def json_loads(data: Optional[str], fallback: Any) -> Any:
         return fallback
 
 
-# ---------------------------------------------------------------------------
-# Logging setup
-# ---------------------------------------------------------------------------
+def parse_fields(params: Dict[str, Any]) -> Optional[List[str]]:
+    """Read the optional ``fields`` projection (list or comma-separated string)."""
+    fields = params.get('fields')
+    if fields is None or fields == '':
+        return None
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+    if not isinstance(fields, list) or not fields:
+        raise ValueError('fields must be a list of key names')
+    return [str(f) for f in fields]
 
-logger = logging.getLogger(__name__)
+
+def project_fields(record: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return record
+    return {key: record[key] for key in fields if key in record}
 
 
-def setup_logging(api_mode: bool = False) -> None:
-    logger.setLevel(logging.INFO)
-    if logger.hasHandlers():
-        logger.handlers.clear()
+# ---------------------------------------------------------------------------
+# Logging, deadlines, slow-query log, profiling and metrics (shared with manage_log.py)
+# ---------------------------------------------------------------------------
 
-    file_handler = logging.FileHandler(LOG_PATH, encoding='utf-8')
-    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logger.addHandler(file_handler)
+logger = logging.getLogger(__name__)
 
-    if not api_mode:
-        stream_handler = logging.StreamHandler(sys.stderr)
-        stream_handler.setFormatter(logging.Formatter('%(message)s'))
-        logger.addHandler(stream_handler)
+runtime = action_runtime.ActionRuntime(
+    logger,
+    log_path=LOG_PATH,
+    log_max_bytes=LOG_FILE_MAX_BYTES,
+    log_backups=LOG_FILE_BACKUPS,
+    log_rotation=LOG_FILE_ROTATION,
+    log_format=LOG_FILE_FORMAT,
+    metrics_db_path=METRICS_DB_PATH,
+    deadline_default_ms=DEADLINE_DEFAULT_MS,
+    deadline_actions=DEADLINE_ACTIONS,
+    slow_query_ms=SLOW_QUERY_MS,
+    slow_query_log_path=SLOW_QUERY_LOG_PATH,
+    output_formats=OUTPUT_FORMATS,
+    tz=TZ,
+)
+setup_logging = runtime.setup_logging
+activate_profile = runtime.activate_profile
+parse_output_format = runtime.parse_output_format
 
 
 # ---------------------------------------------------------------------------
@@ -164,6 +228,8 @@ def create_tables() -> None:
                 status TEXT NOT NULL DEFAULT 'open',
                 resolved_at TEXT,
                 resolution TEXT,
+                entered_at_epoch INTEGER,
+                expires_at_epoch INTEGER,
                 FOREIGN KEY(mode_id) REFERENCES context_modes(mode_id)
             )
             """
@@ -175,6 +241,20 @@ def create_tables() -> None:
             ON context_pending(status)
             """
         )
+        ensure_context_pending_columns(cur)
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_context_pending_open
+            ON context_pending(status, entered_at_epoch, id)
+            """
+        )
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_context_pending_expiry
+            ON context_pending(status, expires_at_epoch)
+            WHERE expires_at_epoch IS NOT NULL
+            """
+        )
 
         cur.execute(
             """
@@ -185,18 +265,34 @@ def create_tables() -> None:
                 payload_json TEXT,
                 source TEXT,
                 created_at TEXT NOT NULL,
+                created_day TEXT,
                 FOREIGN KEY(mode_id) REFERENCES context_modes(mode_id)
             )
             """
         )
 
+        # Events are read newest-first by id; created_at strings with mixed
+        # offsets do not sort chronologically, so the old index is unused.
+        cur.execute("DROP INDEX IF EXISTS idx_context_events_created_at")
+        ensure_context_event_columns(cur)
+
+        # Per-day / per-type / per-mode counts of events trimmed from the ring buffer
         cur.execute(
             """
-            CREATE INDEX IF NOT EXISTS idx_context_events_created_at
-            ON context_events(created_at DESC)
+            CREATE TABLE IF NOT EXISTS context_event_rollups (
+                day TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                mode_id TEXT NOT NULL DEFAULT '',
+                count INTEGER NOT NULL,
+                first_id INTEGER NOT NULL,
+                last_id INTEGER NOT NULL,
+                PRIMARY KEY (day, event_type, mode_id)
+            ) WITHOUT ROWID
             """
         )
 
+        ensure_context_versions(cur)
+
         cur.execute(
             """
             CREATE TABLE IF NOT EXISTS notify_log_entries (
@@ -213,6 +309,8 @@ def create_tables() -> None:
                 resend_of INTEGER,
                 test INTEGER NOT NULL DEFAULT 0,
                 manual_send INTEGER NOT NULL DEFAULT 0,
+                created_at_epoch INTEGER,
+                created_day TEXT,
                 FOREIGN KEY(resend_of) REFERENCES notify_log_entries(id)
             )
             """
@@ -225,13 +323,33 @@ def create_tables() -> None:
             """
         )
 
+        ensure_notify_log_time_columns(cur)
+
+        # Composite indexes matching notify.log_list filters + ordering
+        cur.execute("DROP INDEX IF EXISTS idx_notify_log_user")
+        for index_name, filter_column in NOTIFY_LOG_FILTER_INDEXES.items():
+            cur.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,))
+            existing = cur.fetchone()
+            if existing and 'created_at_epoch' not in (existing[0] or ''):
+                cur.execute(f"DROP INDEX {index_name}")
+            columns = ', '.join(c for c in ('user_id', filter_column) if c)
+            cur.execute(
+                f"""
+                CREATE INDEX IF NOT EXISTS {index_name}
+                ON notify_log_entries({columns}, created_at_epoch DESC, id DESC)
+                """
+            )
+
         cur.execute(
             """
-            CREATE INDEX IF NOT EXISTS idx_notify_log_user
-            ON notify_log_entries(user_id)
+            CREATE INDEX IF NOT EXISTS idx_notify_log_send_stats
+            ON notify_log_entries(user_id, decision, test, manual_send, created_at_epoch)
             """
         )
 
+        ensure_notify_send_counters(cur)
+        ensure_notify_log_fts(cur)
+
         cur.execute(
             """
             CREATE TABLE IF NOT EXISTS ai_reminders (
@@ -244,7 +362,11 @@ def create_tables() -> None:
                 created_by TEXT,
                 created_at TEXT NOT NULL,
                 updated_at TEXT NOT NULL,
-                meta_json TEXT
+                meta_json TEXT,
+                fire_at_epoch INTEGER,
+                lease_owner TEXT,
+                lease_expires_epoch INTEGER,
+                recurrence_json TEXT
             )
             """
         )
@@ -256,11 +378,384 @@ def create_tables() -> None:
             """
         )
 
+        ensure_ai_reminder_columns(cur)
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_ai_reminders_schedule
+            ON ai_reminders(user_id, status, fire_at_epoch)
+            """
+        )
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_ai_reminders_lease
+            ON ai_reminders(status, lease_expires_epoch)
+            """
+        )
+
+        # Per-occurrence state of recurring reminders (fired or overridden only)
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ai_reminder_occurrences (
+                reminder_id TEXT NOT NULL,
+                occurrence_epoch INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                meta_json TEXT,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (reminder_id, occurrence_epoch),
+                FOREIGN KEY(reminder_id) REFERENCES ai_reminders(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+            """
+        )
+
         # Seed defaults if necessary
         seed_defaults(cur)
         conn.commit()
 
 
+NOTIFY_LOG_FILTER_INDEXES = {
+    'idx_notify_log_user_created': None,
+    'idx_notify_log_user_decision': 'decision',
+    'idx_notify_log_user_mode': 'mode_id',
+    'idx_notify_log_user_source': 'source',
+}
+NOTIFY_LOG_COUNT_CAP = 1000
+NOTIFY_LOG_FTS_MIN_TERM = 3  # trigram tokenizer cannot match shorter terms
+
+NOTIFY_LOG_FTS_COLUMNS = """
+    CASE WHEN json_valid({row}.payload_json)
+         THEN COALESCE(json_extract({row}.payload_json, '$.notification.title'), json_extract({row}.payload_json, '$.title'))
+    END,
+    CASE WHEN json_valid({row}.payload_json)
+         THEN COALESCE(json_extract({row}.payload_json, '$.notification.body'), json_extract({row}.payload_json, '$.body'))
+    END,
+    {row}.reason
+"""
+
+
+def timestamp_to_epoch(value: Optional[str]) -> int:
+    """Convert a stored timestamp (ISO with offset or legacy local format) to epoch seconds.
+
+    Unparseable values map to 0 so the column never holds NULL.
+    """
+    iso = ensure_iso_timestamp(value)
+    if not iso or not isinstance(iso, str):
+        return 0
+    try:
+        dt = datetime.datetime.fromisoformat(iso.replace('Z', '+00:00'))
+    except ValueError:
+        return 0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=TZ or datetime.timezone.utc)
+    return int(dt.timestamp())
+
+
+def epoch_to_iso(epoch: Optional[int]) -> Optional[str]:
+    if epoch is None:
+        return None
+    return datetime.datetime.fromtimestamp(epoch, TZ or datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+def epoch_to_local_day(epoch: int) -> str:
+    return datetime.datetime.fromtimestamp(epoch, TZ or datetime.timezone.utc).date().isoformat()
+
+
+def add_column_if_missing(cur: sqlite3.Cursor, table: str, column: str, decl: str) -> None:
+    cur.execute(f"PRAGMA table_info({table})")
+    if column in {row[1] for row in cur.fetchall()}:
+        return
+    try:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    except sqlite3.OperationalError as exc:
+        # Another process may have migrated the table concurrently
+        if 'duplicate column' not in str(exc):
+            raise
+
+
+def migration_applied(cur: sqlite3.Cursor, name: str) -> bool:
+    """Whether the one-time data migration `name` has already run on this database.
+
+    Backfills are recorded here so that create_tables(), which runs on every CLI
+    start, does not rescan large tables for NULL columns each time.
+    """
+    cur.execute("CREATE TABLE IF NOT EXISTS schema_migrations (name TEXT PRIMARY KEY, applied_at TEXT NOT NULL)")
+    cur.execute("SELECT 1 FROM schema_migrations WHERE name = ?", (name,))
+    return cur.fetchone() is not None
+
+
+def start_migration(cur: sqlite3.Cursor, name: str) -> bool:
+    """True when migration `name` still has to run; a write transaction is then open for it.
+
+    The marker is read again once the write lock is held, so two processes starting
+    together do not both run it. The schema changes, backfill and marker row are
+    committed together by the caller's ``with get_connection()`` block.
+    """
+    if migration_applied(cur, name):
+        return False
+    if not cur.connection.in_transaction:
+        cur.execute('BEGIN IMMEDIATE')
+    return not migration_applied(cur, name)
+
+
+def mark_migration_applied(cur: sqlite3.Cursor, name: str) -> None:
+    # Written in the same transaction as the backfill, so an interrupted run is retried
+    cur.execute("INSERT OR IGNORE INTO schema_migrations (name, applied_at) VALUES (?, ?)", (name, now_ts()))
+
+
+def ensure_notify_log_time_columns(cur: sqlite3.Cursor) -> None:
+    """Add created_at_epoch/created_day and backfill them once for legacy rows."""
+    add_column_if_missing(cur, 'notify_log_entries', 'created_at_epoch', 'INTEGER')
+    add_column_if_missing(cur, 'notify_log_entries', 'created_day', 'TEXT')
+    if migration_applied(cur, 'notify_log_time_columns'):
+        return
+
+    cur.execute("SELECT id, created_at FROM notify_log_entries WHERE created_at_epoch IS NULL OR created_day IS NULL")
+    updates = []
+    for row in cur.fetchall():
+        epoch = timestamp_to_epoch(row[1])
+        updates.append((epoch, epoch_to_local_day(epoch), row[0]))
+    if updates:
+        cur.executemany(
+            "UPDATE notify_log_entries SET created_at_epoch = ?, created_day = ? WHERE id = ?",
+            updates,
+        )
+    mark_migration_applied(cur, 'notify_log_time_columns')
+
+
+def ensure_ai_reminder_columns(cur: sqlite3.Cursor) -> None:
+    """Add the sortable fire_at_epoch column and backfill it once for legacy rows."""
+    add_column_if_missing(cur, 'ai_reminders', 'fire_at_epoch', 'INTEGER')
+    add_column_if_missing(cur, 'ai_reminders', 'lease_owner', 'TEXT')
+    add_column_if_missing(cur, 'ai_reminders', 'lease_expires_epoch', 'INTEGER')
+    add_column_if_missing(cur, 'ai_reminders', 'recurrence_json', 'TEXT')
+    if migration_applied(cur, 'ai_reminder_fire_at_epoch'):
+        return
+    cur.execute("SELECT id, fire_at FROM ai_reminders WHERE fire_at_epoch IS NULL")
+    updates = [(timestamp_to_epoch(row[1]), row[0]) for row in cur.fetchall()]
+    if updates:
+        cur.executemany("UPDATE ai_reminders SET fire_at_epoch = ? WHERE id = ?", updates)
+    mark_migration_applied(cur, 'ai_reminder_fire_at_epoch')
+
+
+def ensure_context_pending_columns(cur: sqlite3.Cursor) -> None:
+    """Add sortable entered/expires epoch columns to context_pending and backfill legacy rows."""
+    add_column_if_missing(cur, 'context_pending', 'entered_at_epoch', 'INTEGER')
+    add_column_if_missing(cur, 'context_pending', 'expires_at_epoch', 'INTEGER')
+    if migration_applied(cur, 'context_pending_epochs'):
+        return
+    cur.execute("SELECT id, entered_at, expires_at FROM context_pending WHERE entered_at_epoch IS NULL")
+    updates = [
+        (timestamp_to_epoch(row[1]), pending_expiry_epoch(row[2]), row[0])
+        for row in cur.fetchall()
+    ]
+    if updates:
+        cur.executemany(
+            "UPDATE context_pending SET entered_at_epoch = ?, expires_at_epoch = ? WHERE id = ?",
+            updates,
+        )
+    mark_migration_applied(cur, 'context_pending_epochs')
+
+
+def ensure_context_event_columns(cur: sqlite3.Cursor) -> None:
+    """Add the local created_day column used by event rollups and backfill it."""
+    add_column_if_missing(cur, 'context_events', 'created_day', 'TEXT')
+    if migration_applied(cur, 'context_events_created_day'):
+        return
+    cur.execute("SELECT id, created_at FROM context_events WHERE created_day IS NULL")
+    updates = [(epoch_to_local_day(timestamp_to_epoch(row[1])), row[0]) for row in cur.fetchall()]
+    if updates:
+        cur.executemany("UPDATE context_events SET created_day = ? WHERE id = ?", updates)
+    mark_migration_applied(cur, 'context_events_created_day')
+
+
+# Change counters for cached context data. 'config' covers modes and state,
+# 'pending' covers context_pending; both are bumped by triggers so every writer
+# (actions, sweeps, other processes) invalidates the cache.
+CONTEXT_VERSION_TABLES = {
+    'context_modes': 'config',
+    'context_state': 'config',
+    'context_pending': 'pending',
+}
+
+
+def ensure_context_versions(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS context_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """
+    )
+    # Random per-bump stamp: a counter value reused after a rollback or restore
+    # still gets a different stamp, so caches keyed on both never go stale
+    add_column_if_missing(cur, 'context_versions', 'stamp', 'INTEGER NOT NULL DEFAULT 0')
+    for name in set(CONTEXT_VERSION_TABLES.values()):
+        cur.execute("INSERT OR IGNORE INTO context_versions (name, version) VALUES (?, 0)", (name,))
+    for table, name in CONTEXT_VERSION_TABLES.items():
+        for op in ('insert', 'update', 'delete'):
+            trigger = f'trg_{table}_version_{op}'
+            cur.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (trigger,))
+            row = cur.fetchone()
+            if row is not None and 'stamp' not in row[0]:
+                cur.execute(f'DROP TRIGGER {trigger}')
+            cur.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS {trigger}
+                AFTER {op.upper()} ON {table}
+                BEGIN
+                    UPDATE context_versions SET version = version + 1, stamp = random() WHERE name = '{name}';
+                END
+                """
+            )
+
+
+def pending_expiry_epoch(expires_at: Optional[str]) -> Optional[int]:
+    """Epoch of expires_at, or None when the pending item never expires (or is unparseable)."""
+    if not expires_at:
+        return None
+    return timestamp_to_epoch(expires_at) or None
+
+
+NOTIFY_SEND_COUNTED = "{row}.decision = 'send' AND {row}.test = 0 AND {row}.manual_send = 0"
+
+
+def ensure_notify_send_counters(cur: sqlite3.Cursor) -> None:
+    """Per-user, per-day counter of automatic sends, maintained by triggers.
+
+    The table, triggers and backfill are created in one transaction, so a run that
+    fails part way leaves nothing behind and the next start repeats it in full.
+    """
+    if not start_migration(cur, 'notify_send_counters'):
+        return
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS notify_send_counters (
+            user_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+        """
+    )
+    new_counted = NOTIFY_SEND_COUNTED.format(row='NEW')
+    old_counted = NOTIFY_SEND_COUNTED.format(row='OLD')
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_notify_send_counter_insert AFTER INSERT ON notify_log_entries
+        WHEN {new_counted} BEGIN
+          INSERT INTO notify_send_counters(user_id, day, count) VALUES (NEW.user_id, NEW.created_day, 1)
+          ON CONFLICT(user_id, day) DO UPDATE SET count = count + 1;
+        END
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_notify_send_counter_update
+        AFTER UPDATE OF user_id, decision, test, manual_send, created_day ON notify_log_entries BEGIN
+          UPDATE notify_send_counters SET count = count - 1
+           WHERE user_id = OLD.user_id AND day = OLD.created_day AND {old_counted};
+          INSERT INTO notify_send_counters(user_id, day, count)
+          SELECT NEW.user_id, NEW.created_day, 1 WHERE {new_counted}
+          ON CONFLICT(user_id, day) DO UPDATE SET count = count + 1;
+        END
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_notify_send_counter_delete AFTER DELETE ON notify_log_entries
+        WHEN {old_counted} BEGIN
+          UPDATE notify_send_counters SET count = count - 1
+           WHERE user_id = OLD.user_id AND day = OLD.created_day;
+        END
+        """
+    )
+    # Recount from the log; also repairs counters left behind by an earlier, interrupted run
+    cur.execute(
+        f"""
+        INSERT INTO notify_send_counters(user_id, day, count)
+        SELECT user_id, created_day, COUNT(*)
+          FROM notify_log_entries
+         WHERE {NOTIFY_SEND_COUNTED.format(row='notify_log_entries')}
+         GROUP BY user_id, created_day
+        ON CONFLICT(user_id, day) DO UPDATE SET count = excluded.count
+        """
+    )
+    mark_migration_applied(cur, 'notify_send_counters')
+
+
+def ensure_notify_log_fts(cur: sqlite3.Cursor) -> bool:
+    """Create the trigram FTS index over notification title/body/reason.
+
+    The table, triggers and the indexing of existing rows are committed together,
+    so notify_log_fts only exists once it covers the whole log. Returns False when
+    the SQLite build lacks FTS5/trigram; searches then fall back to LIKE scans.
+    """
+    if not start_migration(cur, 'notify_log_fts'):
+        return True
+    try:
+        cur.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS notify_log_fts USING fts5(title, body, reason, tokenize = 'trigram')"
+        )
+    except sqlite3.OperationalError:
+        return False
+
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_notify_log_fts_insert AFTER INSERT ON notify_log_entries BEGIN
+          INSERT INTO notify_log_fts(rowid, title, body, reason)
+          VALUES (NEW.id, {NOTIFY_LOG_FTS_COLUMNS.format(row='NEW')});
+        END
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_notify_log_fts_update AFTER UPDATE OF payload_json, reason ON notify_log_entries BEGIN
+          DELETE FROM notify_log_fts WHERE rowid = OLD.id;
+          INSERT INTO notify_log_fts(rowid, title, body, reason)
+          VALUES (NEW.id, {NOTIFY_LOG_FTS_COLUMNS.format(row='NEW')});
+        END
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_notify_log_fts_delete AFTER DELETE ON notify_log_entries BEGIN
+          DELETE FROM notify_log_fts WHERE rowid = OLD.id;
+        END
+        """
+    )
+    # Reindex everything; an index left by an earlier, interrupted run may be missing rows
+    cur.execute("DELETE FROM notify_log_fts")
+    cur.execute(
+        f"""
+        INSERT INTO notify_log_fts(rowid, title, body, reason)
+        SELECT e.id, {NOTIFY_LOG_FTS_COLUMNS.format(row='e')}
+          FROM notify_log_entries e
+        """
+    )
+    mark_migration_applied(cur, 'notify_log_fts')
+    return True
+
+
+def has_notify_log_fts(conn: sqlite3.Connection) -> bool:
+    cur = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notify_log_fts'")
+    return cur.fetchone() is not None
+
+
+def fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def encode_log_cursor(row: sqlite3.Row) -> str:
+    return f"{row['created_at_epoch']}|{row['id']}"
+
+
+def decode_log_cursor(value: str) -> Tuple[int, int]:
+    epoch, sep, entry_id = str(value).rpartition('|')
+    if not sep or not entry_id.isdigit() or not epoch.lstrip('-').isdigit():
+        raise ValueError('invalid cursor')
+    return int(epoch), int(entry_id)
+
+
 def seed_defaults(cur: sqlite3.Cursor) -> None:
     cur.execute("SELECT 1 FROM context_modes WHERE mode_id = ?", ('default',))
     if cur.fetchone() is None:
@@ -357,18 +852,29 @@ def row_to_notify_entry(row: sqlite3.Row) -> Dict[str, Any]:
     }
 
 
+def lease_expired(lease_expires_epoch: Optional[int], now_epoch: Optional[int] = None) -> bool:
+    return lease_expires_epoch is not None and lease_expires_epoch <= (now_epoch or int(time.time()))
+
+
 def row_to_reminder(row: sqlite3.Row) -> Dict[str, Any]:
+    status, lease_owner, lease_expires = row['status'], row['lease_owner'], row['lease_expires_epoch']
+    if status == 'claimed' and lease_expired(lease_expires):
+        # A lease that ran out is free again; the row is only rewritten by the next claim
+        status, lease_owner, lease_expires = 'scheduled', None, None
     return {
         'id': row['id'],
         'user_id': row['user_id'],
         'fire_at': ensure_iso_timestamp(row['fire_at']),
-        'status': row['status'],
+        'status': status,
         'context': json_loads(row['context_json'], None),
         'purpose': row['purpose'],
         'created_by': row['created_by'],
         'created_at': ensure_iso_timestamp(row['created_at']),
         'updated_at': ensure_iso_timestamp(row['updated_at']),
         'meta': json_loads(row['meta_json'], None),
+        'lease_owner': lease_owner,
+        'lease_expires_at': epoch_to_iso(lease_expires),
+        'recurrence': json_loads(row['recurrence_json'], None),
     }
 
 
@@ -377,11 +883,101 @@ def row_to_reminder(row: sqlite3.Row) -> Dict[str, Any]:
 # ---------------------------------------------------------------------------
 
 
+# Decoded modes and state per database file, reused while the config counter and
+# its random stamp are unchanged. The stamp differs even when a counter value is
+# reached again after a rollback or restore. Only a process that keeps this module
+# loaded (ContextStore, batch runs) gets hits; each one-shot CLI call starts with
+# an empty cache and relies on the version/ETag check instead.
+_context_cache: Dict[str, Dict[str, Any]] = {}
+
+
+class FrozenDict(dict):
+    """Read-only dict for values shared through the config cache.
+
+    Still a dict, so json.dumps and isinstance checks keep working unchanged.
+    """
+
+    def _read_only(self, *args: Any, **kwargs: Any) -> None:
+        raise TypeError('cached context config is read-only; copy it before editing')
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return (FrozenDict, (dict(self),))
+
+
+def freeze_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze_value(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(freeze_value(v) for v in value)
+    return value
+
+
+def read_context_versions(conn: sqlite3.Connection) -> Dict[str, int]:
+    return {row[0]: row[1] for row in conn.execute("SELECT name, version FROM context_versions")}
+
+
+def connection_db_path(conn: sqlite3.Connection) -> str:
+    return conn.execute("PRAGMA database_list").fetchone()[2] or ''
+
+
+def load_context_config(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """Return the cache entry for this database, reloading it when the config changed.
+
+    The entry holds decoded ``modes``, ``mode_by_id`` and ``state``; use
+    cached_modes()/cached_mode() to get per-call copies. Nested values
+    (``knowledge_refs``, ``presentation``) are frozen and shared between callers
+    instead of being copied. Nothing is cached while a transaction is open,
+    since its writes may still be rolled back.
+
+    The cache only pays off inside one long-lived process such as ContextStore;
+    a one-shot CLI call always loads from the database.
+    """
+    path = connection_db_path(conn)
+    row = conn.execute("SELECT version, stamp FROM context_versions WHERE name = 'config'").fetchone()
+    key = (row[0], row[1]) if row else (0, 0)
+    entry = _context_cache.get(path)
+    if entry is not None and entry['key'] == key:
+        return entry
+
+    modes = tuple(
+        FrozenDict((k, freeze_value(v)) for k, v in row_to_mode(r).items())
+        for r in conn.execute("SELECT * FROM context_modes ORDER BY display_name")
+    )
+    state_row = conn.execute("SELECT * FROM context_state WHERE id = 1").fetchone()
+    if not state_row:
+        raise RuntimeError('context state not initialized')
+    entry = {
+        'key': key,
+        'modes': modes,
+        'mode_by_id': {mode['mode_id']: mode for mode in modes},
+        'state': FrozenDict(
+            active_mode_id=state_row['active_mode_id'],
+            manual_override_mode_id=state_row['manual_override_mode_id'],
+            active_since=ensure_iso_timestamp(state_row['active_since']),
+            updated_at=ensure_iso_timestamp(state_row['updated_at']),
+        ),
+    }
+    if not conn.in_transaction:
+        _context_cache[path] = entry
+    return entry
+
+
+def cached_modes(entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [dict(mode) for mode in entry['modes']]
+
+
+def cached_mode(entry: Dict[str, Any], mode_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    mode = entry['mode_by_id'].get(mode_id)
+    return dict(mode) if mode is not None else None
+
+
 def action_context_mode_list(params: Dict[str, Any]) -> Dict[str, Any]:
     with get_connection() as conn:
-        cur = conn.execute("SELECT * FROM context_modes ORDER BY display_name")
-        modes = [row_to_mode(r) for r in cur.fetchall()]
-    return {'modes': modes}
+        cached = load_context_config(conn)
+    return {'modes': cached_modes(cached)}
 
 
 def action_context_mode_get(params: Dict[str, Any]) -> Dict[str, Any]:
@@ -389,11 +985,8 @@ def action_context_mode_get(params: Dict[str, Any]) -> Dict[str, Any]:
     if not mode_id:
         raise ValueError('mode_id required')
     with get_connection() as conn:
-        cur = conn.execute("SELECT * FROM context_modes WHERE mode_id = ?", (mode_id,))
-        row = cur.fetchone()
-    if not row:
-        return {'mode': None}
-    return {'mode': row_to_mode(row)}
+        cached = load_context_config(conn)
+    return {'mode': cached_mode(cached, mode_id)}
 
 
 def action_context_mode_upsert(params: Dict[str, Any]) -> Dict[str, Any]:
@@ -480,25 +1073,139 @@ def action_context_mode_delete(params: Dict[str, Any]) -> Dict[str, Any]:
     return {'deleted': bool(deleted)}
 
 
+PENDING_STATE_DEFAULT_LIMIT = 100
+PENDING_STATE_MAX_LIMIT = 500
+
+
+def sweep_expired_pending(conn: sqlite3.Connection, now_epoch: Optional[int] = None,
+                          limit: Optional[int] = None) -> int:
+    """Transition open pending rows whose expires_at has passed to status 'expired'.
+
+    The probe is an index range scan on idx_context_pending_expiry; the write
+    transaction is only opened when at least one row has actually expired, so
+    calling this on every read stays cheap. Does not commit.
+    """
+    if now_epoch is None:
+        now_epoch = int(time.time())
+    probe = conn.execute(
+        """
+        SELECT 1 FROM context_pending
+         WHERE status = 'open' AND expires_at_epoch IS NOT NULL AND expires_at_epoch <= ?
+         LIMIT 1
+        """,
+        (now_epoch,),
+    ).fetchone()
+    if probe is None:
+        return 0
+    limit_clause = f'ORDER BY expires_at_epoch LIMIT {int(limit)}' if limit else ''
+    cur = conn.execute(
+        f"""
+        UPDATE context_pending
+           SET status = 'expired', resolved_at = ?, resolution = COALESCE(resolution, 'expired')
+         WHERE id IN (
+            SELECT id FROM context_pending
+             WHERE status = 'open' AND expires_at_epoch IS NOT NULL AND expires_at_epoch <= ?
+             {limit_clause}
+         )
+        """,
+        (now_ts(), now_epoch),
+    )
+    return cur.rowcount
+
+
+def action_context_pending_sweep(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Expire overdue open pending rows in bulk. ``now`` may override the reference time."""
+    now = params.get('now')
+    now_epoch = timestamp_to_epoch(now) if now else None
+    limit = params.get('limit')
+    with get_connection() as conn:
+        expired = sweep_expired_pending(conn, now_epoch, int(limit) if limit else None)
+        conn.commit()
+        remaining = conn.execute(
+            "SELECT COUNT(*) FROM context_pending WHERE status = 'open'"
+        ).fetchone()[0]
+    return {'expired': expired, 'open': remaining}
+
+
+def context_etag(versions: Dict[str, int], params: Dict[str, Any]) -> str:
+    """ETag for context.state_get / context.snapshot: table versions plus a hash of the params.
+
+    ``if_none_match`` and ``version`` are left out so the tag only changes with the data or
+    with request options such as ``limit`` and ``since``.
+    """
+    keyed = {key: value for key, value in params.items() if key not in ('if_none_match', 'version')}
+    return f"{versions.get('config', 0)}.{versions.get('pending', 0)}.{params_hash(keyed)[:8]}"
+
+
 def action_context_state_get(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Current state and open pending items, tagged with the same ETag as context.snapshot.
+
+    Pass the previous ``etag`` as ``if_none_match`` to get ``{"not_modified": true}``
+    without loading the state or pending rows.
+    """
+    limit = params.get('limit') or PENDING_STATE_DEFAULT_LIMIT
+    limit = max(1, min(int(limit), PENDING_STATE_MAX_LIMIT))
+    since = params.get('since')
+    known = params.get('if_none_match')
     with get_connection() as conn:
-        cur = conn.execute("SELECT * FROM context_state WHERE id = 1")
-        state_row = cur.fetchone()
-        if not state_row:
-            raise RuntimeError('context state not initialized')
-        state = {
-            'active_mode_id': state_row['active_mode_id'],
-            'manual_override_mode_id': state_row['manual_override_mode_id'],
-            'active_since': ensure_iso_timestamp(state_row['active_since']),
-            'updated_at': ensure_iso_timestamp(state_row['updated_at']),
-        }
+        if sweep_expired_pending(conn):
+            conn.commit()
+        versions = read_context_versions(conn)
+        etag = context_etag(versions, params)
+        if known is not None and str(known) == etag:
+            return {'not_modified': True, 'etag': etag}
+        state = dict(load_context_config(conn)['state'])
+        pending, has_more = fetch_open_pending(conn, limit, since)
 
-        pending_cur = conn.execute(
-            "SELECT * FROM context_pending WHERE status = 'open' ORDER BY entered_at"
-        )
-        pending = [row_to_pending(r) for r in pending_cur.fetchall()]
+    return {'etag': etag, 'state': state, 'pending': pending, 'pending_has_more': has_more}
 
-    return {'state': state, 'pending': pending}
+
+def fetch_open_pending(conn: sqlite3.Connection, limit: int,
+                       since: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool]:
+    clauses = ["status = 'open'"]
+    values: List[Any] = []
+    if since:
+        clauses.append('entered_at_epoch > ?')
+        values.append(timestamp_to_epoch(since))
+    rows = conn.execute(
+        f"""
+        SELECT * FROM context_pending
+         WHERE {' AND '.join(clauses)}
+         ORDER BY entered_at_epoch, id
+         LIMIT ?
+        """,
+        (*values, limit + 1),
+    ).fetchall()
+    return [row_to_pending(r) for r in rows[:limit]], len(rows) > limit
+
+
+def action_context_snapshot(params: Dict[str, Any]) -> Dict[str, Any]:
+    """State, active mode and open pending items in one read, tagged with an ETag.
+
+    Pass the previous ``etag`` as ``if_none_match`` (or ``version``) to get
+    ``{"not_modified": true}`` back when nothing changed.
+    """
+    limit = params.get('limit') or PENDING_STATE_DEFAULT_LIMIT
+    limit = max(1, min(int(limit), PENDING_STATE_MAX_LIMIT))
+    known = params.get('if_none_match') or params.get('version')
+    with get_connection() as conn:
+        if sweep_expired_pending(conn):
+            conn.commit()
+        versions = read_context_versions(conn)
+        etag = context_etag(versions, params)
+        if known is not None and str(known) == etag:
+            return {'not_modified': True, 'etag': etag}
+        cached = load_context_config(conn)
+        pending, has_more = fetch_open_pending(conn, limit)
+
+    state = dict(cached['state'])
+    return {
+        'etag': etag,
+        'state': state,
+        'active_mode': cached_mode(cached, state['active_mode_id']),
+        'pending': pending,
+        'pending_has_more': has_more,
+    }
 
 
 def action_context_state_set(params: Dict[str, Any]) -> Dict[str, Any]:
@@ -566,8 +1273,9 @@ def action_context_pending_create(params: Dict[str, Any]) -> Dict[str, Any]:
             """
             INSERT OR REPLACE INTO context_pending (
                 id, mode_id, source, payload_json, entered_at,
-                expires_at, status, resolved_at, resolution
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                expires_at, status, resolved_at, resolution,
+                entered_at_epoch, expires_at_epoch
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 pending_id,
@@ -579,6 +1287,8 @@ def action_context_pending_create(params: Dict[str, Any]) -> Dict[str, Any]:
                 status,
                 params.get('resolved_at'),
                 params.get('resolution'),
+                timestamp_to_epoch(entered_at),
+                pending_expiry_epoch(expires_at),
             ),
         )
         conn.commit()
@@ -607,6 +1317,10 @@ def action_context_pending_update(params: Dict[str, Any]) -> Dict[str, Any]:
             updates[key] = params[key]
     if payload is not None:
         updates['payload_json'] = json_dumps(payload)
+    if 'entered_at' in updates:
+        updates['entered_at_epoch'] = timestamp_to_epoch(updates['entered_at'])
+    if 'expires_at' in updates:
+        updates['expires_at_epoch'] = pending_expiry_epoch(updates['expires_at'])
 
     if not updates:
         return {'pending': row_to_pending(fetch_pending_row(pending_id))}
@@ -638,14 +1352,60 @@ def action_context_pending_list(params: Dict[str, Any]) -> Dict[str, Any]:
     where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
 
     with get_connection() as conn:
+        if sweep_expired_pending(conn):
+            conn.commit()
         cur = conn.execute(
-            f"SELECT * FROM context_pending {where} ORDER BY entered_at DESC LIMIT ? OFFSET ?",
+            f"SELECT * FROM context_pending {where} ORDER BY entered_at_epoch DESC, id DESC LIMIT ? OFFSET ?",
             (*values, limit, offset),
         )
         rows = cur.fetchall()
     return {'pending': [row_to_pending(r) for r in rows]}
 
 
+# context_events is a bounded ring buffer: once more than CONTEXT_EVENTS_CAPACITY
+# rows are stored, the oldest ones (by id) are folded into context_event_rollups
+# and deleted. Trimming runs in batches so appends stay O(1) amortized.
+def env_positive_int(name: str, default: int) -> int:
+    """Positive integer setting from the environment; unset or invalid values use the default."""
+    try:
+        value = int(os.environ.get(name, default))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+CONTEXT_EVENTS_CAPACITY = env_positive_int('CONTEXT_EVENTS_CAPACITY', 5000)
+CONTEXT_EVENTS_TRIM_BATCH = 500
+
+
+def trim_context_events(conn: sqlite3.Connection, newest_id: int, force: bool = False) -> int:
+    """Roll up and delete events older than the ring buffer window. Does not commit."""
+    cutoff = newest_id - CONTEXT_EVENTS_CAPACITY
+    if cutoff <= 0:
+        return 0
+    oldest = conn.execute("SELECT MIN(id) FROM context_events").fetchone()[0]
+    if oldest is None or oldest > cutoff:
+        return 0
+    if not force and cutoff - oldest + 1 < CONTEXT_EVENTS_TRIM_BATCH:
+        return 0
+    conn.execute(
+        """
+        INSERT INTO context_event_rollups (day, event_type, mode_id, count, first_id, last_id)
+        SELECT created_day, event_type, COALESCE(mode_id, ''), COUNT(*), MIN(id), MAX(id)
+          FROM context_events
+         WHERE id <= ?
+         GROUP BY created_day, event_type, COALESCE(mode_id, '')
+        ON CONFLICT(day, event_type, mode_id) DO UPDATE SET
+            count = count + excluded.count,
+            first_id = MIN(first_id, excluded.first_id),
+            last_id = MAX(last_id, excluded.last_id)
+        """,
+        (cutoff,),
+    )
+    cur = conn.execute("DELETE FROM context_events WHERE id <= ?", (cutoff,))
+    return cur.rowcount
+
+
 def action_context_events_append(params: Dict[str, Any]) -> Dict[str, Any]:
     event_type = params.get('event_type')
     if not event_type:
@@ -656,10 +1416,10 @@ def action_context_events_append(params: Dict[str, Any]) -> Dict[str, Any]:
     now = now_ts()
 
     with get_connection() as conn:
-        conn.execute(
+        cur = conn.execute(
             """
-            INSERT INTO context_events (event_type, mode_id, payload_json, source, created_at)
-            VALUES (?, ?, ?, ?, ?)
+            INSERT INTO context_events (event_type, mode_id, payload_json, source, created_at, created_day)
+            VALUES (?, ?, ?, ?, ?, ?)
             """,
             (
                 event_type,
@@ -667,22 +1427,102 @@ def action_context_events_append(params: Dict[str, Any]) -> Dict[str, Any]:
                 json_dumps(payload) if payload is not None else None,
                 source,
                 now,
+                epoch_to_local_day(timestamp_to_epoch(now)),
             ),
         )
+        event_id = cur.lastrowid
+        trim_context_events(conn, event_id)
         conn.commit()
 
-    return {'ok': True}
+    return {'ok': True, 'id': event_id}
 
 
 def action_context_events_recent(params: Dict[str, Any]) -> Dict[str, Any]:
     limit = params.get('limit') or 100
+    before_id = params.get('before_id')
+    with get_connection() as conn:
+        if before_id:
+            cur = conn.execute(
+                "SELECT * FROM context_events WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (int(before_id), limit),
+            )
+        else:
+            cur = conn.execute(
+                "SELECT * FROM context_events ORDER BY id DESC LIMIT ?",
+                (limit,),
+            )
+        rows = cur.fetchall()
+    return {'events': [row_to_event(r) for r in rows]}
+
+
+def action_context_events_stats(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Event counts per day / type / mode, combining rollups with the live ring buffer.
+
+    Params: ``from`` / ``to`` (YYYY-MM-DD, inclusive), ``event_type``, ``mode_id``,
+    ``group_by`` (subset of ['day', 'event_type', 'mode_id'], default all three).
+    """
+    group_by = params.get('group_by') or ['day', 'event_type', 'mode_id']
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    allowed = ('day', 'event_type', 'mode_id')
+    for key in group_by:
+        if key not in allowed:
+            raise ValueError(f"group_by must be a subset of {', '.join(allowed)}")
+
+    clauses = []
+    values: List[Any] = []
+    if params.get('from'):
+        clauses.append('day >= ?')
+        values.append(resolve_target_day(params['from']).isoformat())
+    if params.get('to'):
+        clauses.append('day <= ?')
+        values.append(resolve_target_day(params['to']).isoformat())
+    if params.get('event_type'):
+        clauses.append('event_type = ?')
+        values.append(params['event_type'])
+    if params.get('mode_id'):
+        clauses.append('mode_id = ?')
+        values.append(params['mode_id'])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    columns = ', '.join(group_by)
+    select_columns = f'{columns}, ' if group_by else ''
+    group_clause = f'GROUP BY {columns} ORDER BY {columns}' if group_by else ''
+
     with get_connection() as conn:
         cur = conn.execute(
-            "SELECT * FROM context_events ORDER BY created_at DESC LIMIT ?",
-            (limit,),
+            f"""
+            SELECT {select_columns}SUM(count) AS count
+              FROM (
+                SELECT day, event_type, mode_id, count FROM context_event_rollups
+                UNION ALL
+                SELECT created_day AS day, event_type, COALESCE(mode_id, '') AS mode_id, COUNT(*) AS count
+                  FROM context_events
+                 GROUP BY created_day, event_type, COALESCE(mode_id, '')
+              )
+            {where}
+            {group_clause}
+            """,
+            values,
         )
         rows = cur.fetchall()
-    return {'events': [row_to_event(r) for r in rows]}
+        bounds = conn.execute("SELECT MIN(id), MAX(id), COUNT(*) FROM context_events").fetchone()
+
+    stats = []
+    for row in rows:
+        item = {key: row[key] for key in group_by}
+        if 'mode_id' in item and item['mode_id'] == '':
+            item['mode_id'] = None
+        item['count'] = row['count'] or 0
+        stats.append(item)
+    return {
+        'stats': stats,
+        'buffer': {
+            'capacity': CONTEXT_EVENTS_CAPACITY,
+            'size': bounds[2],
+            'oldest_id': bounds[0],
+            'newest_id': bounds[1],
+        },
+    }
 
 
 def action_notify_log_append(params: Dict[str, Any]) -> Dict[str, Any]:
@@ -700,6 +1540,7 @@ def action_notify_log_append(params: Dict[str, Any]) -> Dict[str, Any]:
     test = 1 if params.get('test') else 0
     manual_send = 1 if params.get('manual_send') else 0
     created_at = params.get('created_at') or now_ts()
+    created_at_epoch = timestamp_to_epoch(created_at)
 
     with get_connection() as conn:
         cur = conn.cursor()
@@ -708,8 +1549,8 @@ def action_notify_log_append(params: Dict[str, Any]) -> Dict[str, Any]:
             INSERT INTO notify_log_entries (
                 user_id, decision, reason, source, mode_id,
                 payload_json, context_json, triggered_at, created_at,
-                resend_of, test, manual_send
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                resend_of, test, manual_send, created_at_epoch, created_day
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 user_id,
@@ -724,6 +1565,8 @@ def action_notify_log_append(params: Dict[str, Any]) -> Dict[str, Any]:
                 resend_of,
                 test,
                 manual_send,
+                created_at_epoch,
+                epoch_to_local_day(created_at_epoch),
             ),
         )
         inserted_id = cur.lastrowid
@@ -745,13 +1588,24 @@ def action_notify_log_get(params: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def action_notify_log_list(params: Dict[str, Any]) -> Dict[str, Any]:
+    """List notification history, newest first.
+
+    Pagination is either offset-based (``offset``) or keyset-based (``cursor``,
+    taken from a previous response's ``next_cursor``). ``total`` selects how the
+    total is computed: ``exact`` (default), ``estimate`` (counts up to
+    NOTIFY_LOG_COUNT_CAP rows) or ``none``. ``fields`` trims each entry to
+    the listed keys.
+    """
     user_id = params.get('user_id') or 'local'
     limit = int(params.get('limit') or 10)
     offset = int(params.get('offset') or 0)
+    cursor = params.get('cursor')
+    total_mode = (params.get('total') or 'exact').lower()
     search = params.get('search')
     decision = params.get('decision')
     mode_id = params.get('mode_id')
     source = params.get('source')
+    fields = parse_fields(params)
 
     clauses = ['user_id = ?']
     values: List[Any] = [user_id]
@@ -764,89 +1618,98 @@ def action_notify_log_list(params: Dict[str, Any]) -> Dict[str, Any]:
     if source:
         clauses.append('source = ?')
         values.append(source)
-    if search:
-        clauses.append("(COALESCE(reason, '') LIKE ? OR COALESCE(payload_json, '') LIKE ?)")
-        search_term = f'%{search}%'
-        values.extend([search_term, search_term])
-
-    where_clause = 'WHERE ' + ' AND '.join(clauses)
 
     with get_connection() as conn:
-        cur = conn.execute(
-            f"SELECT COUNT(*) FROM notify_log_entries {where_clause}",
-            tuple(values),
-        )
-        total = cur.fetchone()[0]
+        if search:
+            search = str(search).strip()
+        if search and len(search) >= NOTIFY_LOG_FTS_MIN_TERM and has_notify_log_fts(conn):
+            clauses.append('id IN (SELECT rowid FROM notify_log_fts WHERE notify_log_fts MATCH ?)')
+            values.append(fts_phrase(search))
+        elif search:
+            clauses.append("(COALESCE(reason, '') LIKE ? OR COALESCE(payload_json, '') LIKE ?)")
+            search_term = f'%{search}%'
+            values.extend([search_term, search_term])
+
+        where_clause = 'WHERE ' + ' AND '.join(clauses)
+
+        total: Optional[int] = None
+        total_estimated = False
+        if total_mode == 'exact':
+            cur = conn.execute(
+                f"SELECT COUNT(*) FROM notify_log_entries {where_clause}",
+                tuple(values),
+            )
+            total = cur.fetchone()[0]
+        elif total_mode == 'estimate':
+            cur = conn.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM notify_log_entries {where_clause} LIMIT ?)",
+                tuple(values + [NOTIFY_LOG_COUNT_CAP + 1]),
+            )
+            total = cur.fetchone()[0]
+            if total > NOTIFY_LOG_COUNT_CAP:
+                total = NOTIFY_LOG_COUNT_CAP
+                total_estimated = True
+
+        page_clause = where_clause
+        page_values = list(values)
+        if cursor:
+            cursor_epoch, cursor_id = decode_log_cursor(cursor)
+            page_clause += ' AND (created_at_epoch < ? OR (created_at_epoch = ? AND id < ?))'
+            page_values.extend([cursor_epoch, cursor_epoch, cursor_id])
+            offset = 0
 
         cur = conn.execute(
             f"""
             SELECT * FROM notify_log_entries
-            {where_clause}
-            ORDER BY created_at DESC, id DESC
+            {page_clause}
+            ORDER BY created_at_epoch DESC, id DESC
             LIMIT ? OFFSET ?
             """,
-            tuple(values + [limit, offset]),
+            tuple(page_values + [limit + 1, offset]),
         )
         rows = cur.fetchall()
 
-    return {
-        'entries': [row_to_notify_entry(r) for r in rows],
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    result = {
+        'entries': [project_fields(row_to_notify_entry(r), fields) for r in rows],
         'total': total,
         'limit': limit,
         'offset': offset,
+        'has_more': has_more,
+        'next_cursor': encode_log_cursor(rows[-1]) if has_more and rows else None,
     }
+    if total_estimated:
+        result['total_estimated'] = True
+    return result
 
 
-def action_notify_log_today_stats(params: Dict[str, Any]) -> Dict[str, Any]:
-    user_id = params.get('user_id') or 'local'
-    date = params.get('date')
+def resolve_target_day(date: Optional[str]) -> datetime.date:
     if date:
-        target_date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
-    else:
-        target_date = datetime.datetime.now(TZ).date() if TZ else datetime.datetime.utcnow().date()
-    tz = TZ or datetime.timezone.utc
-    day_start = datetime.datetime.combine(target_date, datetime.time.min).replace(tzinfo=tz)
-    day_end = datetime.datetime.combine(target_date, datetime.time.max).replace(tzinfo=tz)
-    start_str = day_start.isoformat(timespec='seconds')
-    end_str = day_end.isoformat(timespec='seconds')
+        return datetime.datetime.strptime(date, '%Y-%m-%d').date()
+    return datetime.datetime.now(TZ).date() if TZ else datetime.datetime.utcnow().date()
+
 
-    legacy_start = day_start.strftime('%Y-%m-%d %H:%M:%S')
-    legacy_end = day_end.strftime('%Y-%m-%d %H:%M:%S')
+def action_notify_log_today_stats(params: Dict[str, Any]) -> Dict[str, Any]:
+    user_id = params.get('user_id') or 'local'
+    target_date = resolve_target_day(params.get('date'))
 
     with get_connection() as conn:
         cur = conn.execute(
-            """
-            SELECT COUNT(*)
-              FROM notify_log_entries
-             WHERE user_id = ?
-               AND decision = 'send'
-               AND test = 0
-               AND manual_send = 0
-               AND (
-                    created_at BETWEEN ? AND ?
-                 OR created_at BETWEEN ? AND ?
-               )
-            """,
-            (user_id, start_str, end_str, legacy_start, legacy_end),
+            "SELECT count FROM notify_send_counters WHERE user_id = ? AND day = ?",
+            (user_id, target_date.isoformat()),
         )
-        count = cur.fetchone()[0]
+        row = cur.fetchone()
 
-    return {'user_id': user_id, 'date': target_date.isoformat(), 'count': count}
+    return {'user_id': user_id, 'date': target_date.isoformat(), 'count': row[0] if row else 0}
 
 
 def action_notify_log_mark_test(params: Dict[str, Any]) -> Dict[str, Any]:
     user_id = params.get('user_id') or 'local'
-    date = params.get('date')
-    if date:
-        target_date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
-    else:
-        target_date = datetime.datetime.now(TZ).date() if TZ else datetime.datetime.utcnow().date()
+    target_date = resolve_target_day(params.get('date'))
     tz = TZ or datetime.timezone.utc
-    day_start = datetime.datetime.combine(target_date, datetime.time.min).replace(tzinfo=tz).isoformat(timespec='seconds')
-    day_end = datetime.datetime.combine(target_date, datetime.time.max).replace(tzinfo=tz).isoformat(timespec='seconds')
-
-    legacy_start = datetime.datetime.combine(target_date, datetime.time.min).strftime('%Y-%m-%d %H:%M:%S')
-    legacy_end = datetime.datetime.combine(target_date, datetime.time.max).strftime('%Y-%m-%d %H:%M:%S')
+    day_start = datetime.datetime.combine(target_date, datetime.time.min).replace(tzinfo=tz)
+    day_end = day_start + datetime.timedelta(days=1)
 
     with get_connection() as conn:
         cur = conn.execute(
@@ -854,12 +1717,10 @@ def action_notify_log_mark_test(params: Dict[str, Any]) -> Dict[str, Any]:
             UPDATE notify_log_entries
                SET test = 1
              WHERE user_id = ?
-               AND (
-                    created_at BETWEEN ? AND ?
-                 OR created_at BETWEEN ? AND ?
-               )
+               AND created_at_epoch >= ?
+               AND created_at_epoch < ?
             """,
-            (user_id, day_start, day_end, legacy_start, legacy_end),
+            (user_id, int(day_start.timestamp()), int(day_end.timestamp())),
         )
         changed = cur.rowcount
         conn.commit()
@@ -867,6 +1728,227 @@ def action_notify_log_mark_test(params: Dict[str, Any]) -> Dict[str, Any]:
     return {'changed': changed}
 
 
+# ---------------------------------------------------------------------------
+# Recurring reminders
+# ---------------------------------------------------------------------------
+#
+# A recurring reminder is stored as a single ai_reminders row. Its fire_at /
+# fire_at_epoch always point at the next pending occurrence, so the due, next
+# and claim paths keep using idx_ai_reminders_schedule unchanged. Handling an
+# occurrence (ack or a status update) records it in ai_reminder_occurrences
+# and advances the row to the following occurrence.
+
+WEEKDAY_NAMES = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+RECURRENCE_FREQS = ('daily', 'weekly', 'interval')
+REMINDER_SERIES_END_STATUSES = ('cancelled', 'canceled', 'deleted')
+
+
+def normalize_recurrence(rule: Any, start: str) -> Dict[str, Any]:
+    """Validate a recurrence rule and anchor it at ``start`` (ISO timestamp).
+
+    Supported rules::
+
+        {"freq": "daily", "interval": 1, "by_weekday": ["mon", "wed"]}
+        {"freq": "weekly", "interval": 2, "by_weekday": [0, 3]}
+        {"freq": "interval", "interval": 90}   # minutes
+
+    plus optional ``until`` (timestamp) and ``count`` (max occurrences).
+    """
+    if not isinstance(rule, dict):
+        raise ValueError('recurrence must be an object')
+    freq = str(rule.get('freq') or '').lower()
+    if freq not in RECURRENCE_FREQS:
+        raise ValueError(f"recurrence.freq must be one of {', '.join(RECURRENCE_FREQS)}")
+    interval = int(rule.get('interval') or 1)
+    if interval < 1:
+        raise ValueError('recurrence.interval must be >= 1')
+
+    weekdays: List[int] = []
+    for value in rule.get('by_weekday') or []:
+        if isinstance(value, str) and value[:3].lower() in WEEKDAY_NAMES:
+            weekdays.append(WEEKDAY_NAMES.index(value[:3].lower()))
+        elif isinstance(value, int) and 0 <= value <= 6:
+            weekdays.append(value)
+        else:
+            raise ValueError(f'invalid recurrence.by_weekday value: {value}')
+    if weekdays and freq == 'interval':
+        raise ValueError('recurrence.by_weekday is not supported for interval')
+
+    normalized: Dict[str, Any] = {'freq': freq, 'interval': interval, 'start': start}
+    if weekdays:
+        normalized['by_weekday'] = sorted(set(weekdays))
+    if rule.get('until'):
+        until = ensure_iso_timestamp(rule['until'])
+        normalized['until'] = until
+        normalized['until_epoch'] = timestamp_to_epoch(until)
+    if rule.get('count') is not None:
+        count = int(rule['count'])
+        if count < 1:
+            raise ValueError('recurrence.count must be >= 1')
+        normalized['count'] = count
+    return normalized
+
+
+def iter_occurrences(rule: Dict[str, Any], skip_to: Optional[int] = None) -> Iterable[int]:
+    """Yield occurrence epochs in order, lazily.
+
+    ``skip_to`` lets unbounded series jump close to a point in time instead of
+    walking from the anchor; series with ``count`` always walk from the start
+    so the count stays exact.
+    """
+    tz = TZ or datetime.timezone.utc
+    start_epoch = timestamp_to_epoch(rule['start'])
+    start = datetime.datetime.fromtimestamp(start_epoch, tz)
+    interval = rule['interval']
+    until = rule.get('until_epoch')
+    count = rule.get('count')
+    if count:
+        skip_to = None
+    emitted = 0
+
+    if rule['freq'] == 'interval':
+        step = interval * 60
+        k = max(0, (skip_to - start_epoch) // step) if skip_to else 0
+        while True:
+            epoch = start_epoch + k * step
+            if until and epoch > until:
+                return
+            yield epoch
+            emitted += 1
+            if count and emitted >= count:
+                return
+            k += 1
+
+    weekdays = set(rule.get('by_weekday') or [])
+    if rule['freq'] == 'weekly' and not weekdays:
+        weekdays = {start.weekday()}
+    first_day = start.date()
+    first_week = first_day - datetime.timedelta(days=first_day.weekday())
+    day = first_day
+    if skip_to:
+        day = max(first_day, datetime.datetime.fromtimestamp(skip_to, tz).date() - datetime.timedelta(days=1))
+    # A rule whose weekdays never line up with its interval must not spin forever
+    idle_limit = 7 * interval * 2
+    idle = 0
+    while True:
+        if idle > idle_limit:
+            return
+        idle += 1
+        if rule['freq'] == 'daily':
+            aligned = (day - first_day).days % interval == 0
+        else:
+            week = day - datetime.timedelta(days=day.weekday())
+            aligned = ((week - first_week).days // 7) % interval == 0
+        if aligned and (not weekdays or day.weekday() in weekdays):
+            epoch = int(datetime.datetime.combine(day, start.time(), tzinfo=tz).timestamp())
+            if until and epoch > until:
+                return
+            if epoch >= start_epoch:
+                idle = 0
+                yield epoch
+                emitted += 1
+                if count and emitted >= count:
+                    return
+        day += datetime.timedelta(days=1)
+
+
+def next_occurrence(conn: sqlite3.Connection, reminder_id: str, rule: Dict[str, Any], after_epoch: int) -> Optional[int]:
+    """First occurrence after ``after_epoch`` that has no recorded state (skipped/fired)."""
+    cur = conn.execute(
+        "SELECT occurrence_epoch FROM ai_reminder_occurrences WHERE reminder_id = ? AND occurrence_epoch > ?",
+        (reminder_id, after_epoch),
+    )
+    handled = {row[0] for row in cur.fetchall()}
+    for epoch in iter_occurrences(rule, skip_to=after_epoch):
+        if epoch > after_epoch and epoch not in handled:
+            return epoch
+    return None
+
+
+def record_occurrence(conn: sqlite3.Connection, reminder_id: str, occurrence_epoch: int,
+                      status: str, meta: Any = None) -> None:
+    conn.execute(
+        """
+        INSERT INTO ai_reminder_occurrences (reminder_id, occurrence_epoch, status, meta_json, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(reminder_id, occurrence_epoch) DO UPDATE SET
+            status = excluded.status,
+            meta_json = COALESCE(excluded.meta_json, meta_json),
+            updated_at = excluded.updated_at
+        """,
+        (reminder_id, occurrence_epoch, status, json_dumps(meta) if meta is not None else None, now_ts()),
+    )
+
+
+def advance_recurring_reminder(conn: sqlite3.Connection, row: sqlite3.Row, status: str) -> None:
+    """Record the row's current occurrence as ``status`` and move on to the next one.
+
+    Occurrences missed while nothing was polling are collapsed: the series
+    resumes at the first occurrence after now. When the series is exhausted
+    the row itself takes ``status``.
+    """
+    rule = json_loads(row['recurrence_json'], None)
+    current = row['fire_at_epoch']
+    record_occurrence(conn, row['id'], current, status)
+    following = next_occurrence(conn, row['id'], rule, max(current, int(time.time())))
+    now = now_ts()
+    if following is None:
+        conn.execute(
+            """
+            UPDATE ai_reminders
+               SET status = ?, lease_owner = NULL, lease_expires_epoch = NULL, updated_at = ?
+             WHERE id = ?
+            """,
+            (status, now, row['id']),
+        )
+        return
+    conn.execute(
+        """
+        UPDATE ai_reminders
+           SET status = 'scheduled', fire_at = ?, fire_at_epoch = ?,
+               lease_owner = NULL, lease_expires_epoch = NULL, updated_at = ?
+         WHERE id = ?
+        """,
+        (epoch_to_iso(following), following, now, row['id']),
+    )
+
+
+def action_ai_reminder_occurrences(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Preview upcoming occurrences of a reminder merged with recorded occurrence state."""
+    reminder_id = params.get('id')
+    if not reminder_id:
+        raise ValueError('id required')
+    limit = max(1, min(int(params.get('limit') or 10), 500))
+    since = params.get('since')
+    with get_connection() as conn:
+        row = conn.execute("SELECT * FROM ai_reminders WHERE id = ?", (reminder_id,)).fetchone()
+        if not row:
+            return {'occurrences': []}
+        states = {
+            r['occurrence_epoch']: r
+            for r in conn.execute(
+                "SELECT * FROM ai_reminder_occurrences WHERE reminder_id = ?", (reminder_id,)
+            ).fetchall()
+        }
+    rule = json_loads(row['recurrence_json'], None)
+    if not rule:
+        return {'occurrences': [{'fire_at': ensure_iso_timestamp(row['fire_at']), 'status': row['status']}]}
+    since_epoch = timestamp_to_epoch(since) if since else row['fire_at_epoch']
+    occurrences = []
+    for epoch in iter_occurrences(rule, skip_to=since_epoch):
+        if epoch < since_epoch:
+            continue
+        state = states.get(epoch)
+        occurrences.append({
+            'fire_at': epoch_to_iso(epoch),
+            'status': state['status'] if state else ('scheduled' if epoch >= row['fire_at_epoch'] else 'missed'),
+            'meta': json_loads(state['meta_json'], None) if state else None,
+        })
+        if len(occurrences) >= limit:
+            break
+    return {'occurrences': occurrences}
+
+
 def action_ai_reminder_create(params: Dict[str, Any]) -> Dict[str, Any]:
     reminder_id = params.get('id') or str(uuid.uuid4())
     user_id = params.get('user_id') or 'local'
@@ -883,13 +1965,25 @@ def action_ai_reminder_create(params: Dict[str, Any]) -> Dict[str, Any]:
     created_at = ensure_iso_timestamp(params.get('created_at')) or now
     updated_at = ensure_iso_timestamp(params.get('updated_at')) or now
 
+    recurrence = None
+    fire_at_epoch = timestamp_to_epoch(fire_at)
+    if params.get('recurrence'):
+        recurrence = normalize_recurrence(params['recurrence'], fire_at)
+        first = next(iter(iter_occurrences(recurrence)), None)
+        if first is None:
+            raise ValueError('recurrence produces no occurrences')
+        fire_at_epoch = first
+        fire_at = epoch_to_iso(first)
+
     with get_connection() as conn:
+        conn.execute("DELETE FROM ai_reminder_occurrences WHERE reminder_id = ?", (reminder_id,))
         conn.execute(
             """
             INSERT OR REPLACE INTO ai_reminders (
                 id, user_id, fire_at, status, context_json,
-                purpose, created_by, created_at, updated_at, meta_json
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                purpose, created_by, created_at, updated_at, meta_json,
+                fire_at_epoch, recurrence_json
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 reminder_id,
@@ -902,6 +1996,8 @@ def action_ai_reminder_create(params: Dict[str, Any]) -> Dict[str, Any]:
                 created_at,
                 updated_at,
                 json_dumps(meta) if meta is not None else None,
+                fire_at_epoch,
+                json_dumps(recurrence) if recurrence else None,
             ),
         )
         conn.commit()
@@ -921,36 +2017,114 @@ def action_ai_reminder_get(params: Dict[str, Any]) -> Dict[str, Any]:
     return {'reminder': row_to_reminder(row)}
 
 
-def action_ai_reminder_update(params: Dict[str, Any]) -> Dict[str, Any]:
-    reminder_id = params.get('id')
-    if not reminder_id:
-        raise ValueError('id required')
+def update_recurring_reminder(conn: sqlite3.Connection, row: sqlite3.Row, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply occurrence-level parts of an update to a recurring reminder.
 
+    Returns the column updates still to be applied to the series row.
+    """
     updates: Dict[str, Any] = {}
-    for key in ['status', 'purpose', 'created_by']:
-        if key in params and params[key] is not None:
-            updates[key] = params[key]
-    if 'fire_at' in params and params['fire_at'] is not None:
-        fire_at = ensure_iso_timestamp(params['fire_at'])
-        if not fire_at:
-            raise ValueError('invalid fire_at')
-        updates['fire_at'] = fire_at
-    if 'context' in params:
-        updates['context_json'] = json_dumps(params['context']) if params['context'] is not None else None
-    if 'meta' in params:
-        updates['meta_json'] = json_dumps(params['meta']) if params['meta'] is not None else None
-    if not updates:
-        return action_ai_reminder_get({'id': reminder_id})
+    rule = json_loads(row['recurrence_json'], None)
+    status = params.get('status')
+    occurrence_at = params.get('occurrence_at')
+
+    if 'recurrence' in params or params.get('fire_at') is not None:
+        start = ensure_iso_timestamp(params.get('fire_at')) or rule['start']
+        new_rule = params['recurrence'] if 'recurrence' in params else rule
+        if not new_rule:
+            # Recurrence removed: becomes a one-shot reminder at fire_at
+            updates['recurrence_json'] = None
+            updates['fire_at'] = start
+            updates['fire_at_epoch'] = timestamp_to_epoch(start)
+        else:
+            rule = normalize_recurrence(new_rule, start)
+            first = next_occurrence(conn, row['id'], rule, max(timestamp_to_epoch(start), int(time.time())) - 1)
+            if first is None:
+                raise ValueError('recurrence produces no further occurrences')
+            updates['recurrence_json'] = json_dumps(rule)
+            updates['fire_at'] = epoch_to_iso(first)
+            updates['fire_at_epoch'] = first
+
+    if occurrence_at:
+        # Override a single occurrence (e.g. status 'skipped')
+        occurrence_epoch = timestamp_to_epoch(ensure_iso_timestamp(occurrence_at))
+        record_occurrence(conn, row['id'], occurrence_epoch, status or 'skipped', params.get('occurrence_meta'))
+        if occurrence_epoch == row['fire_at_epoch'] and 'fire_at_epoch' not in updates:
+            following = next_occurrence(conn, row['id'], rule, occurrence_epoch)
+            if following is None:
+                updates['status'] = status or 'skipped'
+            else:
+                updates['fire_at'] = epoch_to_iso(following)
+                updates['fire_at_epoch'] = following
+        return updates
+
+    if status and status not in ('scheduled', 'claimed') and status not in REMINDER_SERIES_END_STATUSES:
+        if row['status'] in ('scheduled', 'claimed') and row['fire_at_epoch'] <= int(time.time()):
+            # The current occurrence was handled: record it and advance the series
+            advance_recurring_reminder(conn, row, status)
+            return updates
+        latest = conn.execute(
+            """
+            SELECT occurrence_epoch FROM ai_reminder_occurrences
+             WHERE reminder_id = ? AND occurrence_epoch < ?
+             ORDER BY occurrence_epoch DESC LIMIT 1
+            """,
+            (row['id'], row['fire_at_epoch']),
+        ).fetchone()
+        if latest and row['status'] == 'scheduled':
+            # Follow-up status for the occurrence that was just handled
+            record_occurrence(conn, row['id'], latest[0], status)
+            return updates
 
-    updates['updated_at'] = now_ts()
+    if status:
+        updates['status'] = status
+    return updates
 
-    set_clause = ', '.join(f"{col} = ?" for col in updates.keys())
-    values = list(updates.values())
-    values.append(reminder_id)
 
+def action_ai_reminder_update(params: Dict[str, Any]) -> Dict[str, Any]:
+    reminder_id = params.get('id')
+    if not reminder_id:
+        raise ValueError('id required')
+
+    # Series fields and plain columns are written in one transaction, so a failure
+    # part-way (e.g. an invalid fire_at) leaves the reminder untouched
     with get_connection() as conn:
-        conn.execute(f"UPDATE ai_reminders SET {set_clause} WHERE id = ?", values)
-        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT * FROM ai_reminders WHERE id = ?", (reminder_id,)).fetchone()
+            if row and (row['recurrence_json'] or params.get('recurrence')):
+                if not row['recurrence_json']:
+                    row = dict(row)
+                    row['recurrence_json'] = json_dumps(normalize_recurrence(params['recurrence'], row['fire_at']))
+                updates: Dict[str, Any] = dict(update_recurring_reminder(conn, row, params))
+                params = {k: v for k, v in params.items() if k not in ('status', 'fire_at', 'recurrence')}
+            else:
+                updates = {}
+
+            for key in ['status', 'purpose', 'created_by']:
+                if key in params and params[key] is not None:
+                    updates[key] = params[key]
+            if 'fire_at' in params and params['fire_at'] is not None:
+                fire_at = ensure_iso_timestamp(params['fire_at'])
+                if not fire_at:
+                    raise ValueError('invalid fire_at')
+                updates['fire_at'] = fire_at
+                updates['fire_at_epoch'] = timestamp_to_epoch(fire_at)
+            if 'context' in params:
+                updates['context_json'] = json_dumps(params['context']) if params['context'] is not None else None
+            if 'meta' in params:
+                updates['meta_json'] = json_dumps(params['meta']) if params['meta'] is not None else None
+
+            if updates:
+                updates['updated_at'] = now_ts()
+                set_clause = ', '.join(f"{col} = ?" for col in updates.keys())
+                conn.execute(
+                    f"UPDATE ai_reminders SET {set_clause} WHERE id = ?",
+                    [*updates.values(), reminder_id],
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
     return action_ai_reminder_get({'id': reminder_id})
 
@@ -1003,26 +2177,503 @@ def action_ai_reminder_list(params: Dict[str, Any]) -> Dict[str, Any]:
     return {'reminders': [row_to_reminder(r) for r in rows]}
 
 
+# Reminders that can be handed out: scheduled ones, plus claimed ones whose lease
+# has run out. Expired leases are not rewritten on read, so due/next/wait never
+# take a write lock; claim moves them to the new owner directly. Each branch is a
+# range on idx_ai_reminders_schedule and the two are merged in fire_at_epoch order.
+AVAILABLE_REMINDERS_SQL = """
+    SELECT * FROM ai_reminders
+     WHERE user_id = :user_id AND status = 'scheduled' AND fire_at_epoch <= :before
+    UNION ALL
+    SELECT * FROM ai_reminders
+     WHERE user_id = :user_id AND status = 'claimed' AND fire_at_epoch <= :before
+       AND lease_expires_epoch <= :now
+     ORDER BY fire_at_epoch ASC
+     LIMIT :limit
+"""
+
+
+def fetch_due_reminders(conn: sqlite3.Connection, user_id: str, before_epoch: int, limit: int) -> List[sqlite3.Row]:
+    cur = conn.execute(
+        AVAILABLE_REMINDERS_SQL,
+        {'user_id': user_id, 'before': before_epoch, 'now': int(time.time()), 'limit': limit},
+    )
+    return cur.fetchall()
+
+
+def fetch_next_reminder(conn: sqlite3.Connection, user_id: str) -> Optional[sqlite3.Row]:
+    """Earliest available reminder; one descent of idx_ai_reminders_schedule per status."""
+    cur = conn.execute(
+        AVAILABLE_REMINDERS_SQL,
+        {'user_id': user_id, 'before': REMINDER_EPOCH_MAX, 'now': int(time.time()), 'limit': 1},
+    )
+    return cur.fetchone()
+
+
+def wait_for_data_change(conn: sqlite3.Connection, until: float) -> bool:
+    """Sleep until ``until`` (time.monotonic) or until another connection commits."""
+    base_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    while True:
+        remaining = until - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(REMINDER_WAIT_POLL_INTERVAL, remaining))
+        if conn.execute("PRAGMA data_version").fetchone()[0] != base_version:
+            return True
+
+
+def parse_id_list(params: Dict[str, Any]) -> List[str]:
+    ids = params.get('ids')
+    if ids is None and params.get('id'):
+        ids = [params['id']]
+    if isinstance(ids, str):
+        ids = [v.strip() for v in ids.split(',') if v.strip()]
+    if not ids or not isinstance(ids, list):
+        raise ValueError('ids required')
+    return [str(v) for v in ids]
+
+
 def action_ai_reminder_due(params: Dict[str, Any]) -> Dict[str, Any]:
     user_id = params.get('user_id') or 'local'
     before = params.get('before') or now_ts()
     limit = params.get('limit') or 50
     with get_connection() as conn:
-        cur = conn.execute(
-            """
-            SELECT * FROM ai_reminders
-             WHERE user_id = ?
-               AND status = 'scheduled'
-               AND datetime(fire_at) <= datetime(?)
-             ORDER BY fire_at ASC
-             LIMIT ?
-            """,
-            (user_id, before, limit),
-        )
-        rows = cur.fetchall()
+        rows = fetch_due_reminders(conn, user_id, timestamp_to_epoch(before), limit)
     return {'reminders': [row_to_reminder(r) for r in rows]}
 
 
+def action_ai_reminder_next(params: Dict[str, Any]) -> Dict[str, Any]:
+    user_id = params.get('user_id') or 'local'
+    with get_connection() as conn:
+        row = fetch_next_reminder(conn, user_id)
+    if not row:
+        return {'reminder': None, 'fire_at': None, 'due_in_ms': None}
+    due_in_ms = max(0, (row['fire_at_epoch'] - int(time.time())) * 1000)
+    return {
+        'reminder': row_to_reminder(row),
+        'fire_at': ensure_iso_timestamp(row['fire_at']),
+        'due_in_ms': due_in_ms,
+    }
+
+
+def action_ai_reminder_wait(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Block until a reminder is due (returning it) or ``timeout_ms`` passes.
+
+    The wait sleeps until the next fire time and re-evaluates whenever another
+    process commits to the database (e.g. a new earlier reminder).
+    """
+    user_id = params.get('user_id') or 'local'
+    limit = params.get('limit') or 50
+    try:
+        timeout_ms = int(params.get('timeout_ms') or 60000)
+    except (TypeError, ValueError):
+        timeout_ms = 60000
+    timeout_ms = max(0, min(timeout_ms, REMINDER_WAIT_MAX_MS))
+    deadline = time.monotonic() + timeout_ms / 1000.0
+
+    with get_connection() as conn:
+        while True:
+            rows = fetch_due_reminders(conn, user_id, int(time.time()), limit)
+            if rows:
+                return {'reminders': [row_to_reminder(r) for r in rows], 'timed_out': False}
+            until = deadline
+            next_row = fetch_next_reminder(conn, user_id)
+            if next_row:
+                until = min(until, time.monotonic() + max(0, next_row['fire_at_epoch'] - time.time()))
+            if time.monotonic() >= deadline:
+                return {'reminders': [], 'timed_out': True}
+            wait_for_data_change(conn, until)
+
+
+def action_ai_reminder_claim(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Atomically lease due reminders to ``owner``.
+
+    Claimed rows move to status 'claimed' until acked, released or the lease
+    expires, so concurrent pollers never receive the same reminder.
+    """
+    user_id = params.get('user_id') or 'local'
+    owner = params.get('owner')
+    if not owner:
+        raise ValueError('owner required')
+    before = params.get('before') or now_ts()
+    limit = params.get('limit') or 50
+    lease_ms = int(params.get('lease_ms') or REMINDER_DEFAULT_LEASE_MS)
+    lease_expires = int(time.time()) + max(1, lease_ms // 1000)
+    now = now_ts()
+
+    with get_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = fetch_due_reminders(conn, user_id, timestamp_to_epoch(before), limit)
+            ids = [r['id'] for r in rows]
+            if ids:
+                conn.executemany(
+                    """
+                    UPDATE ai_reminders
+                       SET status = 'claimed', lease_owner = ?, lease_expires_epoch = ?, updated_at = ?
+                     WHERE id = ?
+                       AND (status = 'scheduled' OR (status = 'claimed' AND lease_expires_epoch <= ?))
+                    """,
+                    [(owner, lease_expires, now, reminder_id, int(time.time())) for reminder_id in ids],
+                )
+                placeholders = ','.join('?' * len(ids))
+                rows = conn.execute(
+                    f"SELECT * FROM ai_reminders WHERE id IN ({placeholders}) ORDER BY fire_at_epoch ASC",
+                    ids,
+                ).fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return {
+        'reminders': [row_to_reminder(r) for r in rows],
+        'owner': owner,
+        'lease_expires_at': epoch_to_iso(lease_expires) if rows else None,
+    }
+
+
+def finish_claimed_reminders(params: Dict[str, Any], status: str) -> Dict[str, Any]:
+    ids = parse_id_list(params)
+    owner = params.get('owner')
+    if not owner:
+        raise ValueError('owner required')
+    placeholders = ','.join('?' * len(ids))
+    with get_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            claimed = conn.execute(
+                f"""
+                SELECT * FROM ai_reminders
+                 WHERE id IN ({placeholders}) AND status = 'claimed' AND lease_owner = ?
+                """,
+                (*ids, owner),
+            ).fetchall()
+            # A lease that has run out no longer belongs to the owner (the reminder
+            # may already be due to someone else), so it cannot be acked or released
+            now_epoch = int(time.time())
+            rows = [r for r in claimed if not lease_expired(r['lease_expires_epoch'], now_epoch)]
+            expired = [r['id'] for r in claimed if lease_expired(r['lease_expires_epoch'], now_epoch)]
+            for row in rows:
+                if row['recurrence_json'] and status != 'scheduled':
+                    advance_recurring_reminder(conn, row, status)
+                else:
+                    conn.execute(
+                        """
+                        UPDATE ai_reminders
+                           SET status = ?, lease_owner = NULL, lease_expires_epoch = NULL, updated_at = ?
+                         WHERE id = ?
+                        """,
+                        (status, now_ts(), row['id']),
+                    )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return {'changed': len(rows), 'ids': ids, 'expired': expired}
+
+
+def action_ai_reminder_ack(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Mark claimed reminders as done (default status 'fired')."""
+    status = params.get('status') or 'fired'
+    if status in ('scheduled', 'claimed'):
+        raise ValueError('ack status must be a terminal status')
+    return finish_claimed_reminders(params, status)
+
+
+def action_ai_reminder_release(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Return claimed reminders to the scheduled pool without firing them."""
+    return finish_claimed_reminders(params, 'scheduled')
+
+
+# ---------------------------------------------------------------------------
+# Action metrics
+# ---------------------------------------------------------------------------
+
+
+def action_metrics_summary(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-action call counts, error rate and latency percentiles; see ActionRuntime.metrics_summary."""
+    return runtime.metrics_summary(params)
+
+
+# ---------------------------------------------------------------------------
+# In-process API
+# ---------------------------------------------------------------------------
+#
+#     from manage_context import ContextStore
+#     with ContextStore() as store:
+#         with store.transaction():
+#             store.state_set('study')
+#             store.events_append('mode_switch', mode_id='study')
+#         print(store.snapshot())
+#
+# The action functions are reused unchanged; get_connection() hands them the
+# store's connection while a store method is running.
+
+
+class StoreConnection:
+    """Proxy lending a ContextStore connection to the existing action functions.
+
+    Outside a unit of work it behaves like a fresh connection: leaving ``with``
+    commits or rolls back. Inside one, each ``with`` block becomes a SAVEPOINT
+    and explicit BEGIN / commit() calls fold into the enclosing transaction,
+    which ContextStore.transaction() commits at the end. close() is a no-op.
+    """
+
+    __slots__ = ('_conn', '_store', '_savepoints')
+
+    def __init__(self, store: 'ContextStore') -> None:
+        object.__setattr__(self, '_conn', store.conn)
+        object.__setattr__(self, '_store', store)
+        object.__setattr__(self, '_savepoints', [])
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._conn, name, value)
+
+    def __enter__(self) -> 'StoreConnection':
+        if self._store.in_transaction:
+            name = self._store.next_savepoint()
+            self._conn.execute(f'SAVEPOINT {name}')
+            self._savepoints.append(name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if self._savepoints:
+            name = self._savepoints.pop()
+            if exc_type is not None:
+                self._conn.execute(f'ROLLBACK TO {name}')
+            self._conn.execute(f'RELEASE {name}')
+        elif exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        return False
+
+    def execute(self, sql: str, parameters: Iterable[Any] = ()) -> sqlite3.Cursor:
+        if self._store.in_transaction and sql.lstrip()[:5].upper() == 'BEGIN':
+            return self._conn.cursor()
+        return self._conn.execute(sql, parameters)
+
+    def commit(self) -> None:
+        if not self._store.in_transaction:
+            self._conn.commit()
+
+    def rollback(self) -> None:
+        if self._savepoints:
+            self._conn.execute(f'ROLLBACK TO {self._savepoints[-1]}')
+        elif not self._store.in_transaction:
+            self._conn.rollback()
+
+    def close(self) -> None:
+        pass
+
+
+class ContextStore:
+    """In-process access to notify_state.db without the execute CLI.
+
+    Owns one connection (with a STORE_CACHED_STATEMENTS-sized statement cache)
+    and exposes a method per action returning the same dict as ``execute``;
+    errors surface as the same ValueError etc. instead of a JSON envelope.
+    Use it from a single thread.
+    """
+
+    def __init__(self, db_path: Optional[str] = None) -> None:
+        self.db_path = db_path or DB_PATH
+        self._depth = 0
+        self._savepoint_seq = 0
+        ensure_dir(os.path.dirname(self.db_path))
+        self.conn: Optional[sqlite3.Connection] = runtime.connect(
+            self.db_path, cached_statements=STORE_CACHED_STATEMENTS,
+        )
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.call(create_tables)
+
+    def __enter__(self) -> 'ContextStore':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close()
+        return False
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._depth > 0
+
+    def next_savepoint(self) -> str:
+        self._savepoint_seq += 1
+        return f'store_sp_{self._savepoint_seq}'
+
+    def checkout(self) -> StoreConnection:
+        """Connection handed out in place of get_connection(); resets per-call settings."""
+        if self.conn is None:
+            raise sqlite3.ProgrammingError('ContextStore is closed')
+        self.conn.row_factory = sqlite3.Row
+        return StoreConnection(self)
+
+    def call(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run an existing module function with get_connection() bound to this store."""
+        previous = getattr(_store_local, 'store', None)
+        _store_local.store = self
+        try:
+            return func(*args)
+        finally:
+            _store_local.store = previous
+
+    @contextlib.contextmanager
+    def transaction(self, immediate: bool = True):
+        """Unit of work: everything inside commits together or not at all.
+
+        Nested blocks become savepoints, so an inner failure can be caught
+        without losing the outer work.
+        """
+        if self._depth:
+            name = self.next_savepoint()
+            self.conn.execute(f'SAVEPOINT {name}')
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.conn.execute(f'ROLLBACK TO {name}')
+                self.conn.execute(f'RELEASE {name}')
+                raise
+            else:
+                self.conn.execute(f'RELEASE {name}')
+            finally:
+                self._depth -= 1
+            return
+
+        self.conn.commit()
+        self.conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        self._depth = 1
+        try:
+            yield self
+        except BaseException:
+            self.conn.rollback()
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self._depth = 0
+
+    def execute(self, action: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run any action by name, as ``execute`` would (without the JSON round trip)."""
+        handler = ACTION_HANDLERS.get(action)
+        if handler is None:
+            raise ValueError(f'Unknown action: {action}')
+        return self.call(handler, params or {})
+
+    # Context modes and state
+
+    def mode_list(self) -> Dict[str, Any]:
+        return self.call(action_context_mode_list, {})
+
+    def mode_get(self, mode_id: str) -> Dict[str, Any]:
+        return self.call(action_context_mode_get, {'mode_id': mode_id})
+
+    def mode_upsert(self, mode: Dict[str, Any]) -> Dict[str, Any]:
+        return self.call(action_context_mode_upsert, {'mode': mode})
+
+    def mode_delete(self, mode_id: str) -> Dict[str, Any]:
+        return self.call(action_context_mode_delete, {'mode_id': mode_id})
+
+    def state_get(self, **params: Any) -> Dict[str, Any]:
+        return self.call(action_context_state_get, params)
+
+    def state_set(self, mode_id: str, manual_override: Optional[bool] = None, **params: Any) -> Dict[str, Any]:
+        return self.call(action_context_state_set, {'mode_id': mode_id, 'manual_override': manual_override, **params})
+
+    def snapshot(self, **params: Any) -> Dict[str, Any]:
+        return self.call(action_context_snapshot, params)
+
+    # Pending items and events
+
+    def pending_create(self, payload: Any, **params: Any) -> Dict[str, Any]:
+        return self.call(action_context_pending_create, {'payload': payload, **params})
+
+    def pending_update(self, pending_id: str, **params: Any) -> Dict[str, Any]:
+        return self.call(action_context_pending_update, {'id': pending_id, **params})
+
+    def pending_list(self, **params: Any) -> Dict[str, Any]:
+        return self.call(action_context_pending_list, params)
+
+    def pending_sweep(self, **params: Any) -> Dict[str, Any]:
+        return self.call(action_context_pending_sweep, params)
+
+    def events_append(self, event_type: str, **params: Any) -> Dict[str, Any]:
+        return self.call(action_context_events_append, {'event_type': event_type, **params})
+
+    def events_recent(self, limit: Optional[int] = None, before_id: Optional[int] = None) -> Dict[str, Any]:
+        return self.call(action_context_events_recent, {'limit': limit, 'before_id': before_id})
+
+    def events_stats(self, **params: Any) -> Dict[str, Any]:
+        """``from`` is a keyword in Python; pass it as ``from_``."""
+        return self.call(action_context_events_stats, {key.rstrip('_'): value for key, value in params.items()})
+
+    # Notification log
+
+    def notify_log_append(self, payload: Any, decision: Optional[str] = None, **params: Any) -> Dict[str, Any]:
+        return self.call(action_notify_log_append, {'payload': payload, 'decision': decision, **params})
+
+    def notify_log_get(self, entry_id: int) -> Dict[str, Any]:
+        return self.call(action_notify_log_get, {'id': entry_id})
+
+    def notify_log_list(self, **params: Any) -> Dict[str, Any]:
+        return self.call(action_notify_log_list, params)
+
+    def notify_log_today_stats(self, user_id: str = 'local', date: Optional[str] = None) -> Dict[str, Any]:
+        return self.call(action_notify_log_today_stats, {'user_id': user_id, 'date': date})
+
+    def notify_log_mark_test(self, **params: Any) -> Dict[str, Any]:
+        return self.call(action_notify_log_mark_test, params)
+
+    # AI reminders
+
+    def reminder_create(self, fire_at: str, **params: Any) -> Dict[str, Any]:
+        return self.call(action_ai_reminder_create, {'fire_at': fire_at, **params})
+
+    def reminder_get(self, reminder_id: str) -> Dict[str, Any]:
+        return self.call(action_ai_reminder_get, {'id': reminder_id})
+
+    def reminder_update(self, reminder_id: str, **params: Any) -> Dict[str, Any]:
+        return self.call(action_ai_reminder_update, {'id': reminder_id, **params})
+
+    def reminder_delete(self, reminder_id: str) -> Dict[str, Any]:
+        return self.call(action_ai_reminder_delete, {'id': reminder_id})
+
+    def reminder_list(self, **params: Any) -> Dict[str, Any]:
+        return self.call(action_ai_reminder_list, params)
+
+    def reminder_due(self, user_id: str = 'local', before: Optional[str] = None,
+                     limit: Optional[int] = None) -> Dict[str, Any]:
+        return self.call(action_ai_reminder_due, {'user_id': user_id, 'before': before, 'limit': limit})
+
+    def reminder_next(self, user_id: str = 'local') -> Dict[str, Any]:
+        return self.call(action_ai_reminder_next, {'user_id': user_id})
+
+    def reminder_claim(self, owner: str, **params: Any) -> Dict[str, Any]:
+        return self.call(action_ai_reminder_claim, {'owner': owner, **params})
+
+    def reminder_ack(self, ids: List[str], owner: str, status: Optional[str] = None) -> Dict[str, Any]:
+        return self.call(action_ai_reminder_ack, {'ids': ids, 'owner': owner, 'status': status})
+
+    def reminder_release(self, ids: List[str], owner: str) -> Dict[str, Any]:
+        return self.call(action_ai_reminder_release, {'ids': ids, 'owner': owner})
+
+    def reminder_occurrences(self, reminder_id: str, **params: Any) -> Dict[str, Any]:
+        return self.call(action_ai_reminder_occurrences, {'id': reminder_id, **params})
+
+    def metrics_summary(self, **params: Any) -> Dict[str, Any]:
+        return self.call(action_metrics_summary, {key.rstrip('_'): value for key, value in params.items()})
+
+
 # ---------------------------------------------------------------------------
 # CLI handling
 # ---------------------------------------------------------------------------
@@ -1030,10 +2681,20 @@ def action_ai_reminder_due(params: Dict[str, Any]) -> Dict[str, Any]:
 
 def print_help() -> None:
     message = (
-        "Usage: python manage_context.py [--api-mode] execute '<json_payload>'\n\n"
+        "Usage: python manage_context.py [--api-mode] [--profile | --profile-top=N] execute '<json_payload>'\n\n"
         "Examples:\n"
         "  python manage_context.py execute '{\"action\": \"context.mode_list\"}'\n"
         "  python manage_context.py --api-mode execute '{\"action\": \"notify.log_list\", \"params\": {\"limit\": 5}}'\n"
+        "  python manage_context.py --api-mode execute '{\"action\": \"metrics.summary\", \"params\": {\"hours\": 168, \"by\": \"day\"}}'\n"
+        "\n"
+        "Read actions are interrupted after MANAGE_CONTEXT_DEADLINE_MS (default 5000) and return\n"
+        "{\"status\": \"error\", \"error\": \"timeout\"}; pass \"deadline_ms\" to override (0 disables).\n"
+        "Statements slower than MANAGE_CONTEXT_SLOW_QUERY_MS (default 200) are written with their\n"
+        "query plan to manage_context_slow.log.\n"
+        "Add \"format\": \"compact\" or \"ndjson\" to the payload for compact or line-delimited output,\n"
+        "and \"fields\" to notify.log_list params to return only those entry keys.\n"
+        "context.state_get and context.snapshot return an \"etag\"; send it back as \"if_none_match\"\n"
+        "to get {\"not_modified\": true} when nothing changed.\n"
     )
     print(message)
 
@@ -1045,11 +2706,14 @@ ACTION_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
     'context.mode_delete': action_context_mode_delete,
     'context.state_get': action_context_state_get,
     'context.state_set': action_context_state_set,
+    'context.snapshot': action_context_snapshot,
     'context.pending_create': action_context_pending_create,
     'context.pending_update': action_context_pending_update,
     'context.pending_list': action_context_pending_list,
+    'context.pending_sweep': action_context_pending_sweep,
     'context.events_append': action_context_events_append,
     'context.events_recent': action_context_events_recent,
+    'context.events_stats': action_context_events_stats,
     'notify.log_append': action_notify_log_append,
     'notify.log_get': action_notify_log_get,
     'notify.log_list': action_notify_log_list,
@@ -1061,10 +2725,17 @@ ACTION_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
     'ai.reminder_delete': action_ai_reminder_delete,
     'ai.reminder_list': action_ai_reminder_list,
     'ai.reminder_due': action_ai_reminder_due,
+    'ai.reminder_next': action_ai_reminder_next,
+    'ai.reminder_wait': action_ai_reminder_wait,
+    'ai.reminder_claim': action_ai_reminder_claim,
+    'ai.reminder_ack': action_ai_reminder_ack,
+    'ai.reminder_release': action_ai_reminder_release,
+    'ai.reminder_occurrences': action_ai_reminder_occurrences,
+    'metrics.summary': action_metrics_summary,
 }
 
 
-def handle_execute(json_string: str) -> None:
+def handle_execute(json_string: str, profile: Optional[ActionProfile] = None) -> None:
     try:
         data = json.loads(json_string)
     except json.JSONDecodeError as exc:
@@ -1074,11 +2745,11 @@ def handle_execute(json_string: str) -> None:
     action = data.get('action')
     params = data.get('params')
     if params is None:
-        # Allow top-level fields (besides action/params) to be treated as parameters
+        # Allow top-level fields (besides action/params/profile/deadline_ms/format) to be treated as parameters
         params = {
             key: value
             for key, value in data.items()
-            if key not in ('action', 'params')
+            if key not in ('action', 'params', 'profile', 'deadline_ms', 'format')
         }
     if not isinstance(params, dict):
         print(json.dumps({'status': 'error', 'message': "'params' must be an object"}))
@@ -1091,23 +2762,45 @@ def handle_execute(json_string: str) -> None:
     if not handler:
         print(json.dumps({'status': 'error', 'message': f'Unknown action: {action}'}))
         sys.exit(1)
+    try:
+        output_format = parse_output_format(data.get('format'))
+    except ValueError as exc:
+        print(json.dumps({'status': 'error', 'message': str(exc)}))
+        sys.exit(1)
+
+    call = runtime.action_call(profile)
+    if call.profile is None:
+        profile_top = parse_profile_option(data.get('profile'))
+        if profile_top is not None:
+            call.profile = ActionProfile(profile_top)
+            activate_profile(call.profile)
 
     try:
-        result = handler(params)
-        print(json.dumps(result, ensure_ascii=False))
+        call.begin(action, params, data.get('deadline_ms'))
+        call.write(call.run(handler, params), output_format)
     except Exception as exc:
-        logger.exception("Action %s failed", action)
-        print(json.dumps({'status': 'error', 'message': str(exc)}), end='')
+        call.write_error(exc, output_format)
         sys.exit(1)
+    finally:
+        # Runs on SystemExit too, so such calls are still counted as errors
+        call.close()
 
 
 def main() -> None:
     api_mode = '--api-mode' in sys.argv
     if api_mode:
         sys.argv.remove('--api-mode')
+    profile_top = pop_profile_flags(sys.argv)
+    if profile_top is None and len(sys.argv) == 3 and sys.argv[1] == 'execute':
+        profile_top = envelope_profile_top(sys.argv[2])
+    profile = ActionProfile(profile_top) if profile_top is not None else None
 
     setup_logging(api_mode=api_mode)
-    create_tables()
+    if profile:
+        profile.mark_startup()
+        activate_profile(profile)
+    with profile.phase('ddl') if profile else contextlib.nullcontext():
+        create_tables()
 
     if len(sys.argv) < 2 or sys.argv[1] in ('--help', '-h'):
         print_help()
@@ -1118,7 +2811,7 @@ def main() -> None:
         print_help()
         sys.exit(1)
 
-    handle_execute(sys.argv[2])
+    handle_execute(sys.argv[2], profile)
 
 
 if __name__ == '__main__':
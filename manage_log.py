@@ -7,9 +7,19 @@ import sys
 import shutil
 import json
 import uuid
+import threading
 import logging
+import time
+import contextlib
+import math
+import subprocess
 from zoneinfo import ZoneInfo
 
+import action_runtime
+from action_runtime import (
+    ActionProfile, envelope_profile_top, params_hash, parse_profile_option, pop_profile_flags,
+)
+
 # --- 定数 ---
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(SCRIPT_DIR, 'study_log.db')
@@ -22,50 +32,123 @@ MAX_LONG_TERM_BACKUPS = 30
 REDO_BACKUP_DIR = os.path.join(SCRIPT_DIR, 'db_redo_backups')
 MAX_REDO_BACKUPS = 10
 JST = ZoneInfo("Asia/Tokyo")
+EVENTS_WAIT_POLL_INTERVAL = 0.05  # 秒。PRAGMA data_version の確認間隔
+EVENTS_WAIT_MAX_MS = 60000
+EVENTS_STREAM_HEARTBEAT_MS = 30000
+# manage_log.log のローテーション。古いファイルは gzip 圧縮して LOG_FILE_BACKUPS 世代まで残す
+LOG_FILE_MAX_BYTES = int(os.environ.get('MANAGE_LOG_LOGFILE_MAX_BYTES', str(5 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.environ.get('MANAGE_LOG_LOGFILE_BACKUPS', '5'))
+LOG_FILE_ROTATION = os.environ.get('MANAGE_LOG_LOGFILE_ROTATION', 'size')  # 'size' | 'daily'
+LOG_FILE_FORMAT = os.environ.get('MANAGE_LOG_LOGFILE_FORMAT', 'text')      # 'text' | 'json'
+# 実行メトリクス（空文字で無効）。undo / restore で巻き戻らないよう study_log.db とは別ファイルにする
+METRICS_DB_PATH = os.environ.get('MANAGE_LOG_METRICS_DB', os.path.join(SCRIPT_DIR, 'manage_log_metrics.db'))
+# アクションの制限時間（ms）。超えたクエリは progress handler で中断する。0 で無効
+DEADLINE_DEFAULT_MS = int(os.environ.get('MANAGE_LOG_DEADLINE_MS', '5000'))
+# 既定で制限時間をかけるのは読み取り系だけ（書き込みを途中で止めると backup との対応が崩れる）。
+# それ以外もペイロードの "deadline_ms" で個別に指定できる
+DEADLINE_ACTIONS = {
+    'data.dashboard', 'data.search', 'data.tags', 'data.search_suggest', 'data.similar',
+    'data.unique_subjects', 'data.study_time_by_subject', 'data.weekly_study_time',
+    'data.this_week_study_time', 'log.get', 'log.get_entry', 'session.active', 'goal.get',
+    'metrics.summary', 'data.dashboard_delta',
+}
+SLOW_QUERY_MS = float(os.environ.get('MANAGE_LOG_SLOW_QUERY_MS', '200'))  # 0 で無効
+SLOW_QUERY_LOG_PATH = os.path.join(SCRIPT_DIR, 'manage_log_slow.log')
+# execute の出力形式（エンベロープの "format"）。pretty は従来どおり indent=2
+OUTPUT_FORMATS = ('pretty', 'compact', 'ndjson')
+# これらの読み取り系アクションの結果には reminder ブロックを付けない
+READ_ONLY_ACTIONS = DEADLINE_ACTIONS | {'data.events_since', 'data.events_stream'}
+# data.dashboard_delta がこれより多くのイベントをまたぐ場合は差分をやめて全体を返す
+DASHBOARD_DELTA_MAX_EVENTS = 500
+# StudyLogStore の接続が保持するプリペアドステートメント数（sqlite3 の既定は 128）
+STORE_CACHED_STATEMENTS = 256
 
 # --- ロギング設定 ---
 logger = logging.getLogger(__name__)
 
-def setup_logging(api_mode=False):
-    """ロギングを設定する"""
-    logger.setLevel(logging.INFO)
-    
-    # 既存のハンドラをクリア
-    if logger.hasHandlers():
-        logger.handlers.clear()
-
-    # ファイルハンドラ (常にログファイルに記録)
-    file_handler = logging.FileHandler(LOG_FILE_PATH, encoding='utf-8')
-    file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
-
-    # APIモードでない場合のみ、コンソールにも出力
-    if not api_mode:
-        stream_handler = logging.StreamHandler(sys.stderr)
-        stream_formatter = logging.Formatter('%(message)s')
-        stream_handler.setFormatter(stream_formatter)
-        logger.addHandler(stream_handler)
+# 制限時間・slow query ログ・プロファイル・実行メトリクス・ログ出力は manage_context.py と共通
+runtime = action_runtime.ActionRuntime(
+    logger,
+    log_path=LOG_FILE_PATH,
+    log_max_bytes=LOG_FILE_MAX_BYTES,
+    log_backups=LOG_FILE_BACKUPS,
+    log_rotation=LOG_FILE_ROTATION,
+    log_format=LOG_FILE_FORMAT,
+    metrics_db_path=METRICS_DB_PATH,
+    deadline_default_ms=DEADLINE_DEFAULT_MS,
+    deadline_actions=DEADLINE_ACTIONS,
+    slow_query_ms=SLOW_QUERY_MS,
+    slow_query_log_path=SLOW_QUERY_LOG_PATH,
+    output_formats=OUTPUT_FORMATS,
+    tz=JST,
+    lang='ja',
+)
+setup_logging = runtime.setup_logging
+activate_profile = runtime.activate_profile
+parse_output_format = runtime.parse_output_format
 
 # --- データベース接続 ---
+# StudyLogStore のメソッド実行中は、そのストアを指す（get_connection() が接続を使い回す）
+_store_local = threading.local()
+
 def get_connection():
+    store = getattr(_store_local, 'store', None)
+    if store is not None:
+        # StudyLogStore 経由の呼び出しでは、ストアが持つ 1 本の接続を使い回す
+        return store._checkout()
     db_dir = os.path.dirname(DB_PATH)
     if not os.path.exists(db_dir):
         os.makedirs(db_dir)
-    conn = sqlite3.connect(DB_PATH)
+    conn = runtime.connect(DB_PATH)
     conn.text_factory = str
     return conn
 
+# --- 実行メトリクス ---
+def get_metrics_summary(params):
+    """アクションごとの呼び出し回数とレイテンシのパーセンタイルを返す。
+
+    params: hours（既定 24）または from / to、action（任意）、by: 'hour' | 'day'（任意、推移を付ける）
+    パーセンタイルはバケットの上限値なので、最大約 19% 大きめに出る。
+    """
+    return {"status": "success", **runtime.metrics_summary(params)}
+
 def print_help():
     """ヘルプメッセージを表示する"""
     help_text = """
-Usage: python manage_log.py [--api-mode] execute '<json_payload>'
+Usage: python manage_log.py [--api-mode] [--profile | --profile-top=N] execute '<json_payload>'
 
 Gemini CLIのための学習ログ管理ツール。
 すべての操作はJSONペイロードを引数とする `execute` コマンド経由で行います。
 
 Options:
   --api-mode    JSON出力以外のコンソールメッセージを抑制します。
+  --profile     フェーズ別の時間（startup / ddl / handler / serialization）と実行された SQL
+                （所要時間・行数）を結果の "_profile" に付けます。
+                ペイロードに "profile": true を指定しても同じです。
+  --profile-top=N
+                --profile に加えて cProfile の累積時間上位 N 件を付けます
+                （ペイロードでは "profile": {"cprofile_top": N}）。
+
+Deadlines / slow queries:
+  読み取り系アクションは MANAGE_LOG_DEADLINE_MS（既定 5000ms）を超えると実行中のクエリを中断し、
+  {"status": "error", "error": "timeout", ...} を返します。ペイロードの "deadline_ms" で個別に
+  指定できます（0 で無効、書き込み系にも指定可）。
+  MANAGE_LOG_SLOW_QUERY_MS（既定 200ms）を超えた SQL は EXPLAIN QUERY PLAN 付きで
+  manage_log_slow.log（ローテーションあり）に記録されます。
+
+Output format:
+  ペイロードの "format" で出力形式を選べます。
+    "pretty"（既定）: indent=2
+    "compact": 区切りの空白なし
+    "ndjson": compact に加え、リスト形の結果を 1 要素 1 行で出力（最後に {"_meta": {...}}）
+  log.get / data.search / data.events_since は params の "fields" で返すキーを絞れます。
+  読み取り系アクションの結果には（形式によらず）reminder ブロックを付けません。
+
+Versioning:
+  data.dashboard / log.get / data.study_time_by_subject / data.tags の結果には "etag" が付きます。
+  次回 params に "if_none_match": "<etag>" を渡すと、変更が無ければ集計せずに
+  {"not_modified": true, "etag": ...} を返します（data.study_time_by_subject は
+  常に {"items": [...], "etag": ...} の形で返します）。
 
 --- JSON Payload Structure ---
 {
@@ -87,7 +170,7 @@ Options:
     - params: {"memo": "str" (optional), "impression": "str" (optional)}
   - log.end_session: 現在の学習セッションを終了
   - log.get: 指定した日付の全ログをJSONで取得
-    - params: {"date": "YYYY-MM-DD"}
+    - params: {"date": "YYYY-MM-DD", "fields": ["sessions", ...] (optional, 最上位のキーを絞る)}
   - log.get_entry: 特定のログエントリの詳細を取得
     - params: {"id": int}
   - log.update_entry: ログエントリの特定のフィールドを更新
@@ -125,8 +208,23 @@ Options:
 [data]
   - data.dashboard: Webダッシュボード用のデータを取得
     - params: {"days": int (optional)}
+  - data.dashboard_delta: 前回の取得以降に変わったダッシュボードの部分だけを取得
+    - params: {"since": "str" (前回の last), "days": int (optional), "date": "YYYY-MM-DD" (optional, 前回の date)}
+    - (注) studyStatsDelta は増減、studyStats.streak は絶対値です。差分を作れない場合は full=true で全体を返します。
   - data.unique_subjects: 記録されている全ての教科名をリスト表示
   - data.study_time_by_subject: 教科ごとの合計学習時間を取得
+  - data.events_since: 指定ID以降の変更イベントを取得
+    - params: {"since": int, "limit": int (optional), "wait_ms": int (optional, 最大60000), "full": bool (optional), "fields": ["id", ...] (optional)}
+    - (注) wait_ms 指定時は新しいイベントが届くかタイムアウトするまでブロックします。
+    - (注) updateイベントはキーと変更カラムのみ（version は行ごとの連番）。full=true で完全な行を返します。
+  - data.search_suggest: 検索語の候補を前方一致・出現頻度順で取得
+    - params: {"prefix": "str" (または "q"), "limit": int (optional)}
+    - (注) 索引が未作成なら作成をバックグラウンドで始めて "index_pending": true を返します。
+  - data.similar: 指定した項目に似た過去のログ・目標・日次サマリーを取得
+    - params: {"kind": "entry"|"goal"|"summary", "id": int|str, "type": "all"|"entry"|"goal"|"summary" (optional), "limit": int (optional)}
+    - (注) 索引が未作成なら作成をバックグラウンドで始めて "index_pending": true を返します。
+  - data.events_stream: 変更イベントをNDJSONで逐次出力し続ける（長寿命プロセス用）
+    - params: {"since": int, "limit": int (optional), "duration_ms": int (optional), "heartbeat_ms": int (optional), "full": bool (optional)}
 
 [db] (⚠️ 注意/危険)
   - db.backup: 手動でDBバックアップを作成
@@ -134,10 +232,18 @@ Options:
   - db.redo: 直前の'undo'操作をやり直し
   - db.consolidate_break: 最後のBREAKを直前のRESUMEに統合
   - db.recalculate_durations: 全てのログのdurationを再計算
+  - db.build_search_index: data.search_suggest / data.similar の索引を作成し、未取り込みの変更を反映（制限時間なし）
   - db.restore: ⚠️ 指定したバックアップファイルからDBを復元
     - params: {"backup_path": "str"}
   - db.reconstruct: ⚠️ JSONデータからDBを完全に再構築
     - params: {"json_data": "json_string"}
+
+[metrics]
+  - metrics.summary: アクションごとの呼び出し回数・エラー率・レイテンシ (p50/p95/p99) を集計
+    - params: {"hours": 24 (optional), "from": "YYYY-MM-DD" (optional), "to": "YYYY-MM-DD" (optional),
+               "action": "str" (optional), "by": "hour" | "day" (optional)}
+    - execute の実行ごとに manage_log_metrics.db へ時間バケット × レイテンシバケットで加算されます
+      （環境変数 MANAGE_LOG_METRICS_DB で保存先を変更、空文字で無効）
 """
     print(help_text)
 
@@ -184,6 +290,8 @@ def create_tables():
                 updated_at TEXT NOT NULL
             )
         """)
+        # 連続学習日数・最近のセッション・ダッシュボード差分の日付範囲検索用
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_study_logs_start_time ON study_logs(start_time)")
         conn.commit()
 
 def ensure_study_log_columns():
@@ -224,6 +332,10 @@ def backup_database(description="Regular backup", backup_type="short_term"):
 
     if not os.path.exists(target_dir):
         os.makedirs(target_dir)
+    store = getattr(_store_local, 'store', None)
+    if store is not None and (store.in_transaction or not store.backup):
+        # 書き込み途中のファイルはコピーしない（StudyLogStore.transaction() の開始時に 1 回だけ取る）
+        return
     timestamp = datetime.datetime.now(JST).strftime("%Y%m%d_%H%M%S_%f")
     backup_filename = "study_log_{}.db".format(timestamp)
     backup_path = os.path.join(target_dir, backup_filename)
@@ -976,9 +1088,88 @@ def get_weekly_study_time():
     return data[::-1] # 曜日順に並べるため逆順にする
 
 # ---- Event tracking for fine-grained UI diffs ----
+# テーブルごとの (行キー式, スナップショット対象カラム)。
+# update イベントはキーと変更カラムのみ、insert/delete は全カラムを記録する。
+EVENT_TABLES = {
+    'study_logs': ("CAST({row}.id AS TEXT)", [
+        'id', 'event_type', 'subject', 'content', 'start_time', 'end_time',
+        'duration_minutes', 'summary', 'memo', 'impression',
+    ]),
+    'goals': ("{row}.id", [
+        'id', 'date', 'task', 'completed', 'subject', 'total_problems',
+        'completed_problems', 'tags', 'details',
+    ]),
+    'daily_summaries': ("{row}.date", ['date', 'summary']),
+}
+EVENT_KEY_COLUMNS = {'study_logs': 'id', 'goals': 'id', 'daily_summaries': 'date'}
+
+def _event_trigger_sql(table, op):
+    key_expr, columns = EVENT_TABLES[table]
+    row = 'OLD' if op == 'delete' else 'NEW'
+    key = key_expr.format(row=row)
+    row_id = '0' if table == 'daily_summaries' else f"{row}.id"
+    version = (
+        f"(SELECT COALESCE(MAX(version), 0) + 1 FROM events "
+        f"WHERE table_name = '{table}' AND row_key = {key})"
+    )
+    when = ''
+    if op == 'update':
+        key_col = EVENT_KEY_COLUMNS[table]
+        changed = [c for c in columns if c != key_col]
+        when = "WHEN " + " OR ".join(f"NEW.{c} IS NOT OLD.{c}" for c in changed + [key_col])
+        parts = [f"SELECT '{key_col}' AS k, NEW.{key_col} AS v"]
+        parts += [f"SELECT '{c}', NEW.{c} WHERE NEW.{c} IS NOT OLD.{c}" for c in changed]
+        snapshot = "(SELECT json_group_object(k, v) FROM ({}))".format(" UNION ALL ".join(parts))
+    else:
+        snapshot = "json_object({})".format(",".join(f"'{c}',{row}.{c}" for c in columns))
+    timing = {'insert': 'INSERT', 'update': 'UPDATE', 'delete': 'DELETE'}[op]
+    return f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{op} AFTER {timing} ON {table} {when} BEGIN
+              INSERT INTO events(table_name,op,row_id,row_key,version,snapshot)
+              VALUES('{table}','{op}',{row_id},{key},{version},{snapshot});
+            END;"""
+
+def _events_need_backfill(cursor):
+    """row_key / version が未設定の events 行が残っているか。
+
+    バックフィルはトリガーの作り直しと同じトランザクションで行うので、未設定の行は
+    旧トリガーが書いた先頭側か末尾側に必ず含まれる。両端の 2 行だけを見れば判定でき、
+    起動のたびに events を走査しなくて済む。
+    """
+    cursor.execute("""
+        SELECT 1 FROM events
+         WHERE id IN ((SELECT MIN(id) FROM events), (SELECT MAX(id) FROM events))
+           AND (row_key IS NULL OR version IS NULL)
+         LIMIT 1
+    """)
+    return cursor.fetchone() is not None
+
+def _event_triggers_current(cursor):
+    """events の列・索引・差分形式のトリガーが揃い、バックフィルも済んでいるか（読み取りだけで判定する）"""
+    triggers = [f"trg_{table}_{op}" for table in EVENT_TABLES for op in ('insert', 'update', 'delete')]
+    names = triggers + ['events', 'idx_events_row']
+    cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE name IN ({})".format(",".join("?" * len(names))), names
+    )
+    found = dict(cursor.fetchall())
+    if len(found) != len(names):
+        return False
+    if any('row_key' not in (found[name] or '') for name in triggers):
+        return False
+    if 'row_key' not in found['events'] or 'version' not in found['events']:
+        return False
+    return not _events_need_backfill(cursor)
+
 def ensure_event_triggers():
     with get_connection() as conn:
         cursor = conn.cursor()
+        # import のたびに呼ばれるので、揃っていれば書き込みロックを取らずに戻る
+        # （読み取り系のプロセスが書き込みの後ろに並ばないようにする）
+        if _event_triggers_current(cursor):
+            return
+        # 列の追加・バックフィル・トリガーの作り直しを 1 トランザクションで行う
+        # （途中で止まっても未設定の行が残ったまま確定しない）
+        conn.execute("BEGIN IMMEDIATE")
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS events (
               id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -986,103 +1177,278 @@ def ensure_event_triggers():
               op TEXT,
               row_id INTEGER,
               snapshot TEXT,
-              ts TEXT DEFAULT (datetime('now'))
+              ts TEXT DEFAULT (datetime('now')),
+              row_key TEXT,
+              version INTEGER
             )
         """)
 
-        # study_logs triggers: only recreate if 'summary' is missing
-        def trigger_has_summary(name: str) -> bool:
-            try:
-                cursor.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name=?", (name,))
+        # 旧スキーマの events に row_key / version を追加する
+        cursor.execute("PRAGMA table_info(events)")
+        existing_columns = {row[1] for row in cursor.fetchall()}
+        if 'row_key' not in existing_columns:
+            cursor.execute("ALTER TABLE events ADD COLUMN row_key TEXT")
+        if 'version' not in existing_columns:
+            cursor.execute("ALTER TABLE events ADD COLUMN version INTEGER")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_row ON events(table_name, row_key, version)")
+
+        # 未設定の行が残っていれば埋める（version は行ごとに id 順で振り直す）
+        if _events_need_backfill(cursor):
+            cursor.execute("""
+                UPDATE events SET row_key = CASE table_name
+                    WHEN 'daily_summaries' THEN json_extract(snapshot, '$.date')
+                    ELSE CAST(row_id AS TEXT) END
+                 WHERE row_key IS NULL
+            """)
+            cursor.execute("""
+                SELECT ROW_NUMBER() OVER (PARTITION BY table_name, row_key ORDER BY id), id FROM events
+            """)
+            cursor.executemany("UPDATE events SET version = ? WHERE id = ?", cursor.fetchall())
+
+        # 差分形式（row_key を含む）でないトリガーは作り直す
+        for table in EVENT_TABLES:
+            for op in ('insert', 'update', 'delete'):
+                trig_name = f"trg_{table}_{op}"
+                cursor.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name=?", (trig_name,))
                 row = cursor.fetchone()
-                if not row or not row[0]:
-                    return False
-                return 'summary' in row[0]
-            except Exception:
-                return False
-
-        for trig_name in (
-            'trg_study_logs_insert',
-            'trg_study_logs_update',
-            'trg_study_logs_delete',
-        ):
-            if not trigger_has_summary(trig_name):
-                try:
+                if row and row[0] and 'row_key' not in row[0]:
                     cursor.execute(f"DROP TRIGGER IF EXISTS {trig_name}")
-                except Exception:
-                    pass
-        cursor.executescript("""
-            CREATE TRIGGER IF NOT EXISTS trg_study_logs_insert AFTER INSERT ON study_logs BEGIN
-              INSERT INTO events(table_name,op,row_id,snapshot)
-              VALUES('study_logs','insert',NEW.id,
-                json_object('id',NEW.id,'event_type',NEW.event_type,'subject',NEW.subject,'content',NEW.content,'start_time',NEW.start_time,'end_time',NEW.end_time,'duration_minutes',NEW.duration_minutes,'summary',NEW.summary));
-            END;
-            CREATE TRIGGER IF NOT EXISTS trg_study_logs_update AFTER UPDATE ON study_logs BEGIN
-              INSERT INTO events(table_name,op,row_id,snapshot)
-              VALUES('study_logs','update',NEW.id,
-                json_object('id',NEW.id,'event_type',NEW.event_type,'subject',NEW.subject,'content',NEW.content,'start_time',NEW.start_time,'end_time',NEW.end_time,'duration_minutes',NEW.duration_minutes,'summary',NEW.summary));
-            END;
-            CREATE TRIGGER IF NOT EXISTS trg_study_logs_delete AFTER DELETE ON study_logs BEGIN
-              INSERT INTO events(table_name,op,row_id,snapshot)
-              VALUES('study_logs','delete',OLD.id,
-                json_object('id',OLD.id,'event_type',OLD.event_type,'subject',OLD.subject,'content',OLD.content,'start_time',OLD.start_time,'end_time',OLD.end_time,'duration_minutes',OLD.duration_minutes,'summary',OLD.summary));
-            END;
-        """)
-        # goals triggers
-        cursor.executescript("""
-            CREATE TRIGGER IF NOT EXISTS trg_goals_insert AFTER INSERT ON goals BEGIN
-              INSERT INTO events(table_name,op,row_id,snapshot)
-              VALUES('goals','insert',NEW.id,
-                json_object('id',NEW.id,'date',NEW.date,'task',NEW.task,'completed',NEW.completed,'subject',NEW.subject,'total_problems',NEW.total_problems,'completed_problems',NEW.completed_problems,'tags',NEW.tags,'details',NEW.details));
-            END;
-            CREATE TRIGGER IF NOT EXISTS trg_goals_update AFTER UPDATE ON goals BEGIN
-              INSERT INTO events(table_name,op,row_id,snapshot)
-              VALUES('goals','update',NEW.id,
-                json_object('id',NEW.id,'date',NEW.date,'task',NEW.task,'completed',NEW.completed,'subject',NEW.subject,'total_problems',NEW.total_problems,'completed_problems',NEW.completed_problems,'tags',NEW.tags,'details',NEW.details));
-            END;
-            CREATE TRIGGER IF NOT EXISTS trg_goals_delete AFTER DELETE ON goals BEGIN
-              INSERT INTO events(table_name,op,row_id,snapshot)
-              VALUES('goals','delete',OLD.id,
-                json_object('id',OLD.id,'date',OLD.date,'task',OLD.task,'completed',OLD.completed,'subject',OLD.subject,'total_problems',OLD.total_problems,'completed_problems',OLD.completed_problems,'tags',OLD.tags,'details',OLD.details));
-            END;
-            -- daily_summaries triggers
-            CREATE TRIGGER IF NOT EXISTS trg_daily_summaries_insert AFTER INSERT ON daily_summaries BEGIN
-              INSERT INTO events(table_name,op,row_id,snapshot)
-              VALUES('daily_summaries','insert',0,
-                json_object('date',NEW.date,'summary',NEW.summary));
-            END;
-            CREATE TRIGGER IF NOT EXISTS trg_daily_summaries_update AFTER UPDATE ON daily_summaries BEGIN
-              INSERT INTO events(table_name,op,row_id,snapshot)
-              VALUES('daily_summaries','update',0,
-                json_object('date',NEW.date,'summary',NEW.summary));
-            END;
-            CREATE TRIGGER IF NOT EXISTS trg_daily_summaries_delete AFTER DELETE ON daily_summaries BEGIN
-              INSERT INTO events(table_name,op,row_id,snapshot)
-              VALUES('daily_summaries','delete',0,
-                json_object('date',OLD.date,'summary',OLD.summary));
-            END;
-        """)
+                # executescript は先に COMMIT してしまうので 1 文ずつ実行する
+                cursor.execute(_event_trigger_sql(table, op))
+
+def _current_row_snapshot(cursor, table, row_key):
+    """行の現在の値をイベントのスナップショットと同じ形（EVENT_TABLES の列）で返す。行が無ければ None"""
+    columns = EVENT_TABLES[table][1]
+    cursor.execute(
+        "SELECT {} FROM {} WHERE {} = ?".format(", ".join(columns), table, EVENT_KEY_COLUMNS[table]),
+        (int(row_key) if table == 'study_logs' else row_key,)
+    )
+    row = cursor.fetchone()
+    return dict(zip(columns, row)) if row else None
+
+def _reconstruct_full_snapshots(cursor, rows):
+    """差分イベントを直前の insert（ベーススナップショット）から畳み込み、各イベント時点の完全な行に置き換える。
+
+    insert イベントが無い行（トリガー導入前からある行や、イベントが消された行）は現在の行を土台にする。
+    その場合、イベントより後に変わった列は新しい値になる。
+    """
+    states = {}
+    for ev in rows:
+        key = (ev['table_name'], ev.get('row_key'))
+        if ev['op'] == 'update':
+            if key not in states:
+                cursor.execute(
+                    "SELECT MAX(id) FROM events WHERE table_name = ? AND row_key = ? AND op = 'insert' AND id < ?",
+                    (ev['table_name'], ev.get('row_key'), ev['id'])
+                )
+                base_id = cursor.fetchone()[0]
+                state = {}
+                if base_id is None:
+                    base_id = 0
+                    if ev.get('row_key') is not None:
+                        state = _current_row_snapshot(cursor, ev['table_name'], ev['row_key']) or {}
+                cursor.execute(
+                    "SELECT snapshot FROM events WHERE table_name = ? AND row_key = ? AND id >= ? AND id < ? ORDER BY id",
+                    (ev['table_name'], ev.get('row_key'), base_id, ev['id'])
+                )
+                for (snap,) in cursor.fetchall():
+                    state.update(json.loads(snap) if snap else {})
+                states[key] = state
+            states[key] = {**states[key], **(json.loads(ev['snapshot']) if ev['snapshot'] else {})}
+            ev['snapshot'] = json.dumps(states[key], ensure_ascii=False, separators=(',', ':'))
+        elif ev['op'] == 'insert':
+            states[key] = json.loads(ev['snapshot']) if ev['snapshot'] else {}
+        else:
+            states.pop(key, None)
+    return rows
+
+def _fetch_events_since(cursor, since, limit):
+    cursor.execute("SELECT * FROM events WHERE id > ? ORDER BY id ASC LIMIT ?", (since, limit))
+    return [dict(r) for r in cursor.fetchall()]
+
+def _wait_for_data_change(conn, deadline):
+    """他の接続によるコミットで PRAGMA data_version が変わるまで待機する。
+    deadline (time.monotonic 基準) までに変化があれば True を返す。
+    """
+    base_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(EVENTS_WAIT_POLL_INTERVAL, remaining))
+        if conn.execute("PRAGMA data_version").fetchone()[0] != base_version:
+            return True
+
+def _clamp_wait_ms(value):
+    try:
+        wait_ms = int(value or 0)
+    except (TypeError, ValueError):
+        wait_ms = 0
+    return max(0, min(wait_ms, EVENTS_WAIT_MAX_MS))
 
 def action_data_events_since(params):
+    """since より新しいイベントを返す。
+    wait_ms を指定すると、イベントが無い場合に新しいイベントが届くかタイムアウトするまでブロックする。
+    update イベントの snapshot はキーと変更カラムのみ。full=true で完全な行に復元して返す。
+    fields を指定すると各イベントをそのキーだけに絞る（例: ["id", "table_name", "op"]）。
+    """
     since = int((params or {}).get('since', 0))
+    full = str((params or {}).get('full', '')).lower() in ('true', '1')
     limit = int((params or {}).get('limit', 100))
+    wait_ms = _clamp_wait_ms((params or {}).get('wait_ms'))
+    fields = parse_fields(params or {})
+    deadline = time.monotonic() + wait_ms / 1000.0
     with get_connection() as conn:
         conn.row_factory = sqlite3.Row
         cur = conn.cursor()
-        cur.execute("SELECT * FROM events WHERE id > ? ORDER BY id ASC LIMIT ?", (since, limit))
-        rows = [dict(r) for r in cur.fetchall()]
-        return { 'events': rows, 'last': rows[-1]['id'] if rows else since }
+        rows = _fetch_events_since(cur, since, limit)
+        while not rows and _wait_for_data_change(conn, deadline):
+            rows = _fetch_events_since(cur, since, limit)
+        # snapshot を返さないなら完全な行への復元も要らない
+        if full and rows and (fields is None or 'snapshot' in fields):
+            _reconstruct_full_snapshots(cur, rows)
+        last = rows[-1]['id'] if rows else since
+        return { 'events': project_records(rows, fields), 'last': last }
+
+def action_data_events_stream(params):
+    """イベントを NDJSON で標準出力へ逐次書き出す長寿命モード。
+    1行 = {"events": [...], "last": int}。イベントが無い間は heartbeat 行のみを出力する。
+    duration_ms を省略（0）した場合は、出力先が閉じられるまで継続する。
+    """
+    params = params or {}
+    since = int(params.get('since', 0))
+    limit = int(params.get('limit', 100))
+    full = str(params.get('full', '')).lower() in ('true', '1')
+    try:
+        duration_ms = max(0, int(params.get('duration_ms') or 0))
+    except (TypeError, ValueError):
+        duration_ms = 0
+    try:
+        heartbeat_ms = max(1, int(params.get('heartbeat_ms') or EVENTS_STREAM_HEARTBEAT_MS))
+    except (TypeError, ValueError):
+        heartbeat_ms = EVENTS_STREAM_HEARTBEAT_MS
+    end_at = time.monotonic() + duration_ms / 1000.0 if duration_ms else None
+
+    def emit(obj):
+        sys.stdout.write(json.dumps(obj, ensure_ascii=False, separators=(',', ':')) + "\n")
+        sys.stdout.flush()
+
+    with get_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cur = conn.cursor()
+        try:
+            while True:
+                rows = _fetch_events_since(cur, since, limit)
+                if rows:
+                    if full:
+                        _reconstruct_full_snapshots(cur, rows)
+                    since = rows[-1]['id']
+                    emit({'events': rows, 'last': since})
+                    # limit 件ちょうどなら残りがある可能性があるため待たずに続行
+                    if len(rows) >= limit:
+                        continue
+                now = time.monotonic()
+                if end_at is not None and now >= end_at:
+                    break
+                deadline = now + heartbeat_ms / 1000.0
+                if end_at is not None:
+                    deadline = min(deadline, end_at)
+                if not _wait_for_data_change(conn, deadline) and not rows:
+                    emit({'events': [], 'last': since, 'heartbeat': True})
+        except BrokenPipeError:
+            pass
+    return None
 
 # Ensure event triggers are present at import time
 try:
     ensure_event_triggers()
+    _event_triggers_ready = True
 except Exception as _e:
-    pass
+    _event_triggers_ready = False
+
+def _dashboard_periods(today, weekly_period_days=None):
+    """ダッシュボードの集計期間の開始日 (今日, 週, 月) を 'YYYY-MM-DD' で返す"""
+    if weekly_period_days:
+        start_of_period = today - datetime.timedelta(days=int(weekly_period_days) - 1)
+    else: # デフォルトは月曜始まりの週
+        start_of_period = today - datetime.timedelta(days=today.weekday())
+    return (today.strftime('%Y-%m-%d'), start_of_period.strftime('%Y-%m-%d'),
+            today.replace(day=1).strftime('%Y-%m-%d'))
+
+def _goal_achievement_rate(weekly_time, today):
+    """目標達成率 (1日平均6時間)"""
+    start_of_week_for_rate = today - datetime.timedelta(days=today.weekday())
+    days_in_week = (today - start_of_week_for_rate).days + 1
+    avg_daily_minutes = weekly_time / days_in_week if days_in_week > 0 else 0
+    daily_goal_minutes = 6 * 60
+    return (avg_daily_minutes / daily_goal_minutes) * 100 if daily_goal_minutes > 0 else 0
+
+def _study_streak(cursor, today):
+    """今日から遡って学習記録が続いている日数（今日の記録が無ければ 0）"""
+    streak = 0
+    day = today
+    while True:
+        cursor.execute(
+            "SELECT 1 FROM study_logs WHERE start_time >= ? AND start_time < ? LIMIT 1",
+            (day.strftime('%Y-%m-%d'), (day + datetime.timedelta(days=1)).strftime('%Y-%m-%d'))
+        )
+        if cursor.fetchone() is None:
+            return streak
+        streak += 1
+        day -= datetime.timedelta(days=1)
+
+def _dashboard_goal(goal_row):
+    goal_dict = dict(goal_row)
+    if goal_dict['tags']:
+        try:
+            goal_dict['tags'] = json.loads(goal_dict['tags'])
+        except json.JSONDecodeError:
+            goal_dict['tags'] = []
+    return goal_dict
+
+def _goal_is_completed(goal):
+    return bool(goal.get('completed', False) or
+                (goal.get('total_problems') is not None and
+                 goal.get('completed_problems') is not None and
+                 goal['total_problems'] > 0 and
+                 goal['completed_problems'] >= goal['total_problems']))
+
+def _dashboard_recent_sessions(cursor, today):
+    """最近の学習セッション (直近2件)"""
+    cursor.execute("""
+        SELECT subject, content, start_time, end_time, duration_minutes
+        FROM study_logs 
+        WHERE event_type IN ('START', 'RESUME')
+        ORDER BY start_time DESC 
+        LIMIT 2
+    """ )
+    recent_sessions = []
+    for row in cursor.fetchall():
+        start_time = datetime.datetime.strptime(row['start_time'], '%Y-%m-%d %H:%M:%S')
+        end_time = datetime.datetime.strptime(row['end_time'], '%Y-%m-%d %H:%M:%S') if row['end_time'] else start_time
+        # 相対日付ラベル（今日/昨日/◯日前）
+        days_ago = (today - start_time.date()).days
+        if days_ago == 0:
+            relative = "今日"
+        elif days_ago == 1:
+            relative = "昨日"
+        else:
+            relative = f"{days_ago}日前"
+
+        recent_sessions.append({
+            'subject': row['subject'],
+            'duration': row['duration_minutes'],
+            'time': "{}-{}".format(start_time.strftime('%H:%M'), end_time.strftime('%H:%M')),
+            'topic': row['content'],
+            'date': start_time.strftime('%Y-%m-%d'),
+            'relative': relative,
+        })
+    return recent_sessions
 
 def get_dashboard_data(weekly_period_days=None):
     """ダッシュボード用のデータを取得して返す"""
     today = datetime.date.today()
-    today_str = today.strftime('%Y-%m-%d')
+    today_str, period_start, month_start = _dashboard_periods(today, weekly_period_days)
     
     with get_connection() as conn:
         conn.row_factory = sqlite3.Row
@@ -1095,97 +1461,32 @@ def get_dashboard_data(weekly_period_days=None):
         )
         today_time = cursor.fetchone()[0] or 0
 
-        # 週の学習時間
-        if weekly_period_days:
-            start_of_period = today - datetime.timedelta(days=int(weekly_period_days) - 1)
-            weekly_time_query = "SELECT SUM(duration_minutes) FROM study_logs WHERE DATE(start_time) >= ? AND event_type IN ('START', 'RESUME')"
-            params = (start_of_period.strftime('%Y-%m-%d'),)
-        else: # デフォルトは月曜始まりの週
-            start_of_week = today - datetime.timedelta(days=today.weekday())
-            weekly_time_query = "SELECT SUM(duration_minutes) FROM study_logs WHERE DATE(start_time) >= ? AND event_type IN ('START', 'RESUME')"
-            params = (start_of_week.strftime('%Y-%m-%d'),)
-        
-        cursor.execute(weekly_time_query, params)
+        # 週の学習時間（days 指定時は直近 days 日）
+        cursor.execute(
+            "SELECT SUM(duration_minutes) FROM study_logs WHERE DATE(start_time) >= ? AND event_type IN ('START', 'RESUME')",
+            (period_start,)
+        )
         weekly_time = cursor.fetchone()[0] or 0
 
         # 今月の学習時間
-        start_of_month = today.replace(day=1)
         cursor.execute(
             "SELECT SUM(duration_minutes) FROM study_logs WHERE DATE(start_time) >= ? AND event_type IN ('START', 'RESUME')",
-            (start_of_month.strftime('%Y-%m-%d'),)
+            (month_start,)
         )
         monthly_time = cursor.fetchone()[0] or 0
 
-        # 目標達成率 (1日平均6時間)
-        start_of_week_for_rate = today - datetime.timedelta(days=today.weekday())
-        days_in_week = (today - start_of_week_for_rate).days + 1
-        avg_daily_minutes = weekly_time / days_in_week if days_in_week > 0 else 0
-        daily_goal_minutes = 6 * 60
-        goal_achievement_rate = (avg_daily_minutes / daily_goal_minutes) * 100 if daily_goal_minutes > 0 else 0
+        goal_achievement_rate = _goal_achievement_rate(weekly_time, today)
 
         # 連続学習日数
-        cursor.execute("SELECT DISTINCT DATE(start_time) FROM study_logs ORDER BY DATE(start_time) DESC")
-        dates = [datetime.datetime.strptime(row[0], '%Y-%m-%d').date() for row in cursor.fetchall()]
-        streak = 0
-        if dates:
-            current_date = today
-            if current_date in dates:
-                streak = 1
-                while (current_date - datetime.timedelta(days=1)) in dates:
-                    streak += 1
-                    current_date -= datetime.timedelta(days=1)
+        streak = _study_streak(cursor, today)
 
         # 今日の目標
         cursor.execute("SELECT * FROM goals WHERE date = ?", (today_str,))
-        today_goals_raw = cursor.fetchall()
-        today_goals = []
-        completed_goals = 0
-        total_goals = len(today_goals_raw)
-        for goal_row in today_goals_raw:
-            goal_dict = dict(goal_row)
-            if goal_dict['tags']:
-                try:
-                    goal_dict['tags'] = json.loads(goal_dict['tags'])
-                except json.JSONDecodeError:
-                    goal_dict['tags'] = []
-            today_goals.append(goal_dict)
-            if (goal_dict.get('completed', False) or 
-               (goal_dict.get('total_problems') is not None and 
-                goal_dict.get('completed_problems') is not None and 
-                goal_dict['total_problems'] > 0 and 
-                goal_dict['completed_problems'] >= goal_dict['total_problems'])):
-                completed_goals += 1
-
-        # 最近の学習セッション (直近2件)
-        cursor.execute("""
-            SELECT subject, content, start_time, end_time, duration_minutes
-            FROM study_logs 
-            WHERE event_type IN ('START', 'RESUME')
-            ORDER BY start_time DESC 
-            LIMIT 2
-        """ )
-        recent_sessions_raw = cursor.fetchall()
-        recent_sessions = []
-        for row in recent_sessions_raw:
-            start_time = datetime.datetime.strptime(row['start_time'], '%Y-%m-%d %H:%M:%S')
-            end_time = datetime.datetime.strptime(row['end_time'], '%Y-%m-%d %H:%M:%S') if row['end_time'] else start_time
-            # 相対日付ラベル（今日/昨日/◯日前）
-            days_ago = (today - start_time.date()).days
-            if days_ago == 0:
-                relative = "今日"
-            elif days_ago == 1:
-                relative = "昨日"
-            else:
-                relative = f"{days_ago}日前"
+        today_goals = [_dashboard_goal(goal_row) for goal_row in cursor.fetchall()]
+        completed_goals = sum(1 for goal in today_goals if _goal_is_completed(goal))
+        total_goals = len(today_goals)
 
-            recent_sessions.append({
-                'subject': row['subject'],
-                'duration': row['duration_minutes'],
-                'time': "{}-{}".format(start_time.strftime('%H:%M'), end_time.strftime('%H:%M')),
-                'topic': row['content'],
-                'date': start_time.strftime('%Y-%m-%d'),
-                'relative': relative,
-            })
+        recent_sessions = _dashboard_recent_sessions(cursor, today)
 
     dashboard_data = {
         "studyStats": {
@@ -1203,6 +1504,207 @@ def get_dashboard_data(weekly_period_days=None):
     
     return dashboard_data
 
+def _row_state_before(cursor, table, row_key, event_id):
+    """events を畳み込み、event_id 時点の行を返す。
+
+    返却: (known, row)。行が無ければ row は None。トリガー導入前からある行などで
+    insert が見つからず復元できない場合は known=False。
+    """
+    cursor.execute(
+        "SELECT op, snapshot FROM events WHERE table_name = ? AND row_key = ? AND id <= ? ORDER BY version",
+        (table, row_key, event_id)
+    )
+    history = cursor.fetchall()
+    if not history:
+        # event_id までにイベントが無い。その後の最初のイベントが insert なら新しい行、
+        # そうでなければトリガー導入前からある行で、event_id 時点の値は分からない
+        cursor.execute(
+            "SELECT op FROM events WHERE table_name = ? AND row_key = ? AND id > ? ORDER BY id LIMIT 1",
+            (table, row_key, event_id)
+        )
+        first = cursor.fetchone()
+        return (first is None or first[0] == 'insert'), None
+    state = None
+    known = True
+    for op, snapshot in history:
+        if op == 'insert':
+            state, known = (json.loads(snapshot) if snapshot else {}), True
+        elif op == 'delete':
+            state, known = None, True
+        elif state is None:
+            known = False
+        else:
+            state.update(json.loads(snapshot) if snapshot else {})
+    return known, state
+
+def _log_minutes(row, today_str, period_start, month_start):
+    """study_logs の 1 行がダッシュボードの (今日, 週, 月) の学習時間に足す分"""
+    if not row or row.get('event_type') not in ('START', 'RESUME') or not row.get('start_time'):
+        return (0, 0, 0)
+    minutes = row.get('duration_minutes') or 0
+    day = str(row['start_time'])[:10]
+    return (minutes if day == today_str else 0,
+            minutes if day >= period_start else 0,
+            minutes if day >= month_start else 0)
+
+def _parse_dashboard_cursor(cursor, since):
+    """since（前回の last、"<id>.<時刻>" または id）を events の id にする。
+
+    時刻が今の events と食い違う（undo / restore で履歴が分かれた）場合は None。
+    """
+    text = str(since).strip()
+    event_id, _, stamp = text.partition('.')
+    if not event_id.isdigit():
+        raise ValueError("sinceは data.dashboard_delta が返した last を指定してください。")
+    event_id = int(event_id)
+    if stamp and event_id > 0:
+        cursor.execute("SELECT ts FROM events WHERE id = ?", (event_id,))
+        row = cursor.fetchone()
+        if row is None or "".join(ch for ch in str(row[0]) if ch.isdigit()) != stamp:
+            return None
+    return event_id
+
+def _dashboard_delta_from_events(cursor, last, since, today, periods):
+    """since 以降の events からダッシュボードの差分を作る。作れなければ None"""
+    today_str, period_start, month_start = periods
+    since_id = _parse_dashboard_cursor(cursor, since)
+    if since_id is None or since_id > int(last.split('.')[0]):
+        return None
+    cursor.execute(
+        "SELECT id, table_name, op, row_key FROM events WHERE id > ? ORDER BY id LIMIT ?",
+        (since_id, DASHBOARD_DELTA_MAX_EVENTS + 1)
+    )
+    events = cursor.fetchall()
+    if len(events) > DASHBOARD_DELTA_MAX_EVENTS:
+        return None
+
+    # daily_summaries はダッシュボードに出ないので無視する
+    log_keys = []
+    goal_keys = []
+    for ev in events:
+        keys = {'study_logs': log_keys, 'goals': goal_keys}.get(ev['table_name'])
+        if keys is not None and ev['row_key'] not in keys:
+            keys.append(ev['row_key'])
+
+    result = {"full": False, "last": last, "date": today_str, "events": len(events)}
+    stats_delta = {}
+
+    # 学習ログ: 変わった行の前後の値から学習時間の増減を求める
+    minutes_delta = [0, 0, 0]
+    touched_days = {}
+    sessions_changed = False
+    for row_key in log_keys:
+        known, before = _row_state_before(cursor, 'study_logs', row_key, since_id)
+        if not known:
+            return None
+        cursor.execute("SELECT * FROM study_logs WHERE id = ?", (int(row_key),))
+        after_row = cursor.fetchone()
+        after = dict(after_row) if after_row else None
+        old = _log_minutes(before, today_str, period_start, month_start)
+        new = _log_minutes(after, today_str, period_start, month_start)
+        for i in range(3):
+            minutes_delta[i] += new[i] - old[i]
+        for state, sign in ((before, -1), (after, 1)):
+            if state and state.get('start_time'):
+                day = str(state['start_time'])[:10]
+                touched_days[day] = touched_days.get(day, 0) + sign
+            if state and state.get('event_type') in ('START', 'RESUME'):
+                sessions_changed = True
+    for key, value in zip(("todayTime", "weeklyTime", "monthlyTime"), minutes_delta):
+        if value:
+            stats_delta[key] = value
+    if minutes_delta[1]:
+        # 達成率は週の学習時間に比例するので、増減分だけを換算すればよい
+        stats_delta["goalAchievementRate"] = _goal_achievement_rate(minutes_delta[1], today)
+
+    # 記録のある日が増えた・消えたときだけ連続日数を数え直す
+    for day, added in touched_days.items():
+        if added == 0 or day > today_str:
+            continue
+        next_day = (datetime.date.fromisoformat(day) + datetime.timedelta(days=1)).isoformat()
+        cursor.execute(
+            "SELECT COUNT(*) FROM study_logs WHERE start_time >= ? AND start_time < ?",
+            (day, next_day)
+        )
+        count_now = cursor.fetchone()[0]
+        if (count_now > 0) != (count_now - added > 0):
+            result["studyStats"] = {"streak": _study_streak(cursor, today)}
+            break
+
+    # 今日の目標: 変わった行だけを返す
+    upserted, removed = [], []
+    completed_delta = total_delta = 0
+    for row_key in goal_keys:
+        known, before = _row_state_before(cursor, 'goals', row_key, since_id)
+        if not known:
+            return None
+        cursor.execute("SELECT * FROM goals WHERE id = ?", (row_key,))
+        after_row = cursor.fetchone()
+        after = _dashboard_goal(after_row) if after_row else None
+        was_today = bool(before) and before.get('date') == today_str
+        is_today = bool(after) and after.get('date') == today_str
+        total_delta += int(is_today) - int(was_today)
+        completed_delta += (int(is_today and _goal_is_completed(after))
+                            - int(was_today and _goal_is_completed(before)))
+        if is_today:
+            upserted.append(after)
+        elif was_today:
+            removed.append(row_key)
+    if completed_delta:
+        stats_delta["completedGoals"] = completed_delta
+    if total_delta:
+        stats_delta["totalGoals"] = total_delta
+    if upserted or removed:
+        result["todayGoals"] = {"upserted": upserted, "removed": removed}
+
+    if stats_delta:
+        result["studyStatsDelta"] = stats_delta
+    if sessions_changed:
+        result["recentSessions"] = _dashboard_recent_sessions(cursor, today)
+    return result
+
+def get_dashboard_delta(params):
+    """前回の取得以降に変わったダッシュボードの部分だけを返す。
+
+    params: { since: 前回の last, days: int (data.dashboard と同じ), date: 前回の date }
+    返却（差分）: { full: false, last, date, events,
+                    studyStatsDelta: {todayTime, weeklyTime, monthlyTime, goalAchievementRate,
+                                      completedGoals, totalGoals のうち変わったものの増減},
+                    studyStats: {streak}（変わったときのみ、絶対値）,
+                    todayGoals: {upserted: [...], removed: [id, ...]}（変わったときのみ）,
+                    recentSessions: [...]（変わったときのみ、2 件すべて） }
+    since が無い・日付が変わった・イベントが DASHBOARD_DELTA_MAX_EVENTS 件を超える・
+    履歴を復元できない場合は { full: true, last, date, ...data.dashboard の内容 } を返す。
+    増減は events に残った変更行の前後の値から求めるので、集計のやり直しはしない。
+    """
+    params = params or {}
+    days = params.get("days")
+    since = params.get("since")
+    today = datetime.date.today()
+    periods = _dashboard_periods(today, days)
+    today_str = periods[0]
+
+    with get_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        # 以降の読み取りを同じスナップショットで行う（StudyLogStore の作業単位内ならそのまま）
+        began = not conn.in_transaction
+        if began:
+            conn.execute("BEGIN")
+        try:
+            last = read_data_version(conn)
+            if last is None:
+                raise ValueError("events テーブルがありません。")
+            result = None
+            if since not in (None, "", 0, "0") and (params.get("date") or today_str) == today_str:
+                result = _dashboard_delta_from_events(cursor, last, since, today, periods)
+            if result is None:
+                result = {"full": True, "last": last, "date": today_str, **get_dashboard_data(days)}
+        finally:
+            if began:
+                conn.commit()
+    return result
+
 def recalculate_all_durations():
     """すべてのログのduration_minutesを再計算する"""
     backup_database("Before recalculating all durations.")
@@ -1230,7 +1732,9 @@ def recalculate_all_durations():
 
 # --- タグ抽出・検索（新規） ---
 import re
+import bisect
 import unicodedata
+from array import array
 
 # 半角/全角シャープの両方を許可
 HASHTAG_RE = re.compile(r"[#＃]([\w\u0080-\uFFFF\-]+)")
@@ -1639,6 +2143,698 @@ def search_data(params):
     }
 
 
+# --- 検索語彙インデックス（サジェスト） ---
+# _norm 済みテキストを文字種ごとの連続（英数字/カタカナ/漢字）で語に分割する。
+# ひらがなのみの連続は助詞・語尾が大半のため語彙に含めない。
+VOCAB_TERM_RE = re.compile(r"[0-9a-z_\-]+|[\u30a0-\u30ff]+|[\u3400-\u9fff\uf900-\ufaff々〆]+")
+VOCAB_MAX_TERM_LEN = 32
+# 索引の作成は 1 トランザクションにこの件数の文書ずつ入れてコミットする（読み取りを長く止めない）
+SEARCH_INDEX_BATCH_DOCS = 2000
+# 差分更新で 1 トランザクションに入れるイベント数。制限時間つきの読み取りはこれより大きい遅れを追わない
+SEARCH_INDEX_SYNC_MAX_EVENTS = 2000
+# 作成中の印の有効期限（秒）。作成中に落ちたプロセスの続きは、期限切れ後に別のプロセスが引き継ぐ
+SEARCH_INDEX_BUILD_LEASE_SEC = 60
+SEARCH_DOC_FIELDS = {
+    'study_logs': ("id", ['content', 'summary', 'memo', 'impression']),
+    'goals': ("id", ['task', 'details']),
+    'daily_summaries': ("date", ['summary']),
+}
+
+def _extract_vocab_terms(*texts):
+    """正規化したテキスト群から語の集合を返す（data.search と同じ _norm を使用）。"""
+    terms = set()
+    for text in texts:
+        for m in VOCAB_TERM_RE.finditer(_norm(text)):
+            term = m.group(0).strip('_-')
+            if term and len(term) <= VOCAB_MAX_TERM_LEN:
+                terms.add(term)
+    return terms
+
+def ensure_search_index_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS search_index_state (
+            name TEXT PRIMARY KEY,
+            last_event_id INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS search_vocab (
+            term TEXT PRIMARY KEY,
+            freq INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_vocab_freq ON search_vocab(freq DESC)")
+    # 文書ごとに登録済みの語（更新・削除時の差し引きに使う）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS search_vocab_docs (
+            doc_key TEXT PRIMARY KEY,
+            terms TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    # 作成途中の索引（作成開始時点のイベントID・続きの位置・作成中のプロセスの印）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS search_index_builds (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            start_event_id INTEGER NOT NULL,
+            progress TEXT,
+            lease_until REAL NOT NULL
+        )
+    """)
+    ensure_similar_index_tables(cursor)
+
+def _fetch_search_doc(cursor, table, row_key):
+    """検索対象文書の現在のテキストフィールドを返す（行が無ければ None）。"""
+    key_col, fields = SEARCH_DOC_FIELDS[table]
+    cursor.execute(
+        "SELECT {} FROM {} WHERE {} = ?".format(", ".join(fields), table, key_col),
+        (int(row_key) if table == 'study_logs' else row_key,)
+    )
+    return cursor.fetchone()
+
+def _next_search_docs(cursor, progress, limit):
+    """progress（{"table", "key"}、None なら先頭）の続きから最大 limit 件の文書を返す。
+
+    返却: ([(table, row_key, texts)], 次の progress。最後まで読んだら None)
+    """
+    tables = list(SEARCH_DOC_FIELDS)
+    start = tables.index(progress['table']) if progress else 0
+    key = progress['key'] if progress else None
+    docs = []
+    for table in tables[start:]:
+        key_col, fields = SEARCH_DOC_FIELDS[table]
+        where, args = ("WHERE {} > ?".format(key_col), [key]) if key is not None else ("", [])
+        cursor.execute(
+            "SELECT {0}, {1} FROM {2} {3} ORDER BY {0} LIMIT ?".format(key_col, ", ".join(fields), table, where),
+            args + [limit - len(docs)]
+        )
+        rows = cursor.fetchall()
+        docs.extend((table, str(row[0]), row[1:]) for row in rows)
+        if len(docs) >= limit:
+            return docs, {"table": table, "key": rows[-1][0]}
+        key = None
+    return docs, None
+
+def _changed_search_docs(cursor, last_event_id, upto_event_id):
+    """(last_event_id, upto_event_id] のイベントで変更された検索対象の (table, row_key) の集合を返す。"""
+    cursor.execute(
+        "SELECT DISTINCT table_name, row_key FROM events WHERE id > ? AND id <= ?",
+        (last_event_id, upto_event_id)
+    )
+    return {
+        (table, row_key) for table, row_key in cursor.fetchall()
+        if table in SEARCH_DOC_FIELDS and row_key is not None
+    }
+
+def _read_index_sync(cursor, name):
+    cursor.execute("SELECT last_event_id FROM search_index_state WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM events")
+    return (row[0] if row else None), cursor.fetchone()[0]
+
+def _set_index_state(cursor, name, last_event_id):
+    cursor.execute(
+        "INSERT OR REPLACE INTO search_index_state (name, last_event_id) VALUES (?, ?)",
+        (name, last_event_id)
+    )
+
+def _apply_vocab_doc(cursor, doc_key, new_terms):
+    cursor.execute("SELECT terms FROM search_vocab_docs WHERE doc_key = ?", (doc_key,))
+    row = cursor.fetchone()
+    old_terms = set(json.loads(row[0])) if row else set()
+    removed = old_terms - new_terms
+    added = new_terms - old_terms
+    if removed:
+        cursor.executemany("UPDATE search_vocab SET freq = freq - 1 WHERE term = ?", [(t,) for t in removed])
+    if added:
+        cursor.executemany(
+            "INSERT INTO search_vocab (term, freq) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET freq = freq + 1",
+            [(t,) for t in added]
+        )
+    if removed:
+        cursor.execute("DELETE FROM search_vocab WHERE freq <= 0")
+    if new_terms:
+        cursor.execute(
+            "INSERT OR REPLACE INTO search_vocab_docs (doc_key, terms) VALUES (?, ?)",
+            (doc_key, json.dumps(sorted(new_terms), ensure_ascii=False))
+        )
+    elif row:
+        cursor.execute("DELETE FROM search_vocab_docs WHERE doc_key = ?", (doc_key,))
+
+def _clear_vocab_index(cursor):
+    cursor.execute("DELETE FROM search_vocab")
+    cursor.execute("DELETE FROM search_vocab_docs")
+
+def _build_vocab_batch(cursor, progress):
+    docs, progress = _next_search_docs(cursor, progress, SEARCH_INDEX_BATCH_DOCS)
+    for table, row_key, texts in docs:
+        _apply_vocab_doc(cursor, f"{table}:{row_key}", _extract_vocab_terms(*texts))
+    return progress
+
+def _catch_up_vocab(cursor, changed):
+    for table, row_key in changed:
+        row = _fetch_search_doc(cursor, table, row_key)
+        terms = _extract_vocab_terms(*row) if row else set()
+        _apply_vocab_doc(cursor, f"{table}:{row_key}", terms)
+
+def _search_index_build_step(cursor, name, owner):
+    """索引 name の作成を 1 バッチ進める（BEGIN IMMEDIATE の中で呼ぶ）。
+
+    返却: 作成済みなら True、他のプロセスが作成中なら False、続きがあれば None
+    """
+    last_event_id, max_event_id = _read_index_sync(cursor, name)
+    if last_event_id is not None:
+        return True
+    cursor.execute(
+        "SELECT owner, start_event_id, progress, lease_until FROM search_index_builds WHERE name = ?", (name,)
+    )
+    row = cursor.fetchone()
+    now = time.time()
+    if row and row[0] != owner and row[3] > now:
+        return False
+    clear, build_batch, _ = SEARCH_INDEXES[name]
+    if row:
+        start_event_id, progress = row[1], json.loads(row[2]) if row[2] else None
+    else:
+        clear(cursor)
+        start_event_id, progress = max_event_id, None
+    progress = build_batch(cursor, progress)
+    if progress is None:
+        # 作成中に変わった文書は、start_event_id 以降の events から差分更新で取り込む
+        _set_index_state(cursor, name, start_event_id)
+        cursor.execute("DELETE FROM search_index_builds WHERE name = ?", (name,))
+        return True
+    cursor.execute(
+        "INSERT OR REPLACE INTO search_index_builds (name, owner, start_event_id, progress, lease_until) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (name, owner, start_event_id, json.dumps(progress, ensure_ascii=False), now + SEARCH_INDEX_BUILD_LEASE_SEC)
+    )
+    return None
+
+def build_search_index(conn, name):
+    """索引 name を全文書から作る。
+
+    SEARCH_INDEX_BATCH_DOCS 件ごとにコミットして続きの位置を search_index_builds に残すので、
+    途中で止まっても次の実行（期限切れ後は別のプロセス）が続きから作る。
+    返却: 作成済みなら True、他のプロセスが作成中なら False
+    """
+    owner = uuid.uuid4().hex
+    cursor = conn.cursor()
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = _search_index_build_step(cursor, name, owner)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if done is not None:
+            return done
+
+def start_background_index_build(cursor):
+    """db.build_search_index を切り離したプロセスで起動する（作成中・取り込み中なら何もしない）"""
+    if os.environ.get('MANAGE_LOG_INDEX_SPAWN', '1').strip() == '0':
+        return
+    cursor.execute("SELECT 1 FROM search_index_builds WHERE lease_until > ? LIMIT 1", (time.time(),))
+    if cursor.fetchone():
+        return
+    payload = json.dumps({"action": "db.build_search_index"})
+    try:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--api-mode', 'execute', payload],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            close_fds=True,
+        )
+    except OSError as e:
+        logger.warning(f"索引作成プロセスを起動できませんでした: {e}")
+
+def sync_search_index(conn, name, build_inline=None):
+    """索引 name を events に追いつかせる。返却: 索引を読めるなら True
+
+    build_inline が偽のとき（既定は制限時間つきのアクションの中）は、未作成の索引の作成と
+    SEARCH_INDEX_SYNC_MAX_EVENTS を超える遅れの取り込みをバックグラウンドの
+    db.build_search_index に任せ、その間は作成済みの（少し古い）索引で答える。
+    追いついていれば書き込みロックを取らない。
+    """
+    if build_inline is None:
+        build_inline = runtime.deadline is None
+    cursor = conn.cursor()
+    ensure_search_index_tables(cursor)
+    conn.commit()
+    last_event_id, max_event_id = _read_index_sync(cursor, name)
+    if last_event_id is None:
+        if not build_inline:
+            start_background_index_build(cursor)
+            return False
+        if not build_search_index(conn, name):
+            return False
+        last_event_id, max_event_id = _read_index_sync(cursor, name)
+    if last_event_id >= max_event_id:
+        return True
+    if not build_inline and max_event_id - last_event_id > SEARCH_INDEX_SYNC_MAX_EVENTS:
+        start_background_index_build(cursor)
+        return True
+    catch_up = SEARCH_INDEXES[name][2]
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # ロックを待つ間に他のプロセスが同期したかもしれないので読み直す
+            last_event_id, max_event_id = _read_index_sync(cursor, name)
+            if last_event_id is None or last_event_id >= max_event_id:
+                conn.rollback()
+                return last_event_id is not None
+            upto = min(max_event_id, last_event_id + SEARCH_INDEX_SYNC_MAX_EVENTS)
+            catch_up(cursor, _changed_search_docs(cursor, last_event_id, upto))
+            _set_index_state(cursor, name, upto)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if upto >= max_event_id:
+            return True
+
+def update_search_indexes():
+    """書き込み系アクションの後で、作成済みの索引を差分更新する（失敗してもアクションの結果は変えない）"""
+    try:
+        with get_connection() as conn:
+            for name in SEARCH_INDEXES:
+                sync_search_index(conn, name, build_inline=False)
+    except sqlite3.Error as e:
+        logger.warning(f"検索索引の差分更新に失敗しました: {e}")
+
+def action_db_build_search_index(params=None):
+    """検索語彙・類似検索の索引を作成し、events に追いつかせる（制限時間なし）"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        ensure_search_index_tables(cursor)
+        # 取り込み中の印。バックグラウンドの起動が読み取りのたびに重ならないようにする
+        cursor.execute(
+            "INSERT OR REPLACE INTO search_index_builds (name, owner, start_event_id, progress, lease_until) "
+            "VALUES ('background', ?, 0, NULL, ?)",
+            (str(os.getpid()), time.time() + SEARCH_INDEX_BUILD_LEASE_SEC)
+        )
+        conn.commit()
+        try:
+            ready = [name for name in SEARCH_INDEXES if sync_search_index(conn, name, build_inline=True)]
+        finally:
+            cursor.execute("DELETE FROM search_index_builds WHERE name = 'background'")
+            conn.commit()
+    return {"status": "success", "indexes": ready}
+
+def search_suggest(params):
+    """語彙インデックスから前方一致する語を出現文書数の降順で返す。
+    params: { prefix: str（q を渡した場合は最後の語を使用）, limit: int (default 10) }
+    返却: { prefix, suggestions: [{term, count}] }
+    """
+    raw = params.get('prefix')
+    if raw is None:
+        words = re.split(r"\s+", (params.get('q') or '').strip())
+        raw = words[-1] if words else ''
+    prefix = _norm(str(raw).strip().lstrip('#＃'))
+    try:
+        limit = max(1, min(int(params.get('limit') or 10), 100))
+    except (TypeError, ValueError):
+        limit = 10
+
+    with get_connection() as conn:
+        if not sync_search_index(conn, 'vocab'):
+            # 索引はバックグラウンドで作成中（制限時間つきの読み取りでは全件から作らない）
+            return {"prefix": prefix, "suggestions": [], "index_pending": True}
+        cursor = conn.cursor()
+        if prefix:
+            upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            cursor.execute(
+                "SELECT term, freq FROM search_vocab WHERE term >= ? AND term < ? ORDER BY freq DESC, term LIMIT ?",
+                (prefix, upper, limit)
+            )
+        else:
+            cursor.execute("SELECT term, freq FROM search_vocab ORDER BY freq DESC, term LIMIT ?", (limit,))
+        suggestions = [{"term": term, "count": freq} for term, freq in cursor.fetchall()]
+    return {"prefix": prefix, "suggestions": suggestions}
+
+
+# --- 類似検索インデックス（文字n-gram TF-IDF） ---
+# 転置リストは gram ごとに doc_id 昇順の array('I') と tf の array('I') を BLOB で保持する。
+SIMILAR_NGRAM = 2
+SIMILAR_MAX_QUERY_GRAMS = 64
+SIMILAR_MAX_DF_RATIO = 0.5
+SIMILAR_NORM_REFRESH_RATIO = 0.1
+SIMILAR_KINDS = {'entry': 'study_logs', 'goal': 'goals', 'summary': 'daily_summaries'}
+SIMILAR_TABLE_KINDS = {v: k for k, v in SIMILAR_KINDS.items()}
+
+def _char_ngrams(*texts):
+    """_norm 済みテキストから文字n-gramの出現回数を返す。"""
+    grams = {}
+    for text in texts:
+        t = re.sub(r"\s+", " ", _norm(text)).strip()
+        if not t:
+            continue
+        if len(t) < SIMILAR_NGRAM:
+            grams[t] = grams.get(t, 0) + 1
+            continue
+        for i in range(len(t) - SIMILAR_NGRAM + 1):
+            g = t[i:i + SIMILAR_NGRAM]
+            if g.strip():
+                grams[g] = grams.get(g, 0) + 1
+    return grams
+
+def ensure_similar_index_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS similar_docs (
+            doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            doc_key TEXT NOT NULL UNIQUE,
+            grams TEXT NOT NULL,
+            norm REAL NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS similar_postings (
+            gram TEXT PRIMARY KEY,
+            doc_ids BLOB NOT NULL,
+            tfs BLOB NOT NULL
+        ) WITHOUT ROWID
+    """)
+    # df は転置リストとは別に持つ（高頻出 gram を除くのに BLOB を読まずに済む）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS similar_df (
+            gram TEXT PRIMARY KEY,
+            df INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS similar_stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+
+def _similar_idf(n_docs, df):
+    return math.log(1 + n_docs / df)
+
+def _load_dfs(cursor, grams):
+    dfs = {}
+    grams = list(grams)
+    for i in range(0, len(grams), 500):
+        chunk = grams[i:i + 500]
+        cursor.execute(
+            "SELECT gram, df FROM similar_df WHERE gram IN ({})".format(",".join("?" * len(chunk))),
+            chunk
+        )
+        dfs.update(cursor.fetchall())
+    return dfs
+
+def _tfidf_norm(grams, dfs, n_docs):
+    return math.sqrt(sum(
+        (tf * _similar_idf(n_docs, dfs[g])) ** 2 for g, tf in grams.items() if dfs.get(g)
+    ))
+
+def _load_posting(cursor, gram):
+    cursor.execute("SELECT doc_ids, tfs FROM similar_postings WHERE gram = ?", (gram,))
+    row = cursor.fetchone()
+    ids, tfs = array('I'), array('I')
+    if row:
+        ids.frombytes(row[0])
+        tfs.frombytes(row[1])
+    return ids, tfs
+
+def _store_posting(cursor, gram, ids, tfs):
+    if ids:
+        cursor.execute(
+            "INSERT OR REPLACE INTO similar_postings (gram, doc_ids, tfs) VALUES (?, ?, ?)",
+            (gram, ids.tobytes(), tfs.tobytes())
+        )
+        cursor.execute("INSERT OR REPLACE INTO similar_df (gram, df) VALUES (?, ?)", (gram, len(ids)))
+    else:
+        cursor.execute("DELETE FROM similar_postings WHERE gram = ?", (gram,))
+        cursor.execute("DELETE FROM similar_df WHERE gram = ?", (gram,))
+
+def _apply_similar_doc(cursor, doc_key, grams):
+    """1文書分の転置リストを差分更新する（grams が空なら文書を削除）。
+
+    返却: 残っている文書の doc_id（削除した・変化が無い場合は None）。norm は呼び出し側で更新する。
+    """
+    cursor.execute("SELECT doc_id, grams FROM similar_docs WHERE doc_key = ?", (doc_key,))
+    row = cursor.fetchone()
+    old_grams = json.loads(row[1]) if row else {}
+    if row and old_grams == grams:
+        return None
+    if row:
+        doc_id = row[0]
+    elif grams:
+        cursor.execute("INSERT INTO similar_docs (doc_key, grams, norm) VALUES (?, '{}', 0)", (doc_key,))
+        doc_id = cursor.lastrowid
+    else:
+        return None
+
+    for gram in set(old_grams) | set(grams):
+        tf = grams.get(gram, 0)
+        if old_grams.get(gram, 0) == tf:
+            continue
+        ids, tfs = _load_posting(cursor, gram)
+        pos = bisect.bisect_left(ids, doc_id)
+        present = pos < len(ids) and ids[pos] == doc_id
+        if tf and present:
+            tfs[pos] = tf
+        elif tf:
+            ids.insert(pos, doc_id)
+            tfs.insert(pos, tf)
+        elif present:
+            del ids[pos]
+            del tfs[pos]
+        _store_posting(cursor, gram, ids, tfs)
+
+    if grams:
+        cursor.execute(
+            "UPDATE similar_docs SET grams = ? WHERE doc_id = ?",
+            (json.dumps(grams, ensure_ascii=False), doc_id)
+        )
+        return doc_id
+    cursor.execute("DELETE FROM similar_docs WHERE doc_id = ?", (doc_id,))
+    return None
+
+def _refresh_similar_norms(cursor, doc_ids=None):
+    """文書の tf-idf ノルムを現在の df で計算し直す（doc_ids が None なら全文書）。
+
+    idf は文書数に応じて少しずつ変わるので、全文書の計算し直しは文書数が
+    SIMILAR_NORM_REFRESH_RATIO 以上変わったときだけ行い、それ以外は変更された文書だけを更新する。
+    """
+    cursor.execute("SELECT COUNT(*) FROM similar_docs")
+    n_docs = cursor.fetchone()[0]
+    cursor.execute("SELECT value FROM similar_stats WHERE name = 'norm_docs'")
+    row = cursor.fetchone()
+    if row is None or abs(n_docs - row[0]) > row[0] * SIMILAR_NORM_REFRESH_RATIO:
+        doc_ids = None
+    if doc_ids is None:
+        cursor.execute("SELECT gram, df FROM similar_df")
+        dfs = dict(cursor.fetchall())
+        cursor.execute("SELECT doc_id, grams FROM similar_docs")
+        docs = cursor.fetchall()
+        cursor.execute(
+            "INSERT OR REPLACE INTO similar_stats (name, value) VALUES ('norm_docs', ?)", (n_docs,)
+        )
+        _update_similar_norms(cursor, docs, n_docs, dfs)
+        return
+    docs = []
+    doc_ids = list(doc_ids)
+    for i in range(0, len(doc_ids), 500):
+        chunk = doc_ids[i:i + 500]
+        cursor.execute(
+            "SELECT doc_id, grams FROM similar_docs WHERE doc_id IN ({})".format(",".join("?" * len(chunk))),
+            chunk
+        )
+        docs.extend(cursor.fetchall())
+    _update_similar_norms(cursor, docs, n_docs)
+
+def _update_similar_norms(cursor, docs, n_docs, dfs=None):
+    """docs（[(doc_id, grams JSON)]）の norm を書き換える（dfs が無ければ docs の gram の分だけ読む）"""
+    if dfs is None:
+        dfs = _load_dfs(cursor, {g for _, grams in docs for g in json.loads(grams)})
+    cursor.executemany(
+        "UPDATE similar_docs SET norm = ? WHERE doc_id = ?",
+        [(_tfidf_norm(json.loads(grams), dfs, n_docs), doc_id) for doc_id, grams in docs]
+    )
+
+def _clear_similar_index(cursor):
+    cursor.execute("DELETE FROM similar_postings")
+    cursor.execute("DELETE FROM similar_df")
+    cursor.execute("DELETE FROM similar_docs")
+    cursor.execute("DELETE FROM similar_stats")
+
+def _append_similar_docs(cursor, docs):
+    """新しい文書をまとめて追加する。doc_id は単調増加なので、既存の転置リストの末尾に足すだけでよい"""
+    postings = {}
+    for table, row_key, texts in docs:
+        grams = _char_ngrams(*texts)
+        if not grams:
+            continue
+        cursor.execute(
+            "INSERT INTO similar_docs (doc_key, grams, norm) VALUES (?, ?, 0)",
+            (f"{table}:{row_key}", json.dumps(grams, ensure_ascii=False))
+        )
+        doc_id = cursor.lastrowid
+        for gram, tf in grams.items():
+            ids, tfs = postings.setdefault(gram, (array('I'), array('I')))
+            ids.append(doc_id)
+            tfs.append(tf)
+    for gram, (new_ids, new_tfs) in postings.items():
+        ids, tfs = _load_posting(cursor, gram)
+        ids.extend(new_ids)
+        tfs.extend(new_tfs)
+        _store_posting(cursor, gram, ids, tfs)
+
+def _build_similar_batch(cursor, progress):
+    """転置リストを文書のバッチごとに作り（phase=docs）、最後に全文書の tf-idf ノルムを計算する（phase=norms）。"""
+    if progress is None or progress['phase'] == 'docs':
+        docs, progress = _next_search_docs(cursor, progress, SEARCH_INDEX_BATCH_DOCS)
+        _append_similar_docs(cursor, docs)
+        if progress is None:
+            return {"phase": "norms", "doc_id": 0}
+        progress['phase'] = 'docs'
+        return progress
+    cursor.execute("SELECT COUNT(*) FROM similar_docs")
+    n_docs = cursor.fetchone()[0]
+    cursor.execute(
+        "SELECT doc_id, grams FROM similar_docs WHERE doc_id > ? ORDER BY doc_id LIMIT ?",
+        (progress['doc_id'], SEARCH_INDEX_BATCH_DOCS)
+    )
+    docs = cursor.fetchall()
+    if not docs:
+        cursor.execute(
+            "INSERT OR REPLACE INTO similar_stats (name, value) VALUES ('norm_docs', ?)", (n_docs,)
+        )
+        return None
+    _update_similar_norms(cursor, docs, n_docs)
+    return {"phase": "norms", "doc_id": docs[-1][0]}
+
+def _catch_up_similar(cursor, changed):
+    touched = set()
+    for table, row_key in changed:
+        row = _fetch_search_doc(cursor, table, row_key)
+        grams = _char_ngrams(*row) if row else {}
+        doc_id = _apply_similar_doc(cursor, f"{table}:{row_key}", grams)
+        if doc_id is not None:
+            touched.add(doc_id)
+    _refresh_similar_norms(cursor, touched)
+
+# 索引名 -> (全削除, 作成を 1 バッチ進める, 変更された文書を取り込む)。
+# similar_tfidf は df 表と tf-idf ノルムを持たない旧形式の索引（'similar'）を作り直すために名前を変えている
+SEARCH_INDEXES = {
+    'vocab': (_clear_vocab_index, _build_vocab_batch, _catch_up_vocab),
+    'similar_tfidf': (_clear_similar_index, _build_similar_batch, _catch_up_similar),
+}
+
+def find_similar(params):
+    """指定した entry/goal/summary に類似する項目を TF-IDF コサイン類似度の降順で返す。
+    params: { kind: 'entry'|'goal'|'summary', id: int|str, type: 'all'|'entry'|'goal'|'summary', limit: int (default 10) }
+    返却: { items: [{kind, id, date, subject, preview, score}] }
+    """
+    kind = (params.get('kind') or 'entry').lower()
+    table = SIMILAR_KINDS.get(kind)
+    if not table:
+        raise ValueError(f"kind は {', '.join(SIMILAR_KINDS)} のいずれかです。")
+    target_id = params.get('id')
+    if target_id is None or str(target_id) == '':
+        raise ValueError("idは必須です。")
+    typ = (params.get('type') or 'all').lower()
+    try:
+        limit = max(1, min(int(params.get('limit') or 10), 100))
+    except (TypeError, ValueError):
+        limit = 10
+
+    with get_connection() as conn:
+        if not sync_search_index(conn, 'similar_tfidf'):
+            # 索引はバックグラウンドで作成中（制限時間つきの読み取りでは全件から作らない）
+            return {"items": [], "index_pending": True}
+        cursor = conn.cursor()
+        target_key = f"{table}:{target_id}"
+        cursor.execute("SELECT doc_id, grams, norm FROM similar_docs WHERE doc_key = ?", (target_key,))
+        target = cursor.fetchone()
+        if not target:
+            return {"items": []}
+        target_doc_id, target_grams = target[0], json.loads(target[1])
+        cursor.execute("SELECT COUNT(*) FROM similar_docs")
+        n_docs = cursor.fetchone()[0]
+
+        # クエリ側: df 表だけで重みを求め、高頻出 gram を除いて重みの大きい順に絞ってから転置リストを読む
+        dfs = _load_dfs(cursor, target_grams)
+        query_norm = _tfidf_norm(target_grams, dfs, n_docs)
+        weighted = []
+        for gram, tf in target_grams.items():
+            df = dfs.get(gram)
+            if not df or (n_docs > 10 and df > n_docs * SIMILAR_MAX_DF_RATIO):
+                continue
+            idf = _similar_idf(n_docs, df)
+            weighted.append((tf * idf, idf, gram))
+        weighted.sort(key=lambda x: x[0], reverse=True)
+
+        scores = {}
+        for wq, idf, gram in weighted[:SIMILAR_MAX_QUERY_GRAMS]:
+            ids, tfs = _load_posting(cursor, gram)
+            for doc_id, tf in zip(ids, tfs):
+                if doc_id != target_doc_id:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + wq * tf * idf
+        if not scores or not query_norm:
+            return {"items": []}
+
+        doc_ids = list(scores)
+        norms = {}
+        keys = {}
+        for i in range(0, len(doc_ids), 500):
+            chunk = doc_ids[i:i + 500]
+            cursor.execute(
+                "SELECT doc_id, doc_key, norm FROM similar_docs WHERE doc_id IN ({})".format(",".join("?" * len(chunk))),
+                chunk
+            )
+            for doc_id, doc_key, norm in cursor.fetchall():
+                norms[doc_id] = norm
+                keys[doc_id] = doc_key
+
+        ranked = []
+        for doc_id, score in scores.items():
+            doc_key = keys.get(doc_id)
+            if not doc_key:
+                continue
+            doc_table, row_key = doc_key.split(':', 1)
+            doc_kind = SIMILAR_TABLE_KINDS[doc_table]
+            if typ != 'all' and doc_kind != typ:
+                continue
+            cosine = score / (query_norm * (norms.get(doc_id) or 1.0))
+            ranked.append((cosine, doc_kind, doc_table, row_key))
+        ranked.sort(key=lambda x: x[0], reverse=True)
+
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        items = []
+        for cosine, doc_kind, doc_table, row_key in ranked[:limit]:
+            if doc_table == 'study_logs':
+                cursor.execute("SELECT id, subject, content, summary, memo, impression, start_time FROM study_logs WHERE id = ?", (int(row_key),))
+                row = cursor.fetchone()
+                if not row:
+                    continue
+                items.append({'kind': doc_kind, 'id': row['id'], 'date': (row['start_time'] or '')[:10] or None,
+                              'subject': row['subject'],
+                              'preview': _make_preview(row['summary'], row['content'], row['memo'], row['impression']),
+                              'score': round(cosine, 4)})
+            elif doc_table == 'goals':
+                cursor.execute("SELECT id, date, subject, task, details FROM goals WHERE id = ?", (row_key,))
+                row = cursor.fetchone()
+                if not row:
+                    continue
+                items.append({'kind': doc_kind, 'id': row['id'], 'date': row['date'], 'subject': row['subject'],
+                              'preview': _make_preview(row['task'], row['details']), 'score': round(cosine, 4)})
+            else:
+                cursor.execute("SELECT date, summary FROM daily_summaries WHERE date = ?", (row_key,))
+                row = cursor.fetchone()
+                if not row:
+                    continue
+                items.append({'kind': doc_kind, 'id': row['date'], 'date': row['date'],
+                              'preview': _make_preview(row['summary']), 'score': round(cosine, 4)})
+    return {"items": items}
+
+
 def reconstruct_from_json(json_data_str):
     """JSONデータからデータベースを再構築し、結果を返す"""
     try:
@@ -1712,11 +2908,23 @@ def main():
     api_mode = '--api-mode' in sys.argv
     if api_mode:
         sys.argv.remove('--api-mode')
+    profile_top = pop_profile_flags(sys.argv)
+    if profile_top is None and len(sys.argv) == 3 and sys.argv[1] == 'execute':
+        profile_top = envelope_profile_top(sys.argv[2])
+    profile = ActionProfile(profile_top) if profile_top is not None else None
 
     setup_logging(api_mode=api_mode)
+    if profile:
+        profile.mark_startup()
+        activate_profile(profile)
     
-    create_tables()
-    ensure_study_log_columns()
+    with profile.phase('ddl') if profile else contextlib.nullcontext():
+        create_tables()
+        ensure_study_log_columns()
+        if not _event_triggers_ready:
+            # 新規 DB では import 時にまだ study_logs が無くトリガーを作れないので、ここで作る
+            # （作らないと最初の書き込みが events に残らず、ETag が変わらない）
+            ensure_event_triggers()
 
     if len(sys.argv) < 2 or sys.argv[1] in ('--help', '-h'):
         print_help()
@@ -1728,7 +2936,7 @@ def main():
         if len(sys.argv) != 3: # executeの引数はJSON文字列1つのみ
             logger.error("使用法: python manage_log.py [--api-mode] execute '<json_string>'")
             sys.exit(1)
-        handle_execute(sys.argv[2])
+        handle_execute(sys.argv[2], profile)
     else:
         logger.error(f"エラー: 不明なコマンド '{command}'。'execute' コマンドを使用してください。")
         logger.error("詳細は --help を確認してください。")
@@ -1737,29 +2945,103 @@ def main():
 
 # --- 新しいコマンド体系 ---
 
-def handle_execute(json_string):
-    """新しい'execute'コマンドを処理する"""
+# params が空のとき引数なしで呼び出すアクション
+NO_PARAM_ACTIONS = ['db.backup', 'db.undo', 'db.redo', 'db.consolidate_break', 'db.recalculate_durations', 'db.build_search_index', 'data.unique_subjects', 'log.end_session', 'data.study_time_by_subject', 'data.weekly_study_time']
+
+def parse_fields(params):
+    """params の fields（リストまたはカンマ区切り文字列）を読む。未指定なら None"""
+    fields = params.get("fields")
+    if fields is None or fields == "":
+        return None
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    if not isinstance(fields, list) or not fields:
+        raise ValueError("fieldsはキー名のリストで指定してください。")
+    return [str(f) for f in fields]
+
+def project_records(records, fields):
+    """各レコード（dict）を fields のキーだけに絞る。fields が None ならそのまま返す"""
+    if fields is None:
+        return records
+    return [{key: record[key] for key in fields if key in record} for record in records]
+
+def read_data_version(conn):
+    """events の最新行（id と時刻）から study_log.db の内容のバージョンを作る。
+
+    書き込みはすべてトリガーで events に残るので、最新行が同じなら内容も同じ
+    （undo / restore で戻した場合は、その時点のバージョンに戻る）。events が無ければ None。
+    """
+    try:
+        row = conn.execute("SELECT id, ts FROM events ORDER BY id DESC LIMIT 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    if not row:
+        return "0"
+    return "{}.{}".format(row[0], "".join(ch for ch in str(row[1]) if ch.isdigit()))
+
+def run_versioned(params, compute, scope=None):
+    """読み取り系の結果に ETag を付けて返す。
+
+    ETag は DB のバージョン・params（if_none_match を除く）・scope（今日の日付など
+    DB 以外の依存）から作る。if_none_match が一致すれば compute() を呼ばずに
+    {"not_modified": true, "etag": ...} を返す。etag は dict の結果にだけ付く。
+    """
+    params = params or {}
+    known = params.get("if_none_match")
+    with get_connection() as conn:
+        version = read_data_version(conn)
+    if version is None:
+        return compute()
+    keyed = {key: value for key, value in params.items() if key != "if_none_match"}
+    etag = "{}.{}".format(version, params_hash(keyed)[:8])
+    if scope:
+        etag += "." + scope
+    if known is not None and str(known) == etag:
+        return {"not_modified": True, "etag": etag}
+    result = compute()
+    if isinstance(result, dict) and result.get("status") != "error":
+        result["etag"] = etag
+    return result
+
+def handle_execute(json_string, profile=None):
+    """新しい'execute'コマンドを処理する。
+
+    --profile またはエンベロープの "profile": true のときは、フェーズ別の時間と
+    実行された SQL を結果の "_profile" に付ける。それ以外の実行は action_metrics に記録する。
+    エンベロープの "format" で出力形式（pretty / compact / ndjson）を選べる。
+    """
+    call = runtime.action_call(profile)
+    output_format = 'pretty'
     try:
         data = json.loads(json_string)
         action = data.get("action")
         params = data.get("params", {})
+        output_format = parse_output_format(data.get("format"))
 
         if not action:
             # このエラーはJSONとして返す
             print(json.dumps({"status": "error", "message": "JSONデータに'action'キーが含まれていません。"}, indent=2, ensure_ascii=False))
             sys.exit(1)
 
+        if call.profile is None:
+            profile_top = parse_profile_option(data.get("profile"))
+            if profile_top is not None:
+                call.profile = ActionProfile(profile_top)
+                activate_profile(call.profile)
+
         # アクションハンドラを呼び出す
         action_handler = ACTION_HANDLERS.get(action)
         if action_handler:
+            call.begin(action, params, data.get("deadline_ms"))
             # backup_databaseのような引数なしで呼び出す必要があるアクションを処理
-            if not params and action in ['db.backup', 'db.undo', 'db.redo', 'db.consolidate_break', 'db.recalculate_durations', 'data.unique_subjects', 'log.end_session', 'data.study_time_by_subject', 'data.weekly_study_time']:
-                 result = action_handler()
+            if not params and action in NO_PARAM_ACTIONS:
+                 result = call.run(action_handler)
             else:
-                 result = action_handler(params)
+                 result = call.run(action_handler, params)
 
             if result is not None:
-                if isinstance(result, dict):
+                if isinstance(result, dict) and not result.get("not_modified") \
+                        and action not in READ_ONLY_ACTIONS:
                     result['reminder'] = {
                         "message": "学習セッションが更新されました。以下の点について確認し、必要であれば更新してください。更新すべきか不明瞭な場合はユーザーに確認してください。",
                         "items_to_check": [
@@ -1768,7 +3050,10 @@ def handle_execute(json_string):
                             "目標の状態 (goal.update)"
                         ]
                     }
-                print(json.dumps(result, indent=2, ensure_ascii=False))
+            call.write(result, output_format)
+            if not call.failed and action not in READ_ONLY_ACTIONS and action != 'db.build_search_index':
+                # 書き込みの直後に、作成済みの検索索引へ変更を取り込む（読み取り側で作り直さない）
+                update_search_indexes()
         else:
             # このエラーはJSONとして返す
             print(json.dumps({"status": "error", "message": f"不明なアクション '{action}'"}, indent=2, ensure_ascii=False))
@@ -1779,10 +3064,12 @@ def handle_execute(json_string):
         print(json.dumps({"status": "error", "message": "無効なJSON形式です。"}, indent=2, ensure_ascii=False))
         sys.exit(1)
     except Exception as e:
-        # このエラーはJSONとして返す
-        logger.error(f"ハンドル実行中に予期せぬエラー: {e}", exc_info=True)
-        print(json.dumps({"status": "error", "message": f"処理中にエラーが発生しました: {e}"}, indent=2, ensure_ascii=False))
+        # このエラーはJSONとして返す（制限時間切れは timeout として返る）
+        call.write_error(e, output_format)
         sys.exit(1)
+    finally:
+        # SystemExit などで抜けた場合もエラーとして記録される
+        call.close()
 
 def action_log_create(params):
     """学習ログを作成する (start_sessionのラッパー)"""
@@ -1796,11 +3083,30 @@ def action_log_create(params):
     return {"status": "success", "message": "学習セッションを開始しました。"}
 
 def action_log_get(params):
-    """指定された日付のログを取得する"""
+    """指定された日付のログを取得する。
+
+    fields を指定すると最上位のキー（daily_summary / sessions / all_entries など）を絞る
+    """
     date_str = params.get("date")
     if not date_str:
         raise ValueError("dateは必須です。")
-    return get_logs_json_for_date(date_str)
+    fields = parse_fields(params)
+
+    def compute():
+        result = get_logs_json_for_date(date_str)
+        if fields is not None and isinstance(result, dict):
+            result = {key: result[key] for key in fields if key in result}
+        return result
+
+    return run_versioned(params, compute)
+
+def action_data_search(params):
+    """横断検索（search_data のラッパー）。fields を指定すると items の各要素を絞る"""
+    fields = parse_fields(params)
+    result = search_data(params)
+    if fields is not None and isinstance(result, dict) and 'items' in result:
+        result['items'] = project_records(result['items'], fields)
+    return result
 
 
 def action_log_break(params):
@@ -1828,9 +3134,14 @@ def action_log_end_session():
     return end_session()
 
 def action_data_dashboard(params):
-    """ダッシュボードのデータを取得する"""
+    """ダッシュボードのデータを取得する（ETag 付き。今日の日付が変わっても更新扱い）"""
     days = params.get("days")
-    return get_dashboard_data(days)
+    today = datetime.date.today().strftime('%Y%m%d')
+    return run_versioned(params, lambda: get_dashboard_data(days), scope=today)
+
+def action_data_dashboard_delta(params):
+    """前回の取得以降に変わったダッシュボードの部分だけを取得する"""
+    return get_dashboard_delta(params)
 
 def action_goal_add_to_date(params):
     """指定した日付に目標を追加する"""
@@ -1846,9 +3157,13 @@ def action_data_unique_subjects():
     """ユニークな教科のリストを取得する"""
     return get_all_unique_subjects()
 
-def action_data_study_time_by_subject():
-    """教科ごとの合計学習時間を取得する"""
-    return get_study_time_by_subject()
+def action_data_study_time_by_subject(params=None):
+    """教科ごとの合計学習時間を {"items": [...], "etag": ...} の形で取得する"""
+    return run_versioned(params, lambda: {"items": get_study_time_by_subject()})
+
+def action_data_tags(params):
+    """タグの集計を取得する（ETag 付き）"""
+    return run_versioned(params, lambda: get_all_tags(params.get("prefix"), params.get("limit")))
 
 def action_data_weekly_study_time():
     """過去7日間の日ごとの合計学習時間を取得する"""
@@ -2018,6 +3333,7 @@ ACTION_HANDLERS = {
     "summary.session_update": action_summary_session_update,
     "goal.daily_update": action_goal_daily_update,
     "data.dashboard": action_data_dashboard,
+    "data.dashboard_delta": action_data_dashboard_delta,
     "goal.add_to_date": action_goal_add_to_date,
     "goal.get": action_goal_get,
     "goal.update": action_goal_update,
@@ -2027,9 +3343,12 @@ ACTION_HANDLERS = {
     "data.weekly_study_time": action_data_weekly_study_time,
     "data.this_week_study_time": action_data_this_week_study_time,
     "data.events_since": action_data_events_since,
+    "data.events_stream": action_data_events_stream,
     # new: tags + search
-    "data.tags": lambda params: get_all_tags(params.get("prefix"), params.get("limit")),
-    "data.search": lambda params: search_data(params),
+    "data.tags": action_data_tags,
+    "data.search": action_data_search,
+    "data.search_suggest": lambda params: search_suggest(params),
+    "data.similar": lambda params: find_similar(params),
     "db.restore": action_db_restore,
     "db.reconstruct": action_db_reconstruct,
     "db.backup": backup_now,
@@ -2037,7 +3356,304 @@ ACTION_HANDLERS = {
     "db.redo": redo_last_undo,
     "db.consolidate_break": consolidate_last_break_into_resume,
     "db.recalculate_durations": recalculate_all_durations,
+    "db.build_search_index": action_db_build_search_index,
+    "metrics.summary": get_metrics_summary,
 }
 
+# --- インプロセス API ---
+# 他の Python ツール（日報・エクスポート・テストなど）から CLI を介さずに呼ぶための入口。
+#
+#     from manage_log import StudyLogStore
+#     with StudyLogStore() as store:
+#         store.start_session("数学", "微分の演習")
+#         with store.transaction():
+#             store.update_daily_summary("数学を 2 時間")
+#             store.add_goal("2024-05-01", {"task": "問題集 10 ページ"})
+#         print(store.dashboard())
+#
+# 既存の関数はそのまま使い、get_connection() がストアの接続を返すように差し替える。
+
+class _StoreConnection:
+    """StudyLogStore の接続を既存の関数に貸し出すラッパー。
+
+    ユニットオブワークの外では通常の接続と同じく with を抜けた時点でコミットする。
+    ユニットオブワーク中は with ごとに SAVEPOINT を張り、commit() と BEGIN は
+    外側のトランザクションに合流させる（確定は StudyLogStore.transaction() が行う）。
+    close() は何もしない。
+    """
+
+    __slots__ = ('_conn', '_store', '_savepoints')
+
+    def __init__(self, store):
+        object.__setattr__(self, '_conn', store.conn)
+        object.__setattr__(self, '_store', store)
+        object.__setattr__(self, '_savepoints', [])
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # row_factory などの設定は実体の接続へ（次の貸し出し時に戻す）
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        if self._store.in_transaction:
+            name = self._store._next_savepoint()
+            self._conn.execute(f"SAVEPOINT {name}")
+            self._savepoints.append(name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._savepoints:
+            name = self._savepoints.pop()
+            if exc_type is not None:
+                self._conn.execute(f"ROLLBACK TO {name}")
+            self._conn.execute(f"RELEASE {name}")
+        elif exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        return False
+
+    def execute(self, sql, parameters=()):
+        if self._store.in_transaction and sql.lstrip()[:5].upper() == 'BEGIN':
+            return self._conn.cursor()
+        return self._conn.execute(sql, parameters)
+
+    def commit(self):
+        if not self._store.in_transaction:
+            self._conn.commit()
+
+    def rollback(self):
+        if self._savepoints:
+            self._conn.execute(f"ROLLBACK TO {self._savepoints[-1]}")
+        elif not self._store.in_transaction:
+            self._conn.rollback()
+
+    def close(self):
+        pass
+
+class StudyLogStore:
+    """study_log.db をプロセス内から操作するストア。
+
+    1 本の接続を持ち続け（プリペアドステートメントも STORE_CACHED_STATEMENTS 件まで
+    再利用される）、各メソッドは execute の同名アクションと同じ結果を返す
+    （reminder ブロックは付かない）。例外も CLI と同じく ValueError などがそのまま上がる。
+    同じスレッドからのみ使うこと。
+
+    backup=False または db_path を指定した場合は、書き込み前の undo 用バックアップを取らない。
+    db.restore / db.undo / db.redo などファイルを扱う操作は、既定の DB に対して
+    ユニットオブワークの外でだけ execute() から呼べる。
+    """
+
+    def __init__(self, db_path=None, backup=True):
+        self.db_path = db_path or DB_PATH
+        # バックアップ・復元は DB_PATH のファイルを対象にするので、別の DB では取らない
+        self.backup = backup and self.db_path == DB_PATH
+        self._depth = 0
+        self._savepoint_seq = 0
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.conn = runtime.connect(self.db_path, cached_statements=STORE_CACHED_STATEMENTS)
+        self._run(create_tables)
+        self._run(ensure_study_log_columns)
+        self._run(ensure_event_triggers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    @property
+    def in_transaction(self):
+        return self._depth > 0
+
+    def _next_savepoint(self):
+        self._savepoint_seq += 1
+        return f"store_sp_{self._savepoint_seq}"
+
+    def _checkout(self):
+        """get_connection() の代わりに返す接続。関数ごとの設定の持ち越しを防ぐ"""
+        if self.conn is None:
+            raise sqlite3.ProgrammingError("StudyLogStore は閉じられています。")
+        self.conn.row_factory = None
+        self.conn.text_factory = str
+        return _StoreConnection(self)
+
+    def _run(self, func, *args, **kwargs):
+        """この接続を get_connection() に結び付けて既存の関数を呼ぶ"""
+        previous = getattr(_store_local, 'store', None)
+        _store_local.store = self
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _store_local.store = previous
+
+    @contextlib.contextmanager
+    def transaction(self, immediate=True):
+        """ユニットオブワーク。ブロック内の操作を 1 トランザクションにまとめ、例外時はすべて取り消す。
+
+        undo 用のバックアップはブロックの開始時に 1 回だけ取る（操作ごとのバックアップは省略）。
+        入れ子にした場合は SAVEPOINT になる。
+        """
+        if self._depth:
+            name = self._next_savepoint()
+            self.conn.execute(f"SAVEPOINT {name}")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.conn.execute(f"ROLLBACK TO {name}")
+                self.conn.execute(f"RELEASE {name}")
+                raise
+            else:
+                self.conn.execute(f"RELEASE {name}")
+            finally:
+                self._depth -= 1
+            return
+
+        if self.backup:
+            self._run(backup_database, "Before StudyLogStore transaction")
+        self.conn.commit()
+        self.conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        self._depth = 1
+        try:
+            yield self
+        except BaseException:
+            self.conn.rollback()
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self._depth = 0
+
+    def execute(self, action, params=None):
+        """任意のアクションを ACTION_HANDLERS 経由で実行する（execute コマンドと同じ引数の扱い）"""
+        handler = ACTION_HANDLERS.get(action)
+        if handler is None:
+            raise ValueError(f"不明なアクション '{action}'")
+        if action.startswith('db.') and action not in ('db.consolidate_break', 'db.recalculate_durations',
+                                                       'db.build_search_index'):
+            if self.db_path != DB_PATH:
+                raise ValueError(f"'{action}' は db_path を指定したストアでは実行できません。")
+            if self.in_transaction:
+                raise ValueError(f"'{action}' はユニットオブワークの中では実行できません。")
+        if not params and action in NO_PARAM_ACTIONS:
+            return self._run(handler)
+        return self._run(handler, params or {})
+
+    # --- 学習ログ ---
+    def start_session(self, subject, content, memo=None, impression=None):
+        return self._run(action_log_create, {"subject": subject, "content": content,
+                                             "memo": memo, "impression": impression})
+
+    def break_session(self, break_content=None):
+        return self._run(action_log_break, {"break_content": break_content})
+
+    def resume_session(self, memo=None, impression=None):
+        return self._run(action_log_resume, {"memo": memo, "impression": impression})
+
+    def end_session(self):
+        return self._run(action_log_end_session)
+
+    def active_session(self):
+        return self._run(action_session_active, {})
+
+    def merge_sessions(self, session1_id, session2_id):
+        return self._run(action_session_merge, {"session1_id": session1_id, "session2_id": session2_id})
+
+    def get_logs(self, date, fields=None):
+        return self._run(action_log_get, {"date": date, "fields": fields})
+
+    def get_entry(self, log_id):
+        return self._run(action_log_get_entry, {"id": log_id})
+
+    def update_entry(self, log_id, field, value):
+        return self._run(action_log_update_entry, {"id": log_id, "field": field, "value": value})
+
+    def update_end_time(self, log_id, end_time):
+        return self._run(action_log_update_end_time, {"id": log_id, "end_time": end_time})
+
+    def delete_entry(self, log_id):
+        return self._run(action_log_delete, {"id": log_id})
+
+    # --- サマリー・目標 ---
+    def update_daily_summary(self, text, date=None):
+        return self._run(action_summary_daily_update, {"text": text, "date": date})
+
+    def update_session_summary(self, text, session_id=None):
+        return self._run(action_summary_session_update, {"text": text, "session_id": session_id})
+
+    def update_daily_goal(self, goal_json, date=None):
+        return self._run(action_goal_daily_update, {"goal_json": goal_json, "date": date})
+
+    def add_goal(self, date, goal):
+        return self._run(action_goal_add_to_date, {"date": date, "goal": goal})
+
+    def get_goal(self, goal_id):
+        return self._run(action_goal_get, {"id": goal_id})
+
+    def update_goal(self, goal_id, field, value):
+        return self._run(action_goal_update, {"id": goal_id, "field": field, "value": value})
+
+    def delete_goal(self, goal_id):
+        return self._run(action_goal_delete, {"id": goal_id})
+
+    # --- 集計・検索 ---
+    def dashboard(self, days=None):
+        return self._run(action_data_dashboard, {"days": days})
+
+    def dashboard_delta(self, since=None, days=None, date=None):
+        return self._run(action_data_dashboard_delta, {"since": since, "days": days, "date": date})
+
+    def unique_subjects(self):
+        return self._run(action_data_unique_subjects)
+
+    def study_time_by_subject(self):
+        return self._run(action_data_study_time_by_subject)
+
+    def weekly_study_time(self):
+        return self._run(action_data_weekly_study_time)
+
+    def this_week_study_time(self, week_start='sunday'):
+        return self._run(action_data_this_week_study_time, {"week_start": week_start})
+
+    def tags(self, prefix=None, limit=None):
+        return self._run(get_all_tags, prefix, limit)
+
+    def search(self, q=None, **filters):
+        """data.search と同じ。filters は tags / type / from_ / to / fields など（from は from_ で渡す）"""
+        params = {key.rstrip('_'): value for key, value in filters.items()}
+        if q is not None:
+            params['q'] = q
+        return self._run(action_data_search, params)
+
+    def search_suggest(self, prefix, limit=None):
+        return self._run(search_suggest, {"prefix": prefix, "limit": limit})
+
+    def similar(self, kind, item_id, type='all', limit=None):
+        return self._run(find_similar, {"kind": kind, "id": item_id, "type": type, "limit": limit})
+
+    def events_since(self, since=0, limit=100, full=False, fields=None):
+        return self._run(action_data_events_since, {"since": since, "limit": limit, "full": full, "fields": fields})
+
+    def metrics_summary(self, **params):
+        return self._run(get_metrics_summary, params)
+
+    # --- バックアップ ---
+    def backup(self, description="Manual backup"):
+        if self.db_path != DB_PATH or self.in_transaction:
+            raise ValueError("バックアップはユニットオブワークの外で、既定の DB に対してのみ取れます。")
+        return self._run(backup_database, description)
+
+
 if __name__ == '__main__':
     main()
@@ -1,24 +1,58 @@
 #!/usr/bin/env python3
-"""notify_tool.py - AI-accessible helper to send autonomous notifications."""
+"""notify_tool.py - AI-accessible helper to send autonomous notifications.
+
+Usage:
+    python3 notify_tool.py '<json payload>'          # or the payload on stdin
+    python3 notify_tool.py --batch [--concurrency N] < payloads.ndjson
+    python3 notify_tool.py --queue '<json payload>'  # enqueue to the local outbox and return
+    python3 notify_tool.py --flush                   # deliver queued notifications
+"""
 from __future__ import annotations
 
+import hashlib
+import http.client
 import json
 import os
+import queue
+import sqlite3
 import ssl
+import subprocess
 import sys
-import urllib.error
-import urllib.request
-from typing import Dict, Iterable, Optional, Tuple
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
 
 DEFAULT_USER_ID = "local"
 DEFAULT_ORIGIN = "ai_autonomous"
 DEFAULT_TIMEOUT = 10
+SEND_PATH = "/api/notify/tool/send"
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ENDPOINT_CACHE_PATH = os.getenv("NOTIFY_TOOL_ENDPOINT_CACHE", "").strip() or os.path.join(
+    SCRIPT_DIR, ".notify_tool_endpoint.json"
+)
+ENDPOINT_CACHE_TTL = int(os.getenv("NOTIFY_TOOL_ENDPOINT_TTL", "600").strip() or 600)
+BATCH_CONCURRENCY = int(os.getenv("NOTIFY_TOOL_BATCH_CONCURRENCY", "4").strip() or 4)
+BATCH_MAX_CONCURRENCY = 32
+
+OUTBOX_PATH = os.getenv("NOTIFY_TOOL_OUTBOX", "").strip() or os.path.join(SCRIPT_DIR, "notify_outbox.db")
+OUTBOX_MAX_AGE = int(os.getenv("NOTIFY_TOOL_OUTBOX_MAX_AGE", "86400").strip() or 86400)
+OUTBOX_BACKOFF_BASE = 5
+OUTBOX_BACKOFF_MAX = 900
+OUTBOX_LEASE_SECONDS = 60
+OUTBOX_FLUSH_LIMIT = 100
 
 
 class NotifyToolError(Exception):
     """Custom error for notify tool issues."""
 
 
+class NotifyConnectionError(NotifyToolError):
+    """The endpoint could not be reached (as opposed to the server rejecting the request)."""
+
+
 def iter_candidate_endpoints() -> Iterable[str]:
     env_endpoint = os.getenv("NOTIFY_TOOL_ENDPOINT", "").strip()
     if env_endpoint:
@@ -93,62 +127,552 @@ def validate_payload(payload: Dict[str, object]) -> Tuple[str, Dict[str, object]
     return user_id, notification, context_dict
 
 
+# ---------------------------------------------------------------------------
+# Connections: one SSL context and one keep-alive connection per endpoint
+# (per thread, since http.client connections are not thread-safe)
+# ---------------------------------------------------------------------------
+
+_ssl_context: Optional[ssl.SSLContext] = None
+_connections: Dict[Tuple[str, int], http.client.HTTPConnection] = {}
+_connections_lock = threading.Lock()
+
+
+def get_ssl_context() -> ssl.SSLContext:
+    global _ssl_context
+    if _ssl_context is None:
+        # Accept self-signed certificates when using HTTPS on localhost.
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        _ssl_context = context
+    return _ssl_context
+
+
+def open_connection(endpoint: str, timeout: float = DEFAULT_TIMEOUT) -> http.client.HTTPConnection:
+    parts = urllib.parse.urlsplit(endpoint)
+    if parts.scheme == "https":
+        conn: http.client.HTTPConnection = http.client.HTTPSConnection(
+            parts.hostname, parts.port or 443, timeout=timeout, context=get_ssl_context()
+        )
+    elif parts.scheme == "http":
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+    else:
+        raise NotifyToolError(f"unsupported endpoint scheme: {endpoint}")
+    conn.connect()
+    return conn
+
+
+def connection_key(endpoint: str) -> Tuple[str, int]:
+    return endpoint, threading.get_ident()
+
+
+def has_connection(endpoint: str) -> bool:
+    return connection_key(endpoint) in _connections
+
+
+def keep_connection(endpoint: str, conn: http.client.HTTPConnection) -> None:
+    with _connections_lock:
+        _connections[connection_key(endpoint)] = conn
+
+
+def get_connection(endpoint: str) -> http.client.HTTPConnection:
+    conn = _connections.get(connection_key(endpoint))
+    if conn is None:
+        conn = open_connection(endpoint)
+        keep_connection(endpoint, conn)
+    return conn
+
+
+def drop_connection(endpoint: str) -> None:
+    with _connections_lock:
+        conn = _connections.pop(connection_key(endpoint), None)
+    if conn is not None:
+        conn.close()
+
+
+def close_connections() -> None:
+    with _connections_lock:
+        conns = list(_connections.values())
+        _connections.clear()
+    for conn in conns:
+        conn.close()
+
+
+def decode_response(status: int, raw: bytes) -> Dict[str, object]:
+    text = raw.decode("utf-8", errors="replace")
+    if status >= 400:
+        raise NotifyToolError(f"server error {status}: {text}")
+    try:
+        return json.loads(text) if text else {"ok": True}
+    except json.JSONDecodeError:
+        return {"ok": True, "raw": text}
+
+
 def post_json(url: str, data: Dict[str, object]) -> Dict[str, object]:
     body = json.dumps(data).encode("utf-8")
-    request = urllib.request.Request(
-        url=url + "/api/notify/tool/send",
-        data=body,
-        headers={"Content-Type": "application/json"},
-        method="POST",
+    headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+    # A kept-alive connection may have been closed by the server; retry once on a fresh one.
+    for attempt in range(2):
+        try:
+            conn = get_connection(url)
+            conn.request("POST", SEND_PATH, body=body, headers=headers)
+            response = conn.getresponse()
+            raw = response.read()
+            if response.will_close:
+                drop_connection(url)
+            return decode_response(response.status, raw)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as exc:
+            drop_connection(url)
+            if attempt:
+                raise NotifyConnectionError(f"connection error: {exc}") from exc
+        except (OSError, http.client.HTTPException) as exc:
+            drop_connection(url)
+            raise NotifyConnectionError(f"connection error: {exc}") from exc
+    raise NotifyConnectionError("connection error")
+
+
+# ---------------------------------------------------------------------------
+# Endpoint discovery
+# ---------------------------------------------------------------------------
+
+
+def probe_endpoint(endpoint: str, timeout: float = DEFAULT_TIMEOUT) -> http.client.HTTPConnection:
+    """Open a connection and check the endpoint speaks HTTP(S); any response status counts."""
+    conn = open_connection(endpoint, timeout)
+    try:
+        conn.request("HEAD", SEND_PATH, headers={"Connection": "keep-alive"})
+        response = conn.getresponse()
+        response.read()
+    except Exception:
+        conn.close()
+        raise
+    if response.will_close:
+        conn.close()
+        conn = open_connection(endpoint, timeout)
+    return conn
+
+
+def discover_endpoint(candidates: List[str]) -> str:
+    """Probe all candidates concurrently and return the first that answers.
+
+    The winner's connection is kept for reuse. Probe threads are daemons, so a
+    candidate that hangs until the timeout never delays the caller or exit.
+    """
+    results: "queue.Queue[Tuple[str, Optional[http.client.HTTPConnection], Optional[Exception]]]" = queue.Queue()
+    decided = threading.Event()
+
+    def worker(endpoint: str) -> None:
+        try:
+            conn = probe_endpoint(endpoint)
+        except Exception as exc:  # pylint: disable=broad-except
+            results.put((endpoint, None, exc))
+            return
+        if decided.is_set():
+            conn.close()
+        results.put((endpoint, conn, None))
+
+    for endpoint in candidates:
+        threading.Thread(target=worker, args=(endpoint,), daemon=True).start()
+
+    errors: List[str] = []
+    for _ in candidates:
+        endpoint, conn, error = results.get()
+        if conn is not None:
+            decided.set()
+            keep_connection(endpoint, conn)
+            return endpoint
+        errors.append(f"{endpoint}: {error}")
+    raise NotifyConnectionError("connection error: " + "; ".join(errors))
+
+
+def load_cached_endpoint(candidates: List[str]) -> Optional[str]:
+    try:
+        with open(ENDPOINT_CACHE_PATH, "r", encoding="utf-8") as fh:
+            cached = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict):
+        return None
+    endpoint = cached.get("endpoint")
+    if endpoint not in candidates or float(cached.get("expires_at") or 0) < time.time():
+        return None
+    return endpoint
+
+
+def store_cached_endpoint(endpoint: str) -> None:
+    tmp_path = f"{ENDPOINT_CACHE_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump({"endpoint": endpoint, "expires_at": time.time() + ENDPOINT_CACHE_TTL}, fh)
+        os.replace(tmp_path, ENDPOINT_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def clear_cached_endpoint() -> None:
+    try:
+        os.remove(ENDPOINT_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def resolve_endpoint(refresh: bool = False) -> str:
+    candidates = list(iter_candidate_endpoints())
+    if not candidates:
+        raise NotifyToolError("no notify endpoints configured")
+    if len(candidates) == 1:
+        return candidates[0]
+    if not refresh:
+        cached = load_cached_endpoint(candidates)
+        if cached:
+            return cached
+    endpoint = discover_endpoint(candidates)
+    store_cached_endpoint(endpoint)
+    return endpoint
+
+
+def send_request(request_body: Dict[str, object], endpoint: Optional[str] = None) -> Dict[str, object]:
+    """POST to the resolved endpoint, re-discovering once if a cached endpoint went away."""
+    endpoint = endpoint or resolve_endpoint()
+    try:
+        response = post_json(endpoint, request_body)
+    except NotifyConnectionError:
+        clear_cached_endpoint()
+        fresh = resolve_endpoint(refresh=True)
+        if fresh == endpoint and not has_connection(fresh):
+            raise
+        endpoint = fresh
+        response = post_json(endpoint, request_body)
+    response.setdefault("ok", True)
+    response.setdefault("endpoint", endpoint)
+    return response
+
+
+def build_request_body(payload: Dict[str, object]) -> Dict[str, object]:
+    user_id, notification, context = validate_payload(payload)
+    return {
+        "userId": user_id,
+        "origin": payload.get("origin") or DEFAULT_ORIGIN,
+        "notification": notification,
+        "context": context,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Batch mode: NDJSON payloads on stdin, one result line per input line
+# ---------------------------------------------------------------------------
+
+
+def iter_batch_lines(stream: TextIO) -> Iterator[Tuple[int, str]]:
+    for line_no, line in enumerate(stream, start=1):
+        if line.strip():
+            yield line_no, line
+
+
+def send_batch_line(item: Tuple[int, str], endpoint: Optional[str]) -> Dict[str, object]:
+    line_no, line = item
+    try:
+        try:
+            payload = json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise NotifyToolError(f"invalid JSON payload: {exc}") from exc
+        if not isinstance(payload, dict):
+            raise NotifyToolError("payload must be a JSON object")
+        request_body = build_request_body(payload)
+        if endpoint is None:
+            raise NotifyToolError("no reachable notify endpoint")
+        result = send_request(request_body, endpoint)
+    except NotifyToolError as exc:
+        result = {"ok": False, "error": str(exc)}
+    except Exception as exc:  # pylint: disable=broad-except
+        result = {"ok": False, "error": f"unexpected error: {exc}"}
+    result["line"] = line_no
+    return result
+
+
+def run_batch(stream: TextIO, out: TextIO, concurrency: int = BATCH_CONCURRENCY) -> int:
+    """Send NDJSON payloads with bounded concurrency; results are written in input order.
+
+    Each worker thread keeps its own keep-alive connection, so N payloads cost
+    one endpoint discovery and at most ``concurrency`` TCP/TLS handshakes.
+    """
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    try:
+        endpoint: Optional[str] = resolve_endpoint()
+    except NotifyToolError:
+        endpoint = None
+    failures = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for result in pool.map(lambda item: send_batch_line(item, endpoint), iter_batch_lines(stream)):
+            if not result.get("ok", True):
+                failures += 1
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+    return 1 if failures else 0
+
+
+def parse_batch_args(args: List[str]) -> int:
+    concurrency = BATCH_CONCURRENCY
+    for idx, arg in enumerate(args):
+        value: Optional[str] = None
+        if arg.startswith("--concurrency="):
+            value = arg.split("=", 1)[1]
+        elif arg == "--concurrency" and idx + 1 < len(args):
+            value = args[idx + 1]
+        if value is not None:
+            if not value.isdigit():
+                raise NotifyToolError("--concurrency must be a positive integer")
+            concurrency = int(value)
+    return concurrency
+
+
+# ---------------------------------------------------------------------------
+# Outbox: durable fire-and-forget delivery
+# ---------------------------------------------------------------------------
+#
+# --queue stores the validated request in a local SQLite outbox and returns at
+# once; a detached "--flush" process (and every later invocation) delivers due
+# items. Failures back off exponentially, 4xx rejections are final, items older
+# than OUTBOX_MAX_AGE expire, and a dedup key keeps retries of the same
+# notification from being queued or sent twice.
+
+
+def open_outbox() -> sqlite3.Connection:
+    conn = sqlite3.connect(OUTBOX_PATH, timeout=5, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dedup_key TEXT NOT NULL UNIQUE,
+            body_json TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            sent_at REAL
+        )
+        """
     )
-    # Accept self-signed certificates when using HTTPS on localhost.
-    context = ssl.create_default_context()
-    context.check_hostname = False
-    context.verify_mode = ssl.CERT_NONE
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)")
+    return conn
+
+
+def outbox_dedup_key(payload: Dict[str, object], request_body: Dict[str, object]) -> Tuple[str, bool]:
+    """Return (key, explicit). Without an explicit dedupKey the request content is hashed."""
+    explicit = payload.get("dedupKey") or payload.get("dedup_key")
+    if explicit:
+        return str(explicit), True
+    canonical = json.dumps(request_body, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest(), False
+
+
+def enqueue_notification(payload: Dict[str, object]) -> Dict[str, object]:
+    request_body = build_request_body(payload)
+    dedup_key, explicit = outbox_dedup_key(payload, request_body)
+    now = time.time()
+    conn = open_outbox()
+    try:
+        if not explicit:
+            # Content hashes only collapse copies still waiting in the outbox; the same
+            # text sent again later is a new notification. Explicit keys stay unique
+            # for the whole retention window.
+            conn.execute("DELETE FROM outbox WHERE dedup_key = ? AND status != 'pending'", (dedup_key,))
+        cur = conn.execute(
+            """
+            INSERT OR IGNORE INTO outbox (dedup_key, body_json, created_at, next_attempt_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (dedup_key, json.dumps(request_body, ensure_ascii=False), now, now),
+        )
+        if cur.rowcount:
+            return {"ok": True, "queued": True, "id": cur.lastrowid, "dedupKey": dedup_key}
+        row = conn.execute("SELECT id, status FROM outbox WHERE dedup_key = ?", (dedup_key,)).fetchone()
+        return {"ok": True, "queued": False, "duplicate": True, "id": row["id"],
+                "status": row["status"], "dedupKey": dedup_key}
+    finally:
+        conn.close()
+
+
+def outbox_backoff(attempts: int) -> float:
+    return min(OUTBOX_BACKOFF_BASE * (2 ** max(attempts - 1, 0)), OUTBOX_BACKOFF_MAX)
+
+
+def claim_outbox_items(conn: sqlite3.Connection, now: float, limit: int) -> List[sqlite3.Row]:
+    """Expire stale rows and lease due ones so concurrent flushers never send the same item."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE outbox SET status = 'expired' WHERE status = 'pending' AND created_at < ?",
+            (now - OUTBOX_MAX_AGE,),
+        )
+        # Finished rows are kept for one max-age window so late duplicates stay deduplicated.
+        conn.execute("DELETE FROM outbox WHERE status != 'pending' AND created_at < ?", (now - 2 * OUTBOX_MAX_AGE,))
+        rows = conn.execute(
+            """
+            SELECT * FROM outbox
+             WHERE status = 'pending' AND next_attempt_at <= ?
+             ORDER BY next_attempt_at, id
+             LIMIT ?
+            """,
+            (now, limit),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE outbox SET next_attempt_at = ? WHERE id = ?",
+            [(now + OUTBOX_LEASE_SECONDS, row["id"]) for row in rows],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def flush_outbox(limit: int = OUTBOX_FLUSH_LIMIT) -> Dict[str, object]:
+    summary = {"ok": True, "sent": 0, "retrying": 0, "failed": 0, "expired": 0, "pending": 0}
+    if not os.path.exists(OUTBOX_PATH):
+        return summary
+    conn = open_outbox()
+    try:
+        now = time.time()
+        before = conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'expired'").fetchone()[0]
+        rows = claim_outbox_items(conn, now, limit)
+        summary["expired"] = conn.execute(
+            "SELECT COUNT(*) FROM outbox WHERE status = 'expired'"
+        ).fetchone()[0] - before
+
+        endpoint: Optional[str] = None
+        unreachable: Optional[str] = None
+        for row in rows:
+            error: Optional[str] = None
+            final = False
+            if unreachable is None:
+                try:
+                    endpoint = endpoint or resolve_endpoint()
+                    send_request(json.loads(row["body_json"]), endpoint)
+                except NotifyConnectionError as exc:
+                    # The server is down: back off the rest without waiting on each item.
+                    unreachable = error = str(exc)
+                except NotifyToolError as exc:
+                    error = str(exc)
+                    final = error.startswith("server error 4") and not error.startswith(("server error 408", "server error 429"))
+            else:
+                error = unreachable
+
+            if error is None:
+                conn.execute(
+                    "UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1, last_error = NULL WHERE id = ?",
+                    (time.time(), row["id"]),
+                )
+                summary["sent"] += 1
+            elif final:
+                conn.execute(
+                    "UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                    (error, row["id"]),
+                )
+                summary["failed"] += 1
+            else:
+                attempts = row["attempts"] + 1
+                conn.execute(
+                    "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (attempts, time.time() + outbox_backoff(attempts), error, row["id"]),
+                )
+                summary["retrying"] += 1
+        summary["pending"] = conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+    finally:
+        conn.close()
+    return summary
+
+
+def outbox_has_due_items() -> bool:
+    if not os.path.exists(OUTBOX_PATH):
+        return False
+    conn = open_outbox()
     try:
-        with urllib.request.urlopen(request, timeout=DEFAULT_TIMEOUT, context=context) as response:
-            resp_body = response.read().decode("utf-8")
-            try:
-                return json.loads(resp_body) if resp_body else {"ok": True}
-            except json.JSONDecodeError:
-                return {"ok": True, "raw": resp_body}
-    except urllib.error.HTTPError as exc:
-        text = exc.read().decode("utf-8", errors="replace")
-        raise NotifyToolError(f"server error {exc.code}: {text}") from exc
-    except urllib.error.URLError as exc:
-        raise NotifyToolError(f"connection error: {exc.reason}") from exc
+        row = conn.execute(
+            "SELECT 1 FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? LIMIT 1",
+            (time.time(),),
+        ).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def spawn_background_flush() -> None:
+    """Start a detached ``--flush`` run; the queueing caller does not wait for delivery."""
+    if os.getenv("NOTIFY_TOOL_OUTBOX_SPAWN", "1").strip() == "0":
+        return
+    try:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--flush"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            close_fds=True,
+        )
+    except OSError:
+        pass
 
 
 def main(argv: Iterable[str]) -> int:
+    arg_list = list(argv)
+    if len(arg_list) > 1 and arg_list[1] == "--flush":
+        try:
+            print(json.dumps(flush_outbox(), ensure_ascii=False))
+            return 0
+        except Exception as exc:  # pylint: disable=broad-except
+            print(json.dumps({"ok": False, "error": f"flush failed: {exc}"}), file=sys.stdout)
+            return 1
+        finally:
+            close_connections()
+    if len(arg_list) > 1 and arg_list[1] == "--queue":
+        try:
+            result = enqueue_notification(load_payload(arg_list[:1] + arg_list[2:]))
+            print(json.dumps(result, ensure_ascii=False))
+            sys.stdout.flush()
+            if result.get("queued"):
+                spawn_background_flush()
+            return 0
+        except NotifyToolError as exc:
+            print(json.dumps({"ok": False, "error": str(exc)}), file=sys.stdout)
+            return 1
+        except (sqlite3.Error, OSError) as exc:
+            print(json.dumps({"ok": False, "error": f"outbox error: {exc}"}), file=sys.stdout)
+            return 1
+    if len(arg_list) > 1 and arg_list[1] == "--batch":
+        try:
+            return run_batch(sys.stdin, sys.stdout, parse_batch_args(arg_list[2:]))
+        except NotifyToolError as exc:
+            print(json.dumps({"ok": False, "error": str(exc)}), file=sys.stdout)
+            return 1
+        finally:
+            close_connections()
     try:
-        payload = load_payload(argv)
-        user_id, notification, context = validate_payload(payload)
-        request_body = {
-            "userId": user_id,
-            "origin": payload.get("origin") or DEFAULT_ORIGIN,
-            "notification": notification,
-            "context": context,
-        }
-        last_error: Optional[Exception] = None
-        for endpoint in iter_candidate_endpoints():
-            try:
-                response = post_json(endpoint, request_body)
-                response.setdefault("ok", True)
-                response.setdefault("endpoint", endpoint)
-                print(json.dumps(response, ensure_ascii=False))
-                return 0
-            except Exception as exc:  # pylint: disable=broad-except
-                last_error = exc
-                continue
-        if last_error:
-            raise last_error
-        raise NotifyToolError("no notify endpoints configured")
+        payload = load_payload(arg_list)
+        request_body = build_request_body(payload)
+        response = send_request(request_body)
+        print(json.dumps(response, ensure_ascii=False))
+        sys.stdout.flush()
+        # The server answered, so this is a good moment to deliver anything left
+        # queued. Do it in a detached process: callers wait for this one to exit,
+        # and an outbox problem must not turn a delivered notification into an error.
+        try:
+            if outbox_has_due_items():
+                spawn_background_flush()
+        except (sqlite3.Error, OSError):
+            pass
+        return 0
     except NotifyToolError as exc:
         print(json.dumps({"ok": False, "error": str(exc)}), file=sys.stdout)
         return 1
     except Exception as exc:  # Unexpected
         print(json.dumps({"ok": False, "error": f"unexpected error: {exc}"}), file=sys.stdout)
         return 1
+    finally:
+        close_connections()
 
 
 if __name__ == "__main__":
@@ -34,8 +34,10 @@ export async function GET() {
       );
     }
 
+    // manage_log.py returns {"items": [...], "etag": ...}; the chart only needs the rows
     const data = JSON.parse(stdout);
-    return NextResponse.json(data);
+    const items = Array.isArray(data) ? data : Array.isArray(data?.items) ? data.items : [];
+    return NextResponse.json(items);
   } catch (error) {
     console.error(`error: ${error}`);
     return NextResponse.json(
@@ -15,7 +15,7 @@ export function SubjectStudyTimeChart() {
     fetch("/api/analytics/study-time-by-subject")
       .then((res) => res.json())
       .then((data) => {
-        setChartData(data)
+        setChartData(Array.isArray(data) ? data : [])
         setIsLoading(false)
       })
       .catch((error) => {
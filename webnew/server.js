@@ -5059,7 +5059,7 @@ function initializeDbWatchers(wss) {
     async function fetchAndBroadcastEvents() {
       try {
         const pythonPath = path.join(__dirname, '..', 'manage_log.py');
-        const payload = { action: 'data.events_since', params: { since: lastEventId, limit: 100 } };
+        const payload = { action: 'data.events_since', params: { since: lastEventId, limit: 100, full: true } };
         const proc = spawnAsTargetUser('python3', [pythonPath, '--api-mode', 'execute', JSON.stringify(payload)], { cwd: PROJECT_ROOT });
         let out = '';
         proc.stdout.on('data', (c) => { out += String(c); });